@@ -7,6 +7,27 @@
  * Description:
  *    Drives the PE44280 8-bit phase shifter using serial input from a GUI.
  *    Uses hardware SPI for speed with 16-bit transfers to handle 13-bit control words.
+ *
+ *    Serial frames (host side in GUI/mcu_protocol.py):
+ *      0xA5 | LEN | SEQ | CMD | payload | CRC-8 (poly 0x07 over LEN..payload)
+ *    CMD bit 7 requests an ACK after execution: 0x5A | SEQ | STATUS | CRC-8.
+ *    Bad frames are NAKed and the bytes after their start byte rescanned.
+ *    Commands, little endian fields:
+ *      0x01 + 16 phase words                   latch one phase state
+ *      0x02 + start(u16) + count(u16) + rows   store count x 16 words in the table
+ *      0x03 + k(u16)                           latch table state k
+ *      0x04                                    latch the next table state, wrapping inside
+ *                                              the active range
+ *      0x05 + enable(u8)                       advance on each rising edge of TRIGGER_PIN
+ *      0x06 + baud(u32)                        switch baud rate after the ACK, falls back to
+ *                                              BOOT_BAUD if no valid frame arrives within 1 s,
+ *                                              rejected if the clock is more than 1% off it
+ *      0x07                                    ping
+ *      0x08 + base crc(u8) + (addr, word) pairs shift only the listed elements, rejected
+ *                                              unless base crc matches crc8(phases)
+ *      0x09 + start(u16) + count(u16)          active range for 0x04 and the trigger,
+ *                                              count 0 selects the whole table
+ *    Negative statuses are sent even without the ACK flag.
  */
 
 #include <SPI.h>
@@ -15,10 +36,52 @@
 // #define SI_PIN   51  // MOSI
 // #define CLK_PIN  52  // SCK
 #define LE_PIN   10  // LATCH
+#define TRIGGER_PIN 2 // external scan trigger (INT4)
 #define NUM_ELEMENTS 16
+#define TABLE_CAPACITY 256
+
+// ----Commands----
+#define CMD_SET_PHASES 0x01
+#define CMD_UPLOAD     0x02
+#define CMD_SELECT     0x03
+#define CMD_NEXT       0x04
+#define CMD_TRIGGER    0x05
+#define CMD_SET_BAUD   0x06
+#define CMD_PING       0x07
+#define CMD_SET_DELTA  0x08
+#define CMD_RANGE      0x09
+
+// ----Framing----
+#define START      0xA5
+#define ACK_START  0x5A
+#define FLAG_ACK   0x80
+#define FRAME_MAX  (255 + 4)
+#define ACK_OK     0
+#define ACK_CRC    1
+#define ACK_BAD    2
+
+#define BOOT_BAUD  115200
+#define BAUD_PROBATION_MS 1000
+#define MAX_BAUD_ERROR_PCT 1
 
 // -----Variables----
-uint8_t phases[NUM_ELEMENTS];
+uint8_t phases[NUM_ELEMENTS];  // words latched last
+// phase table for hardware timed scans (4 kB)
+uint8_t table[TABLE_CAPACITY][NUM_ELEMENTS];
+uint16_t table_len = 0;   // rows written so far
+uint16_t current = 0;     // row latched last
+uint16_t range_start = 0; // rows CMD_NEXT steps through, set per scan by CMD_RANGE
+uint16_t range_len = 0;   // 0: the whole table
+volatile uint8_t triggers = 0; // pending trigger edges
+// frame being received
+uint8_t buf[FRAME_MAX];
+uint16_t buf_len = 0;
+int16_t last_seq = -1;    // last executed sequence number (retransmissions are not re-executed)
+uint8_t last_status = ACK_OK;
+// baud negotiation
+uint32_t pending_baud = 0;     // applied once the ACK has been sent
+bool on_probation = false;     // new rate not yet confirmed by a valid frame
+uint32_t probation_start = 0;
 // Direct port pointers for LE (still bit-banging LE for speed)
 volatile uint8_t *le_port;
 uint8_t le_bit;
@@ -26,10 +89,11 @@ uint8_t le_bit;
 
 // -------------Setup----------------------
 void setup() {
-  Serial.begin(115200);
+  Serial.begin(BOOT_BAUD);
   while(!Serial);
   pinMode(LE_PIN, OUTPUT);
   digitalWrite(LE_PIN, LOW);
+  pinMode(TRIGGER_PIN, INPUT);
 
   // Direct port for LE
   le_port = portOutputRegister(digitalPinToPort(LE_PIN));
@@ -41,34 +105,230 @@ void setup() {
 
 }
 
-// -------------Main Loop------------------
-void loop() {
-  // Wait until we have NUM_ELEMENTS bytes from Serial
-  if (Serial.available() >= NUM_ELEMENTS) {
-    //get phases
-    for (uint8_t i = 0; i < NUM_ELEMENTS; i++){
-      phases[i] = Serial.read();
+// -------------Helpers--------------------
+uint8_t crc8(const uint8_t *data, uint16_t n) {
+  uint8_t crc = 0;
+  while (n--) {
+    crc ^= *data++;
+    for (uint8_t b = 0; b < 8; b++) {
+      crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : crc << 1;
     }
+  }
+  return crc;
+}
 
-    //send phases to shifters in control word format
-    //disable interupts for the spi burst
-    noInterrupts();
-    for (uint8_t i = 0; i < NUM_ELEMENTS; i++) {
-      uint8_t phase = phases[i];
-      uint8_t addr = i;
-      //the middle is syhcronize to the ninety degree bit
-      uint16_t control_word = ((addr << 9) | ((phase & 0x40) << 2) | phase) << 3;
-      //note the right shift puts the control word closest to the latch
-      //MSB FIRST IS FASTER so reverse it
-      SPI.transfer16(control_word);
-      //pulse latch
-      //no delay needed the time it takes per clock cycle is enough.
-      *le_port |= le_bit;  // LE high
-      //asm volatile ("nop\n\t"); // tiny delay to meet tLE timing
-      *le_port &= ~le_bit; // LE low
+void send_ack(uint8_t seq, uint8_t status) {
+  uint8_t ack[4] = {ACK_START, seq, status, 0};
+  ack[3] = crc8(ack + 1, 2);
+  Serial.write(ack, 4);
+}
+
+uint16_t get_u16(const uint8_t *p) {
+  return p[0] | ((uint16_t)p[1] << 8);
+}
+
+void drop(uint16_t n) {
+  // remove n bytes from the front of the frame buffer
+  memmove(buf, buf + n, buf_len - n);
+  buf_len -= n;
+}
+
+bool baud_exact(uint32_t baud) {
+#if defined(__AVR__)
+  //same divisor as HardwareSerial::begin in double speed mode
+  //921600 comes out at 1000000 on 16 MHz (8.5% off), 500000 and 1000000 are exact
+  if (baud == 0 || F_CPU / 4 / baud < 1) return false;
+  uint32_t ubrr = (F_CPU / 4 / baud - 1) / 2;
+  uint32_t actual = F_CPU / (8 * (ubrr + 1));
+  uint32_t error = actual > baud ? actual - baud : baud - actual;
+  return error * 100 <= baud * MAX_BAUD_ERROR_PCT;
+#else
+  //the divisor above is the AVR USART's, other cores stay at BOOT_BAUD
+  return false;
+#endif
+}
+
+void set_baud(uint32_t baud) {
+  Serial.flush();  // let the ACK leave at the old rate
+  Serial.end();
+  Serial.begin(baud);
+  buf_len = 0;
+}
+
+void on_trigger() {
+  triggers++;
+}
+
+void shift_word(uint8_t addr, uint8_t phase) {
+  //send one phase to its shifter in control word format
+  //the middle is syhcronize to the ninety degree bit
+  uint16_t control_word = ((addr << 9) | ((phase & 0x40) << 2) | phase) << 3;
+  //note the right shift puts the control word closest to the latch
+  //MSB FIRST IS FASTER so reverse it
+  SPI.transfer16(control_word);
+  //pulse latch
+  //no delay needed the time it takes per clock cycle is enough.
+  *le_port |= le_bit;  // LE high
+  //asm volatile ("nop\n\t"); // tiny delay to meet tLE timing
+  *le_port &= ~le_bit; // LE low
+}
+
+void latch(const uint8_t *p) {
+  //disable interupts for the spi burst
+  noInterrupts();
+  for (uint8_t i = 0; i < NUM_ELEMENTS; i++) {
+    shift_word(i, p[i]);
+  }
+  //reenable interupts after spi burst:
+  interrupts();
+  if (p != phases) memcpy(phases, p, NUM_ELEMENTS);
+}
+
+uint8_t latch_delta(const uint8_t *p, uint8_t n) {
+  //p: base crc then n (addr, word) pairs
+  if (p[0] != crc8(phases, NUM_ELEMENTS)) return ACK_BAD; // built on a state we do not hold
+  for (uint8_t i = 0; i < n; i++) {
+    if (p[1 + 2 * i] >= NUM_ELEMENTS) return ACK_BAD;
+  }
+  noInterrupts();
+  for (uint8_t i = 0; i < n; i++) {
+    uint8_t addr = p[1 + 2 * i];
+    phases[addr] = p[2 + 2 * i];
+    shift_word(addr, phases[addr]);
+  }
+  interrupts();
+  return ACK_OK;
+}
+
+void latch_next() {
+  //wrap inside the active range, not at the end of everything uploaded
+  uint16_t first = range_len ? range_start : 0;
+  uint16_t n = range_len ? range_len : table_len;
+  if (n == 0) return;
+  current = (current >= first && current + 1 < first + n) ? current + 1 : first;
+  latch(table[current]);
+}
+
+// execute one command, returns the ACK status
+uint8_t execute(uint8_t cmd, const uint8_t *p, uint8_t n) {
+  switch (cmd) {
+    case CMD_SET_PHASES:
+      if (n != NUM_ELEMENTS) return ACK_BAD;
+      //get phases
+      memcpy(phases, p, NUM_ELEMENTS);
+      latch(phases);
+      return ACK_OK;
+    case CMD_UPLOAD: {
+      if (n < 4) return ACK_BAD;
+      uint16_t start = get_u16(p);
+      uint16_t count = get_u16(p + 2);
+      if (n != 4 + count * NUM_ELEMENTS || start + count > TABLE_CAPACITY) return ACK_BAD;
+      memcpy(table[start], p + 4, count * NUM_ELEMENTS);
+      if (start + count > table_len) table_len = start + count;
+      return ACK_OK;
+    }
+    case CMD_SELECT: {
+      if (n != 2) return ACK_BAD;
+      uint16_t k = get_u16(p);
+      if (k >= table_len) return ACK_BAD;
+      current = k;
+      latch(table[current]);
+      return ACK_OK;
+    }
+    case CMD_NEXT:
+      if (table_len == 0) return ACK_BAD;
+      latch_next();
+      return ACK_OK;
+    case CMD_TRIGGER:
+      if (n != 1) return ACK_BAD;
+      if (p[0]) {
+        triggers = 0;
+        attachInterrupt(digitalPinToInterrupt(TRIGGER_PIN), on_trigger, RISING);
+      } else {
+        detachInterrupt(digitalPinToInterrupt(TRIGGER_PIN));
+      }
+      return ACK_OK;
+    case CMD_SET_BAUD: {
+      if (n != 4) return ACK_BAD;
+      uint32_t baud = get_u16(p) | ((uint32_t)get_u16(p + 2) << 16);
+      if (!baud_exact(baud)) return ACK_BAD;
+      pending_baud = baud;
+      return ACK_OK;
+    }
+    case CMD_PING:
+      return ACK_OK;
+    case CMD_RANGE: {
+      if (n != 4) return ACK_BAD;
+      uint16_t start = get_u16(p);
+      uint16_t count = get_u16(p + 2);
+      if (start + count > table_len) return ACK_BAD;
+      range_start = start;
+      range_len = count;
+      return ACK_OK;
+    }
+    case CMD_SET_DELTA:
+      if (n < 1 || (n - 1) % 2) return ACK_BAD;
+      return latch_delta(p, (n - 1) / 2);
+    default:
+      return ACK_BAD;
+  }
+}
+
+// parse as many complete frames as the buffer holds
+void parse_frames() {
+  while (buf_len) {
+    if (buf[0] != START) { drop(1); continue; }
+    if (buf_len < 2) return;
+    uint8_t len = buf[1];
+    if (len == 0) { drop(1); continue; }
+    uint16_t total = len + 4;
+    if (buf_len < total) return;
+    uint8_t seq = buf[2];
+    if (crc8(buf + 1, len + 2) != buf[total - 1]) {
+      send_ack(seq, ACK_CRC);
+      // not a valid frame, resync on the bytes after this start byte
+      drop(1);
+      continue;
     }
-    //reenable interupts after spi burst:
+    uint8_t cmd = buf[3];
+    on_probation = false;  // the current baud rate works
+    if (seq != last_seq) {
+      last_status = execute(cmd & ~FLAG_ACK, buf + 4, len - 1);
+      last_seq = seq;
+    }
+    // a retransmission of the last frame is only acknowledged again,
+    // failures are always reported so the host can resend a full state
+    if ((cmd & FLAG_ACK) || last_status != ACK_OK) send_ack(seq, last_status);
+    drop(total);
+    if (pending_baud) {
+      set_baud(pending_baud);
+      pending_baud = 0;
+      on_probation = true;
+      probation_start = millis();
+      return;
+    }
+  }
+}
+
+// -------------Main Loop------------------
+void loop() {
+  // hardware trigger steps through the table
+  while (triggers) {
+    noInterrupts();
+    triggers--;
     interrupts();
-  
+    latch_next();
+  }
+
+  // nobody talks to us at the new rate, go back to the boot rate
+  if (on_probation && millis() - probation_start > BAUD_PROBATION_MS) {
+    set_baud(BOOT_BAUD);
+    on_probation = false;
+  }
+
+  // collect bytes into the frame buffer
+  while (Serial.available() && buf_len < FRAME_MAX) {
+    buf[buf_len++] = Serial.read();
   }
+  parse_frames();
 }
@@ -15,14 +15,18 @@ Dependencies:
 #add libraries
 
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib import cm
-from matplotlib.colors import ListedColormap
-from PIL import Image
 import io
 import os
+import threading
+from lazy_imports import lazy_import
 #config file contains some useful constants that we'll make use of 
 from config import *
+#plotting libraries are only imported when a figure is drawn
+plt = lazy_import('matplotlib.pyplot')
+cm = lazy_import('matplotlib.cm')
+mcolors = lazy_import('matplotlib.colors')
+Image = lazy_import('PIL.Image')
+GifImagePlugin = lazy_import('PIL.GifImagePlugin')
 DEFAULT_RX_GRID = None
 def find_betas(theta_0: float, phi_0: float, dx: float, dy: float)->tuple:
     '''
@@ -70,6 +74,191 @@ def get_phase_shifts(beta_x: float, beta_y: float)->np.ndarray:
     return phases.flatten()
 
 
+def element_array_factor(phases_deg: np.ndarray, dx: float, dy: float, theta, phi) -> np.ndarray:
+    '''
+    Complex array factor for arbitrary per-element phases (not only progressive shifts)
+    Parameters
+    ----------
+    phases_deg: np.ndarray
+        shape (..., NUM_ELEMENTS), element order m*NSIDE + n as in get_phase_shifts
+    dx, dy: float
+        element spacing (fraction of wavelength)
+    theta, phi: float or np.ndarray
+        observation directions in degrees, same shape
+    Returns
+    -------
+    AF: complex np.ndarray, shape (..., n_directions)
+    '''
+    theta = np.deg2rad(np.ravel(theta))
+    phi = np.deg2rad(np.ravel(phi))
+    M, N = np.meshgrid(np.arange(NSIDE), np.arange(NSIDE), indexing='ij')
+    #geometric phase of each element towards each direction, shape (n_dirs, NUM_ELEMENTS)
+    geo = 2*np.pi*(dx*np.outer(np.sin(theta)*np.cos(phi), M.ravel())
+                   + dy*np.outer(np.sin(theta)*np.sin(phi), N.ravel()))
+    return np.exp(1j*np.deg2rad(phases_deg)) @ np.exp(1j*geo).T
+
+
+#theta/phi sampling of the plotted pattern (upper hemisphere)
+AF_N_THETA = 300
+AF_N_PHI = 600
+
+class AFGrid:
+    '''
+    Observation grid of the plotted array factor with everything that only
+    depends on (dx, dy, resolution) precomputed once: trig grids, the u/v
+    projections and the geometric phase 2*pi*dx*u, 2*pi*dy*v.
+    Scratch buffers are reused between evaluations (guarded by a lock).
+    Arrays have shape (n_phi, n_theta) like the original meshgrid.
+    '''
+    def __init__(self, dx: float, dy: float, n_theta: int = AF_N_THETA, n_phi: int = AF_N_PHI):
+        self.theta = np.linspace(0, np.pi/2, n_theta)
+        self.phi = np.linspace(0, np.pi * 2, n_phi)
+        self.THETA, self.PHI = np.meshgrid(self.theta, self.phi)
+        self.sinTH = np.sin(self.THETA)
+        self.cosTH = np.cos(self.THETA)
+        self.cosPH = np.cos(self.PHI)
+        self.sinPH = np.sin(self.PHI)
+        self.u = self.sinTH * self.cosPH
+        self.v = self.sinTH * self.sinPH
+        self.psi_x = 2*np.pi*dx*self.u
+        self.psi_y = 2*np.pi*dy*self.v
+        self.shape = self.THETA.shape
+        #sin/cos of psi/2 and N*psi/2 per nside, steering only rotates them
+        self._trig = {}
+        self._den = np.empty(self.shape)
+        self._num = np.empty(self.shape)
+        self._tmp = np.empty(self.shape)
+        self._sy = np.empty(self.shape)
+        self.lock = threading.Lock()
+
+    def _kernel_trig(self, axis: str, nside: int) -> tuple:
+        key = (axis, nside)
+        trig = self._trig.get(key)
+        if trig is None:
+            half = 0.5 * (self.psi_x if axis == 'x' else self.psi_y)
+            trig = self._trig[key] = (np.sin(half), np.cos(half), np.sin(nside*half), np.cos(nside*half))
+        return trig
+
+    def _dirichlet(self, axis: str, beta, nside: int, out: np.ndarray, scratch: tuple = None) -> np.ndarray:
+        '''
+        |sum_m exp(j m (psi + beta))| = |sin(N x / 2) / sin(x / 2)|, N at the grating lobes.
+        The angle sum identity turns the steering into multiply-adds on cached trig grids.
+        beta is a scalar, or shape (K, 1, 1) with out and scratch of shape (K, n_phi, n_theta).
+        '''
+        den, num, tmp = scratch if scratch is not None else (self._den, self._num, self._tmp)
+        s1, c1, sN, cN = self._kernel_trig(axis, nside)
+        b = 0.5 * np.asarray(beta)
+        np.multiply(s1, np.cos(b), out=den)
+        den += np.multiply(c1, np.sin(b), out=tmp)
+        np.multiply(sN, np.cos(nside*b), out=num)
+        num += np.multiply(cN, np.sin(nside*b), out=tmp)
+        out.fill(nside)
+        np.divide(num, den, out=out, where=np.abs(den, out=tmp) > 1e-9)
+        return np.abs(out, out=out)
+
+
+#grids already built, keyed by (dx, dy, n_theta, n_phi)
+_AF_GRIDS = {}
+
+def get_af_grid(dx: float, dy: float, n_theta: int = AF_N_THETA, n_phi: int = AF_N_PHI) -> AFGrid:
+    '''cached AFGrid for this spacing and resolution'''
+    key = (float(dx), float(dy), n_theta, n_phi)
+    grid = _AF_GRIDS.get(key)
+    if grid is None:
+        grid = _AF_GRIDS[key] = AFGrid(dx, dy, n_theta, n_phi)
+    return grid
+
+
+def array_factor(dx: float, dy: float, beta_x: float, beta_y: float, nside: int = NSIDE,
+                 n_theta: int = AF_N_THETA, n_phi: int = AF_N_PHI, out: np.ndarray = None) -> np.ndarray:
+    '''
+    Normalized array factor magnitude of an nside x nside array with progressive phase shifts
+    Parameters
+    ----------
+    dx, dy: float
+        element spacing (fraction of wavelength)
+    beta_x, beta_y: float
+        progressive phase shifts (radians)
+    nside: int
+        elements per side
+    n_theta, n_phi: int
+        grid resolution, see get_af_grid
+    out: np.ndarray
+        optional (n_phi, n_theta) float array to write into
+    Returns
+    -------
+    AF_mag_norm: np.ndarray, shape (n_phi, n_theta), peak 1
+    '''
+    grid = get_af_grid(dx, dy, n_theta, n_phi)
+    if out is None:
+        out = np.empty(grid.shape)
+    with grid.lock:
+        #separable: AF = Sx(u) * Sy(v), each a closed form Dirichlet kernel
+        grid._dirichlet('x', beta_x, nside, out)
+        sy = grid._dirichlet('y', beta_y, nside, grid._sy)
+        out *= sy
+    out /= out.max()
+    return out
+
+
+#scratch memory (bytes) used per chunk by array_factor_batch
+AF_BATCH_BYTES = 16 * 2**20
+
+def array_factor_batch(dx: float, dy: float, beta_x, beta_y, nside: int = NSIDE,
+                       n_theta: int = AF_N_THETA, n_phi: int = AF_N_PHI, normalize: bool = True,
+                       dtype=np.float32, chunk: int = None) -> np.ndarray:
+    '''
+    Array factor magnitude for many progressive phase shifts in one vectorized pass
+    Parameters
+    ----------
+    dx, dy: float
+        element spacing (fraction of wavelength)
+    beta_x, beta_y: array_like
+        progressive phase shifts (radians), one pair per steering state
+    nside: int
+        elements per side
+    n_theta, n_phi: int
+        grid resolution, see get_af_grid
+    normalize: bool
+        True: each pattern scaled to peak 1, False: raw |AF| (peak nside**2 at broadside)
+    dtype:
+        dtype of the returned stack
+    chunk: int
+        states evaluated together, by default sized to AF_BATCH_BYTES of scratch
+    Returns
+    -------
+    AF: np.ndarray, shape (n_angles, n_phi, n_theta)
+    '''
+    beta_x, beta_y = np.broadcast_arrays(np.ravel(beta_x), np.ravel(beta_y))
+    grid = get_af_grid(dx, dy, n_theta, n_phi)
+    n = len(beta_x)
+    if chunk is None:
+        #4 float64 work arrays per state (out, den, num, tmp) plus the y kernel
+        chunk = max(1, AF_BATCH_BYTES // (5 * 8 * grid.THETA.size))
+    chunk = min(chunk, n) if n else 1
+    result = np.empty((n,) + grid.shape, dtype=dtype)
+    work = np.empty((5, chunk) + grid.shape)
+    for start in range(0, n, chunk):
+        k = min(chunk, n - start)
+        out, sy, den, num, tmp = (w[:k] for w in work)
+        bx = beta_x[start:start+k].reshape(-1, 1, 1)
+        by = beta_y[start:start+k].reshape(-1, 1, 1)
+        grid._dirichlet('x', bx, nside, out, (den, num, tmp))
+        grid._dirichlet('y', by, nside, sy, (den, num, tmp))
+        out *= sy
+        if normalize:
+            out /= out.max(axis=(1, 2), keepdims=True)
+        result[start:start+k] = out
+    return result
+
+
+def array_factor_steered(dx: float, dy: float, theta_0, phi_0, **kwargs) -> np.ndarray:
+    '''
+    array_factor_batch for steering directions (degrees) instead of phase shifts,
+    e.g. array_factor_steered(DX, DY, theta_0, phi_0) for every direction of a scan grid
+    '''
+    beta_x, beta_y = find_betas(np.asarray(theta_0, dtype=float), np.asarray(phi_0, dtype=float), dx, dy)
+    return array_factor_batch(dx, dy, beta_x, beta_y, **kwargs)
 
 
 def dispAF(dx: float, dy: float, beta_x: float, beta_y: float, disp:bool):
@@ -95,35 +284,18 @@ def dispAF(dx: float, dy: float, beta_x: float, beta_y: float, disp:bool):
     plots the array factor magnitude 
     plot uv
     '''
-    # define theta phi mesh grid 
-    theta = np.linspace(0, np.pi/2, 300)
-    phi = np.linspace(0, np.pi * 2, 600)
-    THETA, PHI = np.meshgrid(theta, phi)
-    # used multiple times 
-    sinTH =np.sin(THETA) 
-    cosPH = np.cos(PHI)
-    sinPH = np.sin(PHI)
-    
-    # Define x part of array factor 
+    # cached theta phi mesh grid and trig terms
+    grid = get_af_grid(dx, dy)
     Nside = int(np.sqrt(NUM_ELEMENTS))
-    m_idx = np.arange(Nside).reshape(-1, 1, 1)
-    Sxm = np.sum(np.exp(1j * m_idx * (2*np.pi*dx*sinTH*cosPH + beta_x)), axis=0)
-      
-    # Define y part of array factor 
-    n_idx = np.arange(Nside).reshape(-1, 1, 1)
-    Syn = np.sum(np.exp(1j * n_idx * (2*np.pi*dy*sinTH*sinPH + beta_y)), axis=0)
-
-    AF = Sxm * Syn
-    AF_mag = np.abs(AF) 
-    AF_mag_norm = AF_mag/np.max(AF_mag)
+    AF_mag_norm = array_factor(dx, dy, beta_x, beta_y, Nside)
     #convert to cartesian coords
-    X = AF_mag_norm * sinTH * cosPH
-    Y = AF_mag_norm * sinTH * sinPH
-    Z = AF_mag_norm * np.cos(THETA)
+    X = AF_mag_norm * grid.u
+    Y = AF_mag_norm * grid.v
+    Z = AF_mag_norm * grid.cosTH
     fig = plt.figure(figsize = (9,7))
     ax = fig.add_subplot(111, projection='3d')  
     cmap = cm.jet
-    custom_cmap = ListedColormap(cmap(np.linspace(0.3, 1, 256)))
+    custom_cmap = mcolors.ListedColormap(cmap(np.linspace(0.3, 1, 256)))
     surf = ax.plot_surface(
         X,Y,Z,
         rstride=3, cstride=3,
@@ -163,8 +335,8 @@ def dispAF(dx: float, dy: float, beta_x: float, beta_y: float, disp:bool):
     else:
         plt.show()
     # ax.dist = 9
-    u=sinTH*cosPH
-    v=sinTH*sinPH
+    u=grid.u
+    v=grid.v
     fig_uv, ax_uv= plt.subplots( figsize=(7,6))
     uv_plot = ax_uv.pcolormesh(
         u, v, AF_mag_norm,
@@ -189,44 +361,29 @@ def dispAF(dx: float, dy: float, beta_x: float, beta_y: float, disp:bool):
     else:
         plt.show()
 
-def dispAF_frame(dx: float, dy: float, beta_x: float, beta_y: float, NUM_ELEMENTS: int, theta_deg: float):
+def dispAF_frame(dx: float, dy: float, beta_x: float, beta_y: float, NUM_ELEMENTS: int, theta_deg: float,
+                 AF_mag_norm: np.ndarray = None):
     '''
     Generates a single frame for the animation
+    AF_mag_norm can be passed in when it was already computed (array_factor_batch)
     Returns figures for both 3D and UV plots
     '''
-    # define theta phi mesh grid 
-    theta = np.linspace(0, np.pi/2, 300)
-    phi = np.linspace(0, np.pi * 2, 600)
-    THETA, PHI = np.meshgrid(theta, phi)
-    
-    # used multiple times 
-    sinTH = np.sin(THETA) 
-    cosPH = np.cos(PHI)
-    sinPH = np.sin(PHI)
-    
-    # Define x part of array factor 
+    # cached theta phi mesh grid and trig terms
+    grid = get_af_grid(dx, dy)
     Nside = int(np.sqrt(NUM_ELEMENTS))
-    m_idx = np.arange(Nside).reshape(-1, 1, 1)
-    Sxm = np.sum(np.exp(1j * m_idx * (2*np.pi*dx*sinTH*cosPH + beta_x)), axis=0)
-      
-    # Define y part of array factor 
-    n_idx = np.arange(Nside).reshape(-1, 1, 1)
-    Syn = np.sum(np.exp(1j * n_idx * (2*np.pi*dy*sinTH*sinPH + beta_y)), axis=0)
-    
-    AF = Sxm * Syn
-    AF_mag = np.abs(AF) 
-    AF_mag_norm = AF_mag/np.max(AF_mag)
+    if AF_mag_norm is None:
+        AF_mag_norm = array_factor(dx, dy, beta_x, beta_y, Nside)
     
     # Convert to cartesian coords
-    X = AF_mag_norm * sinTH * cosPH
-    Y = AF_mag_norm * sinTH * sinPH
-    Z = AF_mag_norm * np.cos(THETA)
+    X = AF_mag_norm * grid.u
+    Y = AF_mag_norm * grid.v
+    Z = AF_mag_norm * grid.cosTH
     
     # Create 3D plot
     fig_3d = plt.figure(figsize=(9, 7))
     ax = fig_3d.add_subplot(111, projection='3d')  
     cmap = cm.jet
-    custom_cmap = ListedColormap(cmap(np.linspace(0.3, 1, 256)))
+    custom_cmap = mcolors.ListedColormap(cmap(np.linspace(0.3, 1, 256)))
     
     surf = ax.plot_surface(
         X, Y, Z,
@@ -262,8 +419,8 @@ def dispAF_frame(dx: float, dy: float, beta_x: float, beta_y: float, NUM_ELEMENT
     ax.view_init(elev=25, azim=30)
     
     # Create UV plot
-    u = sinTH * cosPH
-    v = sinTH * sinPH
+    u = grid.u
+    v = grid.v
     fig_uv, ax_uv = plt.subplots(figsize=(7, 6))
     
     uv_plot = ax_uv.pcolormesh(
@@ -285,8 +442,119 @@ def dispAF_frame(dx: float, dy: float, beta_x: float, beta_y: float, NUM_ELEMENT
     return fig_3d, fig_uv
 
 
+def _render_frame(job: tuple) -> tuple:
+    '''
+    Render one animation frame (runs in a worker process)
+    job = (dx, dy, beta_x, beta_y, theta_deg, AF_mag_norm)
+    Returns PNG bytes of the 3D and UV plots
+    '''
+    dx, dy, beta_x, beta_y, theta_deg, AF_mag_norm = job
+    fig_3d, fig_uv = dispAF_frame(dx, dy, beta_x, beta_y, NUM_ELEMENTS, theta_deg, AF_mag_norm)
+    pngs = []
+    for fig in (fig_3d, fig_uv):
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png', bbox_inches='tight', dpi=100)
+        plt.close(fig)
+        pngs.append(buf.getvalue())
+    return tuple(pngs)
+
+
+def _init_render_worker():
+    '''worker processes draw off screen'''
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _render_ordered(jobs, workers: int, window: int):
+    '''
+    Yield _render_frame results in job order.
+    Frames are fanned out to a process pool with at most window frames in flight,
+    so memory stays bounded no matter how long the sweep is.
+    '''
+    if workers <= 1:
+        for job in jobs:
+            yield _render_frame(job)
+        return
+    import collections
+    from concurrent.futures import ProcessPoolExecutor
+    jobs = iter(jobs)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker) as pool:
+        pending = collections.deque()
+        for job in jobs:
+            pending.append(pool.submit(_render_frame, job))
+            if len(pending) >= window:
+                break
+        while pending:
+            result = pending.popleft().result()
+            job = next(jobs, None)
+            if job is not None:
+                pending.append(pool.submit(_render_frame, job))
+            yield result
+
+
+class _AnimationWriter:
+    '''
+    Writes animation frames to path as they arrive, nothing is kept.
+    MP4 frames are streamed to ffmpeg (needs imageio and imageio-ffmpeg).
+    PIL's save_all (and imageio's pillow plugin) buffers every GIF frame until
+    the file is closed, so GIF frames are encoded one by one with PIL's
+    GifImagePlugin helpers instead: the first frame writes the header, every
+    frame carries its own 256 colour table, close() writes the trailer.
+    Frames are padded/cropped to the size of the first frame.
+    Args:
+        path (str): .gif or .mp4 file
+        duration_ms (int): display time of each frame in milliseconds
+    '''
+    def __init__(self, path: str, duration_ms: int = 100):
+        self.path = path
+        self.duration_ms = duration_ms
+        self.size = None
+        self._writer = None
+        self._gif = None
+        if path.endswith('.mp4'):
+            try:
+                import imageio.v2 as imageio
+            except ImportError:
+                raise ImportError('MP4 export needs imageio and imageio-ffmpeg (pip install imageio[ffmpeg])')
+            #ffmpeg takes a frame rate, no duration unit to get wrong
+            self._writer = imageio.get_writer(path, fps=1000 / duration_ms, macro_block_size=1)
+
+    def append(self, png: bytes):
+        frame = Image.open(io.BytesIO(png)).convert('RGB')
+        if self.size is None:
+            self.size = frame.size
+        elif frame.size != self.size:
+            canvas = Image.new('RGB', self.size, 'white')
+            canvas.paste(frame, (0, 0))
+            frame = canvas
+        if self._writer is not None:
+            self._writer.append_data(np.asarray(frame))
+        else:
+            self._append_gif(frame.quantize(colors=256))
+
+    def _append_gif(self, frame):
+        #PIL takes the GIF frame duration in milliseconds
+        if self._gif is None:
+            self._gif = open(self.path, 'wb')
+            header, _ = GifImagePlugin.getheader(frame, info={'loop': 0, 'duration': self.duration_ms})
+            self._gif.write(b''.join(header))
+        self._gif.write(b''.join(GifImagePlugin.getdata(
+            frame, duration=self.duration_ms, include_color_table=True)))
+        #a sweep that fails midway still leaves its finished frames on disk
+        self._gif.flush()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        elif self._gif is not None:
+            self._gif.write(b';') #trailer
+            self._gif.close()
+            self._gif = None
+
+
 def create_af_animation(theta_start: float = 0, theta_end: float = 60, 
-                        theta_step: float = 1, phi_deg: float = 90):
+                        theta_step: float = 1, phi_deg: float = 90,
+                        workers: int = None, window: int = None, fmt: str = 'gif'):
     '''
     Creates animated GIFs of array factor for varying beam steering angles
     
@@ -306,69 +574,53 @@ def create_af_animation(theta_start: float = 0, theta_end: float = 60,
         Step size for theta in degrees
     phi_deg : float
         Fixed phi angle in degrees
+    workers : int
+        Render processes, defaults to the number of cores (1 renders in this process)
+    window : int
+        Maximum frames in flight (bounds memory), defaults to 2 * workers
+    fmt : str
+        'gif' or 'mp4' (mp4 needs imageio-ffmpeg), both are written frame by
+        frame as the sweep is rendered
     '''
     
     # Create output directory if it doesn't exist
     os.makedirs('media', exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    window = window or 2 * workers
     
     # Convert angles to radians
     phi_rad = np.radians(phi_deg)
     theta_range = np.arange(theta_start, theta_end + theta_step, theta_step)
     
-    frames_3d = []
-    frames_uv = []
+    print(f"Generating {len(theta_range)} frames on {workers} worker(s)...")
     
-    print(f"Generating {len(theta_range)} frames...")
-    
-    for i, theta_deg in enumerate(theta_range):
-        theta_rad = np.radians(theta_deg)
-        
-        # Calculate progressive phase shifts for beam steering
-        beta_x = -2 * np.pi * DX * np.sin(theta_rad) * np.cos(phi_rad)
-        beta_y = -2 * np.pi * DY * np.sin(theta_rad) * np.sin(phi_rad)
-        
-        # Generate frame
-        fig_3d, fig_uv = dispAF_frame(DX, DY, beta_x, beta_y, NUM_ELEMENTS, theta_deg)
-        
-        # Convert 3D plot to image
-        buf_3d = io.BytesIO()
-        fig_3d.savefig(buf_3d, format='png', bbox_inches='tight', dpi=100)
-        buf_3d.seek(0)
-        frames_3d.append(Image.open(buf_3d).copy())
-        plt.close(fig_3d)
-        
-        # Convert UV plot to image
-        buf_uv = io.BytesIO()
-        fig_uv.savefig(buf_uv, format='png', bbox_inches='tight', dpi=100)
-        buf_uv.seek(0)
-        frames_uv.append(Image.open(buf_uv).copy())
-        plt.close(fig_uv)
-        
-        buf_3d.close()
-        buf_uv.close()
-        
-        print(f"Frame {i+1}/{len(theta_range)} completed (θ={theta_deg}°)")
-    
-    # Save as GIFs
-    print("Saving 3D animation...")
-    frames_3d[0].save(
-        'media/AF_animation.gif',
-        save_all=True,
-        append_images=frames_3d[1:],
-        duration=100,  # 100ms per frame
-        loop=0
-    )
-    
-    print("Saving UV animation...")
-    frames_uv[0].save(
-        'media/UV_animation.gif',
-        save_all=True,
-        append_images=frames_uv[1:],
-        duration=100,
-        loop=0
-    )
+    # Calculate progressive phase shifts for every frame
+    betas_x = -2 * np.pi * DX * np.sin(np.radians(theta_range)) * np.cos(phi_rad)
+    betas_y = -2 * np.pi * DY * np.sin(np.radians(theta_range)) * np.sin(phi_rad)
+
+    def jobs():
+        # array factors are computed one window at a time with the batched engine
+        for start in range(0, len(theta_range), window):
+            AF_stack = array_factor_batch(DX, DY, betas_x[start:start+window], betas_y[start:start+window], NSIDE)
+            for k, AF_mag_norm in enumerate(AF_stack):
+                i = start + k
+                yield (DX, DY, betas_x[i], betas_y[i], theta_range[i], AF_mag_norm)
+
+    path_3d = f'media/AF_animation.{fmt}'
+    path_uv = f'media/UV_animation.{fmt}'
+    writer_3d = _AnimationWriter(path_3d)
+    writer_uv = _AnimationWriter(path_uv)
+    try:
+        for i, (png_3d, png_uv) in enumerate(_render_ordered(jobs(), workers, window)):
+            writer_3d.append(png_3d)
+            writer_uv.append(png_uv)
+            print(f"Frame {i+1}/{len(theta_range)} completed (θ={theta_range[i]}°)")
+    finally:
+        print("Saving animations...")
+        writer_3d.close()
+        writer_uv.close()
     
-    print(f"Animations saved to media/AF_animation.gif and media/UV_animation.gif")
+    print(f"Animations saved to {path_3d} and {path_uv}")
 
 def main():
     # dx = float(input('enter the horizontal spacing dx in terms of wavelengths: '))
@@ -379,7 +631,153 @@ def main():
     # dispAF(dx, dy, beta_x, beta_y,disp=True)
     create_af_animation()
 
-def runAF_Calc(dx: float,dy: float,theta: float,phi: float)->np.ndarray:
+#colormap lookup table and raster index maps for the fast renderer
+_AF_LUT = None
+_UV_INDEX = {}
+_CHROME = {}
+
+def af_to_uint8(AF_mag_norm: np.ndarray) -> np.ndarray:
+    '''quantize a normalized pattern (0..1) to 0..255'''
+    return (np.multiply(AF_mag_norm, 255, dtype=np.float32) + 0.5).astype(np.uint8)
+
+
+def af_colormap_lut() -> np.ndarray:
+    '''(256, 3) uint8 RGB table of the custom jet colormap used by dispAF'''
+    global _AF_LUT
+    if _AF_LUT is None:
+        _AF_LUT = np.round(cm.jet(np.linspace(0.3, 1, 256))[:, :3] * 255).astype(np.uint8)
+    return _AF_LUT
+
+
+def _uv_index(grid: AFGrid, size: int) -> tuple:
+    '''
+    Nearest (phi, theta) grid sample of every pixel of a size x size u/v raster.
+    Returns flat indices into the (n_phi, n_theta) pattern and the unit circle
+    (boolean array and paste mask)
+    '''
+    key = (len(grid.theta), len(grid.phi), size)
+    entry = _UV_INDEX.get(key)
+    if entry is None:
+        c = (np.arange(size) + 0.5) / size * 2 - 1
+        u, v = np.meshgrid(c, -c)  #v points up
+        r = np.hypot(u, v)
+        inside = r <= 1
+        th = np.arcsin(np.minimum(r, 1))
+        ph = np.arctan2(v, u) % (2*np.pi)
+        i_th = np.rint(th / (np.pi/2) * (len(grid.theta) - 1)).astype(np.intp)
+        i_ph = np.rint(ph / (2*np.pi) * (len(grid.phi) - 1)).astype(np.intp)
+        mask = Image.fromarray(inside.astype(np.uint8) * 255)
+        entry = _UV_INDEX[key] = ((i_ph * len(grid.theta) + i_th).ravel(), inside, mask)
+    return entry
+
+
+def _chrome(kind: str, width: int, height: int) -> tuple:
+    '''
+    Static figure decoration (frame, axis labels, colorbar), drawn once and reused.
+    Returns (base image, top-left corner of the plot area)
+    '''
+    from PIL import ImageDraw
+    key = (kind, width, height)
+    entry = _CHROME.get(key)
+    if entry is None:
+        pad_l, pad_t, pad_r, pad_b = 50, 40, 80, 40
+        base = Image.new('RGB', (pad_l + width + pad_r, pad_t + height + pad_b), 'white')
+        draw = ImageDraw.Draw(base)
+        x0, y0 = pad_l, pad_t
+        title = {'uv': 'Normalized Array Factor (UV Plot)',
+                 'theta_phi': 'Normalized Array Factor (theta vs phi)'}[kind]
+        draw.text((x0, 4), title, fill='black')
+        if kind == 'uv':
+            draw.ellipse((x0 - 1, y0 - 1, x0 + width, y0 + height), outline='black')
+            draw.text((x0 + width // 2 - 50, y0 + height + 14), 'u = sin(theta)cos(phi)', fill='black')
+            draw.text((6, y0 + height // 2 - 5), 'v', fill='black')
+            for frac, label in ((0, '-1'), (0.5, '0'), (1, '1')):
+                draw.text((x0 + int(frac * (width - 1)) - 4, y0 + height + 2), label, fill='black')
+        else:
+            draw.rectangle((x0 - 1, y0 - 1, x0 + width, y0 + height), outline='black')
+            draw.text((x0 + width // 2 - 25, y0 + height + 16), 'phi (deg)', fill='black')
+            draw.text((4, y0 - 16), 'theta (deg)', fill='black')
+            for frac in (0, 0.25, 0.5, 0.75, 1):
+                draw.text((x0 + int(frac * (width - 1)) - 8, y0 + height + 3), f'{360*frac:.0f}', fill='black')
+            for frac in (0, 0.5, 1):
+                draw.text((x0 - 22, y0 + int(frac * (height - 1)) - 5), f'{90*frac:.0f}', fill='black')
+        #colorbar
+        lut = af_colormap_lut()
+        bar_x = x0 + width + 20
+        bar = np.repeat(lut[::-1][:, None, :], 16, axis=1)
+        bar = Image.fromarray(bar).resize((16, height))
+        base.paste(bar, (bar_x, y0))
+        for frac, label in ((0, '1.0'), (0.5, '0.5'), (1, '0.0')):
+            draw.text((bar_x + 20, y0 + int(frac * (height - 1)) - 5), label, fill='black')
+        entry = _CHROME[key] = (base, (x0, y0))
+    return entry
+
+
+def render_af_fast(dx: float, dy: float, AF_mag_norm: np.ndarray, size: int = AF_RENDER_SIZE,
+                   af_path: str = 'media/AF.png', uv_path: str = 'media/uv.png'):
+    '''
+    Lightweight replacement for the dispAF savefig: maps the pattern through the
+    colormap LUT straight into RGB rasters and writes them with fast PNG compression.
+    AF.png becomes a theta/phi map (no 3D surface), uv.png the UV projection.
+    '''
+    grid = get_af_grid(dx, dy, AF_mag_norm.shape[1], AF_mag_norm.shape[0])
+    lut = af_colormap_lut()
+    q = af_to_uint8(AF_mag_norm)
+    #theta/phi map, theta rows (0 at the top), phi columns
+    tp = lut[q.T]
+    base, corner = _chrome('theta_phi', tp.shape[1], tp.shape[0])
+    img = base.copy()
+    img.paste(Image.fromarray(tp), corner)
+    img.save(af_path, compress_level=1)
+    #u/v raster from the cached nearest sample map
+    index, _, mask = _uv_index(grid, size)
+    uv = lut[q.ravel()[index]].reshape(size, size, 3)
+    base, corner = _chrome('uv', size, size)
+    img = base.copy()
+    img.paste(Image.fromarray(uv), corner, mask)
+    img.save(uv_path, compress_level=1)
+
+
+def af_view_data(dx: float, dy: float, theta: float, phi: float,
+                 step: int = AF_VIEW_STEP, size: int = AF_VIEW_SIZE) -> tuple:
+    '''
+    Compact pattern data for the interactive (plotly) views, no images written.
+    Values are uint8: 1..255 maps normalized |AF| 0..1, 0 marks points outside
+    the visible region of the u/v raster.
+    Returns
+    -------
+    theta_phi: (n_theta // step, n_phi // step) uint8, rows theta, columns phi
+    uv: (size, size) uint8, rows v (ascending), columns u (ascending)
+    '''
+    beta_x, beta_y = find_betas(theta, phi, dx, dy)
+    AF_mag_norm = array_factor(dx, dy, beta_x, beta_y)
+    grid = get_af_grid(dx, dy)
+    q = 1 + af_to_uint8(AF_mag_norm * (254 / 255))
+    theta_phi = np.ascontiguousarray(q[::step, ::step].T)
+    index, inside, _ = _uv_index(grid, size)
+    uv = np.where(inside, q.ravel()[index].reshape(size, size), 0)[::-1]
+    return theta_phi, np.ascontiguousarray(uv, dtype=np.uint8)
+
+
+def af_view_axes(dx: float, dy: float, step: int = AF_VIEW_STEP, size: int = AF_VIEW_SIZE) -> tuple:
+    '''static axes of af_view_data: theta (deg), phi (deg), u/v pixel centers'''
+    grid = get_af_grid(dx, dy)
+    c = (np.arange(size) + 0.5) / size * 2 - 1
+    return np.degrees(grid.theta[::step]), np.degrees(grid.phi[::step]), c
+
+
+def af_plotly_colorscale(n: int = 32) -> list:
+    '''plotly colorscale for af_view_data values (0 drawn white, then the AF colormap)'''
+    lut = af_colormap_lut()
+    scale = [[0, 'rgb(255,255,255)'], [0.5 / 255, 'rgb(255,255,255)']]
+    for k in range(n):
+        frac = k / (n - 1)
+        r, g, b = lut[int(round(frac * 255))]
+        scale.append([max(frac, 1 / 255), f'rgb({r},{g},{b})'])
+    return scale
+
+
+def runAF_Calc(dx: float,dy: float,theta: float,phi: float, render: str = AF_RENDER_MODE)->np.ndarray:
     '''
     run the array factor calculation to get progressive phase shifts
     and generate plot
@@ -392,11 +790,16 @@ def runAF_Calc(dx: float,dy: float,theta: float,phi: float)->np.ndarray:
             desired elevaiton steering angle
         phi:
             desired azimuthal steering angle
+        render: str
+            'fast' (LUT raster), 'matplotlib' (3D surface + UV plot) or None (no images)
     Returns: phases an array of the phases that go to each element 
     '''
     betaX,betaY = find_betas(theta, phi, dx,dy) 
     phases = get_phase_shifts(betaX, betaY)
-    dispAF(dx,dy,betaX,betaY,disp=False)
+    if render == 'fast':
+        render_af_fast(dx, dy, array_factor(dx, dy, betaX, betaY))
+    elif render == 'matplotlib':
+        dispAF(dx,dy,betaX,betaY,disp=False)
     #return betax and y to be used in actually shifting the array
     return phases 
     
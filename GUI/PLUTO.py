@@ -1,41 +1,139 @@
-import time, adi 
+import time, threading, asyncio, functools, contextlib
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from config import FREQ , BASE_BAND, SAMP_RATE,BUFFER_SIZE,NUM_AVG,RX_GAIN,TX_GAIN 
+from config import FREQ , BASE_BAND, SAMP_RATE,BUFFER_SIZE,NUM_AVG,RX_GAIN,TX_GAIN, POWER_ESTIMATOR, TONE_WINDOW, TONE_SEGMENTS, STREAM_BLOCKS, SIMULATE, CAPTURE_BATCH, RX_KERNEL_BUFFERS, PLUTO_URI, PLUTO_TIMEOUT, ENERGY_RATE, LIVE_PLOT_POINTS
 TX_ACTIVE = False
+# --- tone generator ---
+duration = 0.01
+#ensure cyclic
+num_cycles = int(BASE_BAND * duration)
+num_samples = int(num_cycles * SAMP_RATE / BASE_BAND)
+TONE = np.exp(1j*2*np.pi*BASE_BAND*np.arange(num_samples)/SAMP_RATE)
+
+TONE *= 2**14 #required by PLUTO 
+
 # --- connect to plutosdr ---
-try:
-    sdr = adi.Pluto("ip:192.168.2.1")
-    sdr.sample_rate = int(SAMP_RATE)
+#the session is opened on first use (or by the startup warm up), not at import
+sdr = None
+_CONNECT_LOCK = threading.Lock()
+
+def _open_sdr():
+    if SIMULATE:
+        #synthesized IQ driven by the loopback MCU's phase state
+        from simulation import SimulatedPluto, LOOPBACK
+        radio = SimulatedPluto(LOOPBACK)
+    else:
+        import adi
+        radio = adi.Pluto(PLUTO_URI)
+        #fewer queued buffers means fewer stale ones to drop after a phase change
+        radio._rxadc.set_kernel_buffers_count(RX_KERNEL_BUFFERS)
+    radio.sample_rate = int(SAMP_RATE)
 
-# --- tx setup --- sdr.tx_rf_bandwidth = int(SAMP_RATE)     # match baseband bw
-    sdr.tx_lo = int(FREQ)                    # rf carrier in hz
-    sdr.tx_hardwaregain_chan0 = TX_GAIN          #dBm 
-    sdr.tx_cyclic_buffer = True
+# --- tx setup --- radio.tx_rf_bandwidth = int(SAMP_RATE)     # match baseband bw
+    radio.tx_lo = int(FREQ)                    # rf carrier in hz
+    radio.tx_hardwaregain_chan0 = TX_GAIN          #dBm 
+    radio.tx_cyclic_buffer = True
 
 # --- rx setup ---
-    sdr.rx_lo = int(FREQ)                     # rf carrier in hz
-    sdr.rx_rf_bandwidth = int(SAMP_RATE)
-    sdr.gain_control_mode_chan0 = "manual"
-    sdr.rx_hardwaregain_chan0 = RX_GAIN             # adjust as needed
-    sdr.rx_buffer_size =  BUFFER_SIZE
+    radio.rx_lo = int(FREQ)                     # rf carrier in hz
+    radio.rx_rf_bandwidth = int(SAMP_RATE)
+    radio.gain_control_mode_chan0 = "manual"
+    radio.rx_hardwaregain_chan0 = RX_GAIN             # adjust as needed
+    radio.rx_buffer_size =  BUFFER_SIZE
+    return radio
 
-# --- tone generator ---
-    duration = 0.01
-#ensure cyclic
-    num_cycles = int(BASE_BAND * duration)
-    num_samples = int(num_cycles * SAMP_RATE / BASE_BAND)
-    TONE = np.exp(1j*2*np.pi*BASE_BAND*np.arange(num_samples)/SAMP_RATE)
+def connect(timeout: float = PLUTO_TIMEOUT) -> bool:
+    """
+    open the SDR session if it is not open yet
+    the connection attempt runs in a helper thread so an absent PLUTO costs at
+    most timeout seconds instead of the network stack's own (long) timeout
+    Returns:
+        bool: True if an SDR is available
+    """
+    global sdr
+    with _CONNECT_LOCK:
+        if sdr is not None:
+            return True
+        result = {}
+        def attempt():
+            try:
+                result['sdr'] = _open_sdr()
+            except Exception as e:
+                result['error'] = e
+        thread = threading.Thread(target=attempt, daemon=True, name='pluto-connect')
+        thread.start()
+        thread.join(timeout)
+        if 'sdr' not in result:
+            reason = result.get('error', f'no answer within {timeout} s')
+            print(f'No PLUTO attached ({reason})')
+            return False
+        sdr = result['sdr']
+        return True
+
+def reconnect(timeout: float = PLUTO_TIMEOUT) -> bool:
+    """drop the current session (e.g. after unplugging the PLUTO) and connect again"""
+    global sdr, TX_ACTIVE
+    if STREAM is not None:
+        STREAM.stop()
+    with SDR_LOCK:
+        old, sdr = sdr, None
+        TX_ACTIVE = False
+        if old is not None:
+            for destroy in ('tx_destroy_buffer', 'rx_destroy_buffer'):
+                try:
+                    getattr(old, destroy)()
+                except Exception:
+                    pass #the device may already be gone
+    ok = connect(timeout)
+    #live plots still hold the stream, they continue on the new session
+    if ok and STREAM is not None and _STREAM_USERS:
+        STREAM.start()
+    return ok
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
 
-    TONE *= 2**14 #required by PLUTO 
-except:
-    print('No PLUTO attached')
+def _require_sdr():
+    if sdr is not None:
+        return
+    if _on_event_loop():
+        #connecting can take PLUTO_TIMEOUT, never on the GUI's event loop
+        SDR_EXECUTOR.submit(connect)
+        raise RuntimeError('PLUTO not connected yet, connecting in the background')
+    if not connect():
+        raise RuntimeError('No PLUTO attached')
 
+def _report_error(future):
+    if future.exception() is not None:
+        print(f'SDR command failed: {future.exception()}')
+
+def _sdr_command(fn):
+    '''
+    calls from the event loop (sync UI handlers) are queued on the SDR worker
+    instead of blocking it (first connect, busy rx), in order with run_sdr jobs;
+    errors are printed. Other threads call fn directly.
+    '''
+    @functools.wraps(fn)
+    def wrapper():
+        if _on_event_loop():
+            SDR_EXECUTOR.submit(fn).add_done_callback(_report_error)
+        else:
+            fn()
+    return wrapper
+
+@_sdr_command
 def tx():
     '''Send the tone'''
     global TX_ACTIVE
+    _require_sdr()
     sdr.tx(TONE)
     TX_ACTIVE=True
 
+@_sdr_command
 def stop_tx():
     '''stop transmitting by deleting the buffer'''
     #check if tx is active though 
@@ -45,31 +143,477 @@ def stop_tx():
         TX_ACTIVE=False
 
 def discard_buffer():
-        sdr.rx()
+        capture()
+
+# --- tone selective estimator ---
+#references are built once per (length, dtype) and reused for every buffer
+_TONE_REFS = {}
+
+def _tone_ref(n: int, dtype, window: bool) -> np.ndarray:
+    """
+    conjugate complex exponential at BASE_BAND (optionally Hann windowed)
+    scaled so that dot(rx, ref) is the complex amplitude of the tone
+    """
+    key = (n, np.dtype(dtype), window)
+    ref = _TONE_REFS.get(key)
+    if ref is None:
+        w = np.hanning(n) if window else np.ones(n)
+        ref = w * np.exp(-1j*2*np.pi*BASE_BAND*np.arange(n)/SAMP_RATE) / np.sum(w)
+        #match the capture precision so np.dot never upcasts the buffer
+        ref = ref.astype(np.complex64 if np.dtype(dtype) == np.complex64 else np.complex128)
+        _TONE_REFS[key] = ref
+    return ref
 
-def get_energy() -> float:
+def tone_power(rx: np.ndarray, window: bool = TONE_WINDOW) -> float:
+    """
+    power of the BASE_BAND tone only (single bin DFT / Goertzel equivalent)
+    rejects noise, DC and spurs outside the bin
+    """
+    return np.abs(np.dot(rx, _tone_ref(len(rx), rx.dtype, window)))**2
+
+def capture() -> np.ndarray:
+    """
+    pull one raw rx buffer (BUFFER_SIZE complex samples)
+    while the streaming service runs the buffer comes from its ring instead of
+    a second sdr.rx() call, it is the first block started after this call
+    """
+    if STREAM is not None and STREAM.running:
+        return STREAM.next_block()
+    with SDR_LOCK:
+        return _rx(BUFFER_SIZE)
+
+def kernel_buffers() -> int:
+    """rx buffers the driver queues ahead of the reader (adi.Pluto does not report it)"""
+    return getattr(sdr, 'kernel_buffers', RX_KERNEL_BUFFERS)
+
+def stale_buffers() -> int:
+    """
+    rx buffers capture() can return that were filled before it was called, i.e.
+    before the last phase change: the driver's queue depth, none while the
+    streaming service hands out fresh blocks
+    """
+    if STREAM is not None and STREAM.running:
+        return 0
+    return kernel_buffers()
+
+def _rx(n: int) -> np.ndarray:
+    """one sdr.rx() of n samples, the rx buffer is recreated only when n changes (hold SDR_LOCK)"""
+    _require_sdr()
+    if sdr.rx_buffer_size != n:
+        sdr.rx_destroy_buffer()
+        sdr.rx_buffer_size = n
+    return sdr.rx()
+
+def capture_batch(k: int, out: np.ndarray = None) -> np.ndarray:
+    """
+    k consecutive rx buffers in one (k, BUFFER_SIZE) complex64 array
+    without the streaming service the k buffers come from a single gap free
+    sdr.rx() of k*BUFFER_SIZE samples, with it they are the next k streamed blocks
+    the rx buffer keeps that size afterwards, repeated batches of the same size
+    (e.g. get_energy with NUM_AVG > 1) never recreate it
+    Args:
+        k (int): number of buffers
+        out (np.ndarray): optional preallocated (k, BUFFER_SIZE) complex64 array
+    """
+    if out is None:
+        out = np.empty((k, BUFFER_SIZE), dtype=np.complex64)
+    if STREAM is not None and STREAM.running:
+        for i in range(k):
+            out[i] = STREAM.next_block()
+        return out
+    with SDR_LOCK:
+        out.reshape(-1)[:] = _rx(k * BUFFER_SIZE)
+    return out
+
+def buffer_power(rx: np.ndarray, estimator: str = POWER_ESTIMATOR) -> float:
+    """
+    energy of one captured buffer
+    estimator: 'tone' for the BASE_BAND tone power, 'mean_square' for total in band power
+    """
+    if estimator == 'tone':
+        return tone_power(rx)
+    #vdot avoids the temporary arrays of np.abs(rx)**2
+    return np.vdot(rx, rx).real / len(rx)
+
+def batch_power(blocks: np.ndarray, estimator: str = POWER_ESTIMATOR) -> np.ndarray:
+    """
+    energy of every row of a (k, n) capture in one vectorized reduction
+    same values as buffer_power applied row by row
+    """
+    if estimator == 'tone':
+        return np.abs(blocks @ _tone_ref(blocks.shape[1], blocks.dtype, TONE_WINDOW))**2
+    return np.einsum('ij,ij->i', blocks.conj(), blocks).real / blocks.shape[1]
+
+def get_energy(estimator: str = POWER_ESTIMATOR) -> float:
     """
     get the tones strength
     gives number proportional to the amplitude of the 
     dominant frequency component
     """
-    power = 0
-    for _ in range(NUM_AVG):
-        rx = sdr.rx()
-        power+= np.mean(np.abs(rx)**2)
-    power /= NUM_AVG
-    return power
+    if NUM_AVG == 1:
+        return buffer_power(capture(), estimator)
+    #NUM_AVG buffers in one read, one reduction
+    return float(np.mean(batch_power(capture_batch(NUM_AVG), estimator)))
 
-def get_energy_fast() -> float:
+def get_energy_fast(estimator: str = POWER_ESTIMATOR) -> float:
     "for receive mode get the energy without averaging" 
-    rx = sdr.rx()
-    power = np.mean(np.abs(rx)**2)
-    return power
-def get_mean_dev():
-    rx = sdr.rx()
+    return buffer_power(capture(), estimator)
+
+def get_mean_dev(estimator: str = POWER_ESTIMATOR):
+    rx = capture()
+    if estimator == 'tone':
+        #spread of the tone power over TONE_SEGMENTS sub blocks
+        seg = len(rx) // TONE_SEGMENTS
+        blocks = rx[:seg*TONE_SEGMENTS].reshape(TONE_SEGMENTS, seg)
+        powers = np.abs(blocks @ _tone_ref(seg, rx.dtype, TONE_WINDOW))**2
+        return (np.mean(powers), np.std(powers))
     avg_power = np.mean(np.abs(rx)**2)
     std_power = np.std(np.abs(rx)**2)
     return (avg_power, std_power)
+# --- sdr worker ---
+#every blocking acquisition started from the GUI runs on this one thread, so
+#the event loop never waits on sdr.rx() and pages never interleave captures
+SDR_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sdr')
+
+async def run_sdr(fn, *args, on_cancel=None, **kwargs):
+    """
+    run a blocking SDR routine on the SDR worker thread and await its result
+    Args:
+        fn: callable, runs as fn(*args, **kwargs)
+        on_cancel: called if the awaiting task is cancelled, should make fn return early
+    Returns:
+        whatever fn returns
+    the cancellation propagates only after fn has returned, so the worker is idle again
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(SDR_EXECUTOR, functools.partial(fn, *args, **kwargs))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        if on_cancel is not None:
+            on_cancel()
+        await asyncio.wait([future])
+        raise
+
+def discard_buffers(n: int = 10):
+    """drop n rx buffers (stale samples from before a state change)"""
+    #single buffers: the captures that follow use BUFFER_SIZE, so no resize
+    for _ in range(n):
+        capture()
+
+def collect_energies(n: int, discard: int = 0, interval: float = 0.0, averaged: bool = False,
+                     cancel: threading.Event = None) -> np.ndarray:
+    """
+    n energy samples in a row, meant to run on the SDR worker (see run_sdr)
+    Args:
+        n (int): number of samples
+        discard (int): buffers dropped before the first sample
+        interval (float): pause between samples (s)
+        averaged (bool): NUM_AVG buffers per sample (get_energy) instead of one
+        cancel (threading.Event): stops at the next buffer once set
+    Returns:
+        np.ndarray of the samples taken, shorter than n if cancelled
+    """
+    cancel = cancel or threading.Event()
+    discard_buffers(discard)
+    energies = np.empty(n)
+    if interval or averaged:
+        for i in range(n):
+            if cancel.is_set():
+                return energies[:i]
+            energies[i] = get_energy() if averaged else get_energy_fast()
+            if interval:
+                cancel.wait(interval)
+        return energies
+    #back to back samples: batched reads into one preallocated array,
+    #cancel is checked between batches
+    batch = np.empty((min(CAPTURE_BATCH, n), BUFFER_SIZE), dtype=np.complex64)
+    for start in range(0, n, len(batch)):
+        if cancel.is_set():
+            return energies[:start]
+        k = min(len(batch), n - start)
+        energies[start:start + k] = batch_power(capture_batch(k, batch[:k]))
+    return energies
+
+# --- background streaming service ---
+#only one thread may talk to the rx buffer at a time
+SDR_LOCK = threading.Lock()
+
+class RxStream:
+    """
+    Runs sdr.rx() back to back in a dedicated thread and writes every buffer
+    into a preallocated ring of complex64 blocks, together with its capture
+    start time and a sequence number.
+
+    Reading back to back keeps the driver queue empty, so an rx() call waits
+    for the block being filled and that block's samples are the last
+    block_time before the call returned. A call that returns at once handed
+    out a queued block of unknown age, it is marked queued and never returned
+    by next_block().
+
+    The writer never blocks readers: a slot's sequence number is cleared while
+    it is being overwritten and set again afterwards, readers copy the block and
+    check the number did not change (seqlock). The condition variable is only
+    used to wake consumers that wait for a new block.
+    """
+    def __init__(self, n_blocks: int = STREAM_BLOCKS, block_size: int = BUFFER_SIZE, source=None):
+        self.n_blocks = n_blocks
+        self.blocks = np.zeros((n_blocks, block_size), dtype=np.complex64)
+        self.timestamps = np.zeros(n_blocks)
+        self.queued = np.zeros(n_blocks, dtype=bool)
+        self.block_time = block_size / SAMP_RATE
+        self.seqs = np.full(n_blocks, -1, dtype=np.int64)
+        self.seq = -1 #last completed block
+        self.running = False
+        self.error = None
+        self._source = source
+        self._new_block = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._new_block:
+            self._new_block.notify_all()
+
+    def _run(self):
+        source = self._source or (lambda: _rx(BUFFER_SIZE))
+        try:
+            while self.running:
+                seq = self.seq + 1
+                slot = seq % self.n_blocks
+                t_call = time.perf_counter()
+                with SDR_LOCK:
+                    rx = source()
+                t_end = time.perf_counter()
+                queued = kernel_buffers() > 0 and t_end - t_call < 0.5 * self.block_time
+                self.seqs[slot] = -1 #slot is being rewritten
+                self.blocks[slot] = rx
+                self.timestamps[slot] = min(t_call, t_end - self.block_time)
+                self.queued[slot] = queued
+                self.seqs[slot] = seq
+                self.seq = seq
+                with self._new_block:
+                    self._new_block.notify_all()
+        except Exception as e:
+            self.error = e
+            self.running = False
+            with self._new_block:
+                self._new_block.notify_all()
+
+    def wait_for(self, seq: int, timeout: float = None) -> bool:
+        """block until block seq has been written, False on timeout/stop"""
+        with self._new_block:
+            self._new_block.wait_for(lambda: self.seq >= seq or not self.running, timeout)
+        return self.seq >= seq
+
+    def read(self, seq: int):
+        """
+        copy of block seq, its start time and whether it came from the driver queue
+        returns None if it was already overwritten (consumer fell behind)
+        """
+        slot = seq % self.n_blocks
+        block = self.blocks[slot].copy()
+        t_start = self.timestamps[slot]
+        queued = self.queued[slot]
+        if self.seqs[slot] != seq:
+            return None
+        return block, t_start, queued
+
+    def latest(self, n: int = 1):
+        """
+        the newest n blocks, oldest first
+        returns (blocks (n, block_size), seqs, timestamps)
+        """
+        while True:
+            last = self.seq
+            if last < 0:
+                return (np.zeros((0, self.blocks.shape[1]), np.complex64),
+                        np.zeros(0, np.int64), np.zeros(0))
+            seqs = np.arange(max(last - min(n, self.n_blocks - 1) + 1, 0), last + 1)
+            slots = seqs % self.n_blocks
+            blocks = self.blocks[slots]
+            timestamps = self.timestamps[slots]
+            #retry if the writer lapped us while copying
+            if np.array_equal(self.seqs[slots], seqs):
+                return blocks, seqs, timestamps
+
+    def next_block(self, timeout: float = 1.0) -> np.ndarray:
+        """first block whose capture started after this call (queued blocks are skipped)"""
+        t_call = time.perf_counter()
+        seq = self.seq + 1
+        while True:
+            if not self.wait_for(seq, timeout):
+                raise RuntimeError(f'rx stream stalled: {self.error}')
+            got = self.read(seq)
+            if got is not None and got[1] >= t_call and not got[2]:
+                return got[0]
+            seq = max(seq + 1, self.seq - self.n_blocks + 2)
+
+STREAM = None
+#owners currently holding the stream, acquiring or releasing twice is harmless
+_STREAM_USERS = set()
+_STREAM_USERS_LOCK = threading.Lock()
+
+def acquire_stream(owner) -> RxStream:
+    """
+    start (or share) the background capture stream
+    Args:
+        owner: hashable id of the consumer (e.g. a page's subscription), an
+            owner holds the stream once however often it acquires
+    """
+    global STREAM
+    with _STREAM_USERS_LOCK:
+        if STREAM is None:
+            STREAM = RxStream()
+        _STREAM_USERS.add(owner)
+        STREAM.start()
+    return STREAM
+
+def release_stream(owner):
+    """drop owner's hold, the stream stops when the last owner is gone"""
+    with _STREAM_USERS_LOCK:
+        _STREAM_USERS.discard(owner)
+        #stopped under the lock, an acquire_stream() meanwhile would find it
+        #still running and then lose it to this stop
+        if not _STREAM_USERS and STREAM is not None:
+            STREAM.stop()
+
+@contextlib.contextmanager
+def streaming():
+    """
+    hold the rx stream for a block of blocking code (e.g. a scan on the SDR
+    worker): capture() returns fresh blocks, no queued buffers to drop
+    """
+    owner = object()
+    acquire_stream(owner)
+    try:
+        yield STREAM
+    finally:
+        release_stream(owner)
+
+def latest_energy(estimator: str = POWER_ESTIMATOR) -> float:
+    """energy of the newest streamed block without waiting, None before the first block"""
+    blocks, _, _ = STREAM.latest(NUM_AVG)
+    if len(blocks) == 0:
+        return None
+    return np.mean([buffer_power(b, estimator) for b in blocks])
+
+# --- shared energy publisher ---
+class EnergyRing:
+    """
+    fixed size ring of (t, energy) samples owned by one subscriber
+    the publisher thread appends, the subscriber reads snapshots
+    error is set (and the ring dropped) when the rx stream dies
+    """
+    def __init__(self, size: int = LIVE_PLOT_POINTS):
+        self.t = np.zeros(size)
+        self.energy = np.zeros(size)
+        self.count = 0 #samples appended so far
+        self.error = None
+        self._lock = threading.Lock()
+
+    def append(self, t: float, energy: float):
+        with self._lock:
+            i = self.count % len(self.t)
+            self.t[i] = t
+            self.energy[i] = energy
+            self.count += 1
+
+    def snapshot(self):
+        """(t, energy) oldest first, at most size samples"""
+        with self._lock:
+            n = min(self.count, len(self.t))
+            order = (np.arange(self.count - n, self.count)) % len(self.t)
+            return self.t[order], self.energy[order]
+
+class EnergyPublisher:
+    """
+    Single producer for every live plot: samples the background rx stream at
+    ENERGY_RATE and appends (t, energy) to each subscriber's EnergyRing.
+    The stream is held while there are subscribers, so any number of open
+    tabs costs one sdr.rx() loop and one power estimate per sample.
+    t is time.perf_counter() of the newest block's capture start.
+    If the stream's capture thread fails, every subscriber's ring gets the
+    error and is dropped, the next subscribe() restarts the stream.
+    """
+    def __init__(self, rate: float = ENERGY_RATE):
+        self.rate = rate
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = None #stop event of the running producer thread
+
+    def subscribe(self, size: int = LIVE_PLOT_POINTS) -> EnergyRing:
+        ring = EnergyRing(size)
+        with self._lock:
+            self._subscribers.append(ring)
+            if self._stop is None:
+                self._stop = threading.Event()
+                acquire_stream(self._stop)
+                self._thread = threading.Thread(target=self._run, args=(self._stop,), daemon=True)
+                self._thread.start()
+        return ring
+
+    def unsubscribe(self, ring: EnergyRing):
+        """
+        drop a subscriber, the last one stops the producer
+        only signals the thread (safe on the event loop), the thread releases
+        the stream itself on its way out
+        """
+        with self._lock:
+            if ring not in self._subscribers:
+                return
+            self._subscribers.remove(ring)
+            if self._subscribers or self._stop is None:
+                return
+            self._stop.set()
+            self._stop = None
+
+    def _run(self, stop: threading.Event):
+        last = -1
+        next_tick = time.perf_counter()
+        try:
+            while not stop.is_set():
+                next_tick += 1 / self.rate
+                stop.wait(max(next_tick - time.perf_counter(), 0))
+                if not STREAM.running and STREAM.error is not None:
+                    self._fail(stop, STREAM.error)
+                    return
+                blocks, seqs, timestamps = STREAM.latest(NUM_AVG)
+                if stop.is_set() or len(seqs) == 0 or seqs[-1] == last:
+                    continue #no new block since the last sample
+                last = seqs[-1]
+                energy = np.mean([buffer_power(b) for b in blocks])
+                with self._lock:
+                    subscribers = list(self._subscribers)
+                for ring in subscribers:
+                    ring.append(timestamps[-1], energy)
+        finally:
+            #joins the rx thread here, never on the caller of unsubscribe
+            release_stream(stop)
+
+    def _fail(self, stop: threading.Event, error: Exception):
+        """hand error to every subscriber and drop them, a new subscribe starts over"""
+        with self._lock:
+            for ring in self._subscribers:
+                ring.error = error
+            self._subscribers.clear()
+            if self._stop is stop:
+                self._stop = None
+
+ENERGY = EnergyPublisher()
+
 def moving_average(x, window=8):
     x = np.asarray(x)
     return np.convolve(x, np.ones(window)/window, mode='valid')
@@ -7,7 +7,9 @@ Secondary Purpose: Generate useful plots
 """
 import os
 from config import FREQ
-import matplotlib.pyplot as plt
+from READ_S2P import read_touchstone
+from lazy_imports import lazy_import
+plt = lazy_import('matplotlib.pyplot')
 import numpy as np
 from pathlib import Path
 
@@ -18,22 +20,7 @@ def plot_s1p_2x2():
     Returns freqs, s11
     Also plots |S11| in dB.
     """
-    data = []
-    with open('2x2_measured.s1p', "r") as f:
-        for line in f:
-            # Skip comments and option lines
-            if line.startswith("!") or line.startswith("#") or not line.strip():
-                continue
-            parts = line.split()
-            # Expected format (RI): freq Re(S11) Im(S11)
-            freq = float(parts[0])
-            s11 = complex(float(parts[1]), float(parts[2]))
-            data.append((freq, s11))
-    
-    # Convert to arrays
-    data = np.array(data, dtype=object)
-    freqs = np.array([d[0] for d in data])
-    s11 = np.array([d[1] for d in data])
+    freqs, s11 = read_s1p('2x2_measured.s1p')
     
     # Convert S11 to dB
     s11_db = 20 * np.log10(np.abs(s11))
@@ -56,21 +43,8 @@ def read_s1p(filepath: Path):
     Read S-parameter data from a .s1p file.
     Returns freqs (array), s11 (complex array)
     """
-    data = []
-    with open(filepath, "r") as f:
-        for line in f:
-            if line.startswith("!") or line.startswith("#") or not line.strip():
-                continue
-            parts = line.split()
-            freq = float(parts[0])
-            s11 = complex(float(parts[1]), float(parts[2]))
-            data.append((freq, s11))
-    
-    data = np.array(data, dtype=object)
-    freqs = np.array([d[0] for d in data])
-    s11 = np.array([d[1] for d in data])
-    
-    return freqs, s11
+    freqs, s, _, _ = read_touchstone(filepath, n_ports=1)
+    return freqs, s[:, 0, 0]
 
 def plot_s1p_4x4():
     """
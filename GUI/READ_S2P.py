@@ -6,16 +6,18 @@ phased array calibration
 
 format:
 ! Freq	S11:Re/Im(F2)	S41:Re/Im(F2)	S14:Re/Im(F2)	S44:Re/Im(F2)
+read_touchstone() reads any touchstone v1 file (Hz..GHz, MA/DB/RI, N ports)
 
 Secondary Purpose: 
 Generate useful plots 
 
 """
-import os
+import os, re, hashlib
 from config import FREQ, S2PDIR
-import matplotlib.pyplot as plt
+from lazy_imports import lazy_import
 import numpy as np
 from pathlib import Path
+plt = lazy_import('matplotlib.pyplot') #only the plotting helpers need it
 
 # change directory of s2p files here
 s2p_dir = Path(S2PDIR) #directory containing port data
@@ -28,45 +30,229 @@ LABEL_SIZE = 16
 TICK_SIZE = 14
 LEGEND_SIZE = 12
 
+#parsed files kept in memory, keyed by path -> ((mtime, size), result)
+_PARSED = {}
+#touchstone v1 frequency units
+FREQ_UNITS = {'HZ': 1.0, 'KHZ': 1e3, 'MHZ': 1e6, 'GHZ': 1e9}
+#comments run from '!' to the end of the line
+_COMMENT = re.compile(rb'!.*')
+
+def _parse_touchstone(raw: bytes):
+    """
+    Vectorized parse of touchstone text.
+    Comments and the option line are stripped once, then the whole data
+    section is converted by a single np.fromstring call.
+    Returns the option line, every number of the data section as one flat
+    float64 array and the number of values on each data line.
+    """
+    data = bytearray(_COMMENT.sub(b'', raw))
+    #once comments are gone '#' only starts option lines, the first one counts
+    option = ''
+    start = data.find(b'#')
+    while start >= 0:
+        end = data.find(b'\n', start)
+        end = len(data) if end < 0 else end
+        option = option or data[start:end].decode('utf-8', errors='replace').strip()
+        data[start:end] = b' ' * (end - start)
+        start = data.find(b'#', end)
+    values = np.fromstring(data.decode('utf-8', errors='replace'), dtype=np.float64, sep=' ')
+    #values per line from the token starts, without splitting lines in python
+    chars = np.frombuffer(data, dtype=np.uint8)
+    blank = chars <= ord(' ') #space, tab, CR, LF
+    starts = np.flatnonzero(blank[:-1] & ~blank[1:]) + 1
+    if len(chars) and not blank[0]:
+        starts = np.concatenate(([0], starts))
+    line = np.searchsorted(np.flatnonzero(chars == ord('\n')), starts)
+    counts = np.bincount(line)
+    counts = counts[counts > 0]
+    if counts.sum() != len(values):
+        raise ValueError('touchstone data section contains a non numeric value')
+    return option, values, counts
+
+def load_touchstone_data(filepath: Path):
+    """
+    Raw numeric content of a touchstone file: (option line, flat float64 values,
+    values per data line).
+    A content hashed .npz cache is written next to the file so repeated loads
+    skip parsing, and results are also kept in memory until the file changes.
+    """
+    path = Path(filepath)
+    st = path.stat()
+    key = str(path.resolve())
+    stamp = (st.st_mtime_ns, st.st_size)
+    memo = _PARSED.get(key)
+    if memo is not None and memo[0] == stamp:
+        return memo[1]
+    raw = path.read_bytes()
+    digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+    cache = path.with_name(path.name + '.npz')
+    result = None
+    if cache.exists():
+        try:
+            with np.load(cache) as z:
+                if str(z['digest']) == digest:
+                    result = (str(z['option']), z['values'], z['counts'])
+        except (OSError, KeyError, ValueError):
+            result = None #corrupt or old cache, reparse
+    if result is None:
+        result = _parse_touchstone(raw)
+        option, values, counts = result
+        try:
+            np.savez(cache, digest=digest, option=option, values=values, counts=counts)
+        except OSError:
+            pass #read only location, memory cache still applies
+    _PARSED[key] = (stamp, result)
+    return result
+
+def parse_option_line(option: str):
+    """
+    Touchstone v1 option line '# <unit> <parameter> <format> R <z0>'.
+    Missing fields take the spec defaults: GHz, S, MA, R 50.
+    Returns (frequency scale to Hz, parameter, format, z0)
+    """
+    fields = option.lstrip('#').upper().split()
+    scale, parameter, fmt, z0 = 1e9, 'S', 'MA', 50.0
+    i = 0
+    while i < len(fields):
+        f = fields[i]
+        if f in FREQ_UNITS:
+            scale = FREQ_UNITS[f]
+        elif f in ('S', 'Y', 'Z', 'H', 'G'):
+            parameter = f
+        elif f in ('MA', 'DB', 'RI'):
+            fmt = f
+        elif f == 'R' and i + 1 < len(fields):
+            z0 = float(fields[i + 1])
+            i += 1
+        else:
+            raise ValueError(f'Unknown touchstone option: {f}')
+        i += 1
+    return scale, parameter, fmt, z0
+
+def read_touchstone(filepath: Path, n_ports: int = None):
+    """
+    Read any touchstone v1 file (.s1p, .s2p, ... .sNp).
+    Honours the option line (frequency unit, parameter type, MA/DB/RI, reference impedance).
+    Args:
+        filepath: path to the file
+        n_ports: number of ports, taken from the extension when omitted
+    Returns:
+        freqs (Hz), matrix (n_freq, n_ports, n_ports) complex128, z0, parameter ('S', 'Y', ...)
+        matrix[:, i, j] is N(i+1)(j+1), e.g. S21 = matrix[:, 1, 0]
+    """
+    path = Path(filepath)
+    if n_ports is None:
+        ext = path.suffix.lower()
+        if not (ext.startswith('.s') and ext.endswith('p') and ext[2:-1].isdigit()):
+            raise ValueError(f'Cannot infer port count from {path.name}, pass n_ports')
+        n_ports = int(ext[2:-1])
+    option, values, counts = load_touchstone_data(path)
+    scale, parameter, fmt, z0 = parse_option_line(option)
+    per_point = 1 + 2 * n_ports * n_ports
+    if n_ports == 2 and len(counts) and np.any(counts != per_point):
+        #2-port files may end with a noise parameter block (5 values per line)
+        first_noise = int(np.argmax(counts != per_point))
+        values = values[:int(np.sum(counts[:first_noise]))]
+    if len(values) % per_point:
+        raise ValueError(f'{path.name}: {len(values)} values is not a multiple of {per_point}')
+    data = values.reshape(-1, per_point)
+    freqs = data[:, 0] * scale
+    pairs = data[:, 1:].reshape(len(data), n_ports * n_ports, 2)
+    a, b = pairs[..., 0], pairs[..., 1]
+    if fmt == 'RI':
+        matrix = a + 1j * b
+    else:
+        mag = a if fmt == 'MA' else 10 ** (a / 20)
+        matrix = mag * np.exp(1j * np.deg2rad(b))
+    matrix = matrix.reshape(len(data), n_ports, n_ports)
+    if n_ports == 2:
+        #2-port data is stored N11 N21 N12 N22, every other size row by row
+        matrix = matrix.transpose(0, 2, 1)
+    return freqs, matrix, z0, parameter
+
 def read_s2p(filepath: Path):
     """
     Read S-parameter data from a .s2p file.
     Returns freqs, s11, s41, s44
     """
-    data = []
-    with open(filepath, "r") as f:
-        for line in f:
-            if line.startswith("!") or line.startswith("#") or not line.strip():
-                continue
-            parts = line.split()
-            freq = float(parts[0])
-            # Columns: Freq, S11 Re/Im, S41 Re/Im, S14 Re/Im, S44 Re/Im
-            s11 = complex(float(parts[1]), float(parts[2]))
-            s41 = complex(float(parts[3]), float(parts[4]))
-            s44 = complex(float(parts[7]), float(parts[8]))
-            data.append((freq, s11, s41, s44))
-    data = np.array(data, dtype=object)
-    freqs = np.array([d[0] for d in data])
-    s11 = np.array([d[1] for d in data])
-    s41 = np.array([d[2] for d in data])
-    s44 = np.array([d[3] for d in data])
-    return freqs, s11, s41, s44
-
-
-def get_phase_at_freq() -> np.ndarray:
+    # Columns: Freq, S11, S41, S14, S44 -> ports 1 and 2 of the file are VNA ports 1 and 4
+    freqs, s, _, _ = read_touchstone(filepath, n_ports=2)
+    return freqs, s[:, 0, 0], s[:, 1, 0], s[:, 1, 1]
+
+
+class CalibrationTable:
+    '''
+    S41 of every port across the whole measured band, loaded once.
+    Phase is stored unwrapped so it can be linearly interpolated at any
+    frequency inside the band (binary search, O(log n) per lookup).
+    Args:
+        directory: folder with Port1.s2p ... PortN.s2p
+        n_ports (int): number of ports
+    '''
+    def __init__(self, directory: Path = s2p_dir, n_ports: int = 16):
+        self.directory = Path(directory)
+        freqs = None
+        phase, amplitude = [], []
+        for i in range(1, n_ports + 1):
+            f, _, s41, _ = read_s2p(self.directory / f"Port{i}.s2p")
+            if freqs is None:
+                freqs = f
+            elif not np.array_equal(f, freqs):
+                #resample onto the first port's frequency axis
+                s41 = (np.interp(freqs, f, np.abs(s41))
+                       * np.exp(1j * np.interp(freqs, f, np.unwrap(np.angle(s41)))))
+            phase.append(np.rad2deg(np.unwrap(np.angle(s41))))
+            amplitude.append(np.abs(s41))
+        self.freqs = freqs
+        self.phase = np.array(phase)          #(n_ports, n_freq) unwrapped degrees
+        self.amplitude = np.array(amplitude)  #(n_ports, n_freq) linear |S41|
+
+    def _interp(self, table: np.ndarray, freq: float) -> np.ndarray:
+        if not self.freqs[0] <= freq <= self.freqs[-1]:
+            raise ValueError(f'{freq/1e9:.4f} GHz is outside the measured band '
+                             f'{self.freqs[0]/1e9:.4f}-{self.freqs[-1]/1e9:.4f} GHz')
+        i = int(np.clip(np.searchsorted(self.freqs, freq), 1, len(self.freqs) - 1))
+        f0, f1 = self.freqs[i - 1], self.freqs[i]
+        w = (freq - f0) / (f1 - f0)
+        return (1 - w) * table[:, i - 1] + w * table[:, i]
+
+    def phases(self, freq: float = FREQ) -> np.ndarray:
+        '''S41 phase of each port at freq, wrapped to (-180, 180] degrees'''
+        return 180 - (180 - self._interp(self.phase, freq)) % 360
+
+    def amplitudes(self, freq: float = FREQ) -> np.ndarray:
+        '''linear |S41| of each port at freq'''
+        return self._interp(self.amplitude, freq)
+
+    def offsets(self, freq: float = FREQ) -> np.ndarray:
+        '''
+        Phase offsets (degrees) that equalize all ports at freq.
+        The longest port (most negative phase) is the reference with offset 0.
+        '''
+        phases = self.phases(freq)
+        return phases - np.min(phases)
+
+
+#tables already loaded, keyed by directory
+_TABLES = {}
+
+def get_calibration_table(directory: Path = s2p_dir) -> CalibrationTable:
+    '''CalibrationTable for directory, reloaded only when one of its files changes'''
+    directory = Path(directory)
+    stamp = tuple((p.name, p.stat().st_mtime_ns) for p in sorted(directory.glob('Port*.s2p')))
+    entry = _TABLES.get(directory)
+    if entry is None or entry[0] != stamp:
+        entry = (stamp, CalibrationTable(directory))
+        _TABLES[directory] = entry
+    return entry[1]
+
+
+def get_phase_at_freq(freq: float = FREQ) -> np.ndarray:
     '''
     Direct helper function for main code.
-    Get the phase at FREQ for each port and return the array of these phases (degrees).
+    Get the phase at freq for each port and return the array of these phases (degrees).
     '''
-    phases = []
-    for i in range(1, 17):
-        file = s2p_dir / f"Port{i}.s2p"
-        freqs, _, s41, _ = read_s2p(file)
-        # Find the closest frequency index
-        idx = np.argmin(np.abs(freqs - FREQ))
-        phase_deg = np.angle(s41[idx], deg=True)
-        phases.append(phase_deg)
-    return np.array(phases)
+    return get_calibration_table().phases(freq)
 
 
 # ---- For Plotting Purposes ----
@@ -0,0 +1,149 @@
+'''
+Quantization aware beam synthesis for the 8-bit PE44280 phase words.
+
+send_phases() rounds every element to the nearest of the 256 states on its
+own. For progressive steering phases the rounding errors are periodic across
+the aperture and add up to quantization lobes at some angles. Here the words
+themselves are chosen to keep the quantized pattern close to the ideal one:
+
+    1. randomized rounding: every element is rounded up with probability equal
+       to its fractional part, SYNTH_CANDIDATES draws plus plain rounding are
+       scored in one batched array factor evaluation
+    2. local search: from the best draws, every +-1 LSB change of a single
+       element is scored at once (a rank one update of the array factor) and
+       the best improving move is taken until none improves, or SYNTH_MAX_STEPS
+
+Score (lower is better), the peak quantization error:
+    max over directions |AF_quantized - AF_ideal|^2 relative to the ideal main lobe (dB)
+AF_ideal uses the unquantized phases, so only the error introduced by the
+256 states is minimized. The sidelobes the ideal taper already has are left
+alone, this is not general sidelobe shaping. The error is checked in the
+steering direction and on a uv grid covering visible space (SYNTH_UV_STEP),
+the visible grid is built once per spacing and cached.
+
+Usage (a few ms, run it off the event loop):
+    words, report = await asyncio.to_thread(synthesize_words, phases, theta, phi, DX, DY, PHASE_OFFSETS)
+'''
+import functools
+import numpy as np
+from config import NSIDE, NUM_ELEMENTS, SYNTH_UV_STEP, SYNTH_CANDIDATES, SYNTH_MAX_STEPS
+from mcu_protocol import quantize_phases
+
+LSB = 360 / 256
+#local search continues from this many of the best randomized roundings
+SEARCH_STARTS = 2
+
+
+@functools.lru_cache(maxsize=8)
+def _visible_grid(dx: float, dy: float) -> tuple:
+    '''
+    uv directions covering visible space and their element steering vectors
+    Returns:
+        (u, v, g): g (n, NUM_ELEMENTS) complex64
+    '''
+    axis = np.arange(-1, 1 + SYNTH_UV_STEP / 2, SYNTH_UV_STEP)
+    u, v = (a.ravel() for a in np.meshgrid(axis, axis, indexing='ij'))
+    visible = u**2 + v**2 <= 1
+    u, v = u[visible], v[visible]
+    return u, v, _steering(dx, dy, u, v)
+
+
+def _steering(dx: float, dy: float, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    M, N = np.meshgrid(np.arange(NSIDE), np.arange(NSIDE), indexing='ij')
+    #same geometry and element order as AF_Calc.element_array_factor
+    geo = 2 * np.pi * (dx * np.outer(u, M.ravel()) + dy * np.outer(v, N.ravel()))
+    return np.exp(1j * geo).astype(np.complex64)
+
+
+def _evaluation_grid(dx: float, dy: float, u0: float, v0: float) -> np.ndarray:
+    '''
+    element steering vectors towards the target (row 0) and visible space
+    Returns:
+        g (1 + n, NUM_ELEMENTS) complex64, g[0] is the target direction
+    '''
+    _, _, g = _visible_grid(dx, dy)
+    return np.vstack([_steering(dx, dy, np.array([u0]), np.array([v0])), g])
+
+
+def _error_db(af: np.ndarray, ideal: np.ndarray) -> np.ndarray:
+    '''peak quantization error of array factors af (..., 1 + n) in dB relative to the ideal main lobe'''
+    error = np.abs(af - ideal)**2
+    main = max(float(np.abs(ideal[0])**2), 1e-30)
+    return 10 * np.log10(np.maximum(error.max(axis=-1), 1e-30) / main)
+
+
+def _gain_db(af: np.ndarray) -> float:
+    '''main lobe gain relative to a perfectly phased array'''
+    return float(10 * np.log10(max(float(np.abs(af[0])**2), 1e-30) / NUM_ELEMENTS**2))
+
+
+def synthesize_words(phases: np.ndarray, theta: float, phi: float, dx: float, dy: float,
+                     offsets=0, seed: int = 0) -> tuple:
+    '''
+    hardware words for a steer request, searched over the quantized states
+    Args:
+        phases (np.ndarray): ideal NUM_ELEMENTS phases in degrees (e.g. runAF_Calc)
+        theta, phi (float): steering direction in degrees
+        dx, dy (float): element spacing (fraction of wavelength)
+        offsets: calibration offsets (degrees) added before quantizing, like send_phases
+    Returns:
+        (words, report): NUM_ELEMENTS uint8 words, dict with the peak quantization
+        'error_db' and main lobe 'gain_db' of the result and of plain rounding
+        ('rounded_error_db', 'rounded_gain_db') and the number of local search 'steps'
+    '''
+    theta_r, phi_r = np.deg2rad(theta), np.deg2rad(phi)
+    u0 = round(float(np.sin(theta_r) * np.cos(phi_r)), 6)
+    v0 = round(float(np.sin(theta_r) * np.sin(phi_r)), 6)
+    g = _evaluation_grid(float(dx), float(dy), u0, v0)
+    phases = np.asarray(phases, dtype=float)
+    offsets = np.broadcast_to(np.asarray(offsets, dtype=float), (NUM_ELEMENTS,))
+    #word w puts phase w*LSB - offset on the element
+    exact = ((phases + offsets) % 360) / LSB
+    rounded = quantize_phases(phases, offsets).astype(np.int64)
+    ideal = np.exp(1j * np.deg2rad(phases)).astype(np.complex64) @ g.T
+
+    def phasors(words):
+        return np.exp(1j * np.deg2rad(words * LSB - offsets)).astype(np.complex64)
+
+    rng = np.random.default_rng(seed)
+    frac = exact - np.floor(exact)
+    draws = np.floor(exact) + (rng.random((SYNTH_CANDIDATES, NUM_ELEMENTS)) < frac)
+    candidates = np.vstack([rounded, draws.astype(np.int64) % 256])
+    #one batched evaluation of every candidate against every direction
+    scores = _error_db(phasors(candidates) @ g.T, ideal)
+    order = np.argsort(scores)[:SEARCH_STARTS]
+
+    moves = np.concatenate([np.eye(NUM_ELEMENTS, dtype=np.int64), -np.eye(NUM_ELEMENTS, dtype=np.int64)])
+    element = np.concatenate([np.arange(NUM_ELEMENTS)] * 2)
+    step = np.exp(1j * np.deg2rad(moves.sum(axis=1) * LSB)).astype(np.complex64)
+    g_moves = np.ascontiguousarray(g.T[element]) #(32, 1 + n) steering row of each move
+    best_words, best_score, steps = None, np.inf, 0
+    for start in order:
+        words = candidates[start].copy()
+        x = phasors(words)
+        af = x @ g.T
+        score = scores[start]
+        for _ in range(SYNTH_MAX_STEPS):
+            #all 32 single element +-1 LSB moves as rank one updates of af
+            delta = x[element] * (step - 1)
+            trial = af[None, :] + delta[:, None] * g_moves
+            trial_scores = _error_db(trial, ideal)
+            k = np.argmin(trial_scores)
+            if trial_scores[k] >= score - 1e-9:
+                break #local optimum
+            words = (words + moves[k]) % 256
+            x[element[k]] *= step[k]
+            af = trial[k]
+            score = trial_scores[k]
+            steps += 1
+        if score < best_score:
+            best_words, best_score = words, score
+
+    best_af = phasors(best_words) @ g.T
+    rounded_af = phasors(rounded) @ g.T
+    report = {
+        'error_db': float(_error_db(best_af, ideal)), 'gain_db': _gain_db(best_af),
+        'rounded_error_db': float(_error_db(rounded_af, ideal)), 'rounded_gain_db': _gain_db(rounded_af),
+        'steps': steps,
+    }
+    return best_words.astype(np.uint8), report
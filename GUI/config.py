@@ -1,6 +1,8 @@
+import os
 import numpy as np
 #contains constants used throughout the program
 BAUDRATE = 115200 
+FAST_BAUDRATE = 1000000 #negotiated after connecting, exact on the 16 MHz Mega; only the Mega sketch supports it, BAUDRATE to disable
 C = 299792458 #m/s 
 FREQ = int(2.1e9)
 LAMBDA = C/FREQ
@@ -25,7 +27,27 @@ THETA_RANGE = np.linspace(0,45, num_theta)
 PHI_RANGE = np.linspace(0, 360, num_phi, endpoint=False)
 #Total of 256 locations to scan through
 
+#quantization aware beam synthesis (transmit mode)
+SYNTH_UV_STEP = 0.04 #uv spacing of the directions the quantization error is checked at
+SYNTH_CANDIDATES = 64 #randomized roundings evaluated per request
+SYNTH_MAX_STEPS = 40 #+-1 LSB local search moves before giving up
+
+#over the air calibration (reference antenna at boresight)
+OTA_METHOD = 'hadamard' #'hadamard' (groups of elements) or 'rev' (one element at a time)
+OTA_REPEATS = 4 #captures averaged per pattern
+OTA_CODED_PATTERNS = 40 #random 0/90/180/270 patterns added to the Hadamard set
+
+#adaptive (coarse to fine) DOA search
+ADAPTIVE_COARSE_THETA = 4 #0,15,30,45
+ADAPTIVE_COARSE_PHI = 8 #every 45 degrees
+ADAPTIVE_RESOLUTION = 1 #degrees, stop refining below this step
+
+#every scan and experiment run is appended here (see experiment_store.py)
+EXPERIMENT_FILE = 'experiments.h5'
+
 #PLUTO config
+PLUTO_URI = "ip:192.168.2.1"
+PLUTO_TIMEOUT = 2.0 #seconds to wait for the SDR before giving up (reconnect from the landing page)
 BASE_BAND = 100e3
 SAMP_RATE = 5e6  # Hz e.g. 5 MHz
 TX_GAIN = -1 # 0 is the maximum transmit power -90 is 90 dB attenuation from max
@@ -34,6 +56,17 @@ RX_GAIN =30 #adjust as needed 0-74
 #4 ms to fill buffer
 BUFFER_SIZE = 4*2048 
 NUM_AVG = 1
+CAPTURE_BATCH = 25 #buffers per batched read (one sdr.rx() of CAPTURE_BATCH*BUFFER_SIZE samples)
+RX_KERNEL_BUFFERS = 2 #rx buffers the driver queues ahead, a buffer returned after a latch can be this many buffers old
+SCAN_SETTLE = 100e-6 #s after a confirmed latch before the phase shifters count as settled
+#'mean_square': total in band power (the scale every plot range and saved result uses)
+#'tone': power in the BASE_BAND bin only, opt in, its values are on a different scale
+POWER_ESTIMATOR = 'mean_square'
+TONE_WINDOW = True #Hann window the tone estimator (lower leakage from spurs)
+TONE_SEGMENTS = 8 #sub blocks used for the tone power spread in get_mean_dev
+STREAM_BLOCKS = 64 #ring buffer depth of the background rx stream (~100 ms)
+ENERGY_RATE = 20 #Hz, energy samples published to the live plots
+LIVE_PLOT_POINTS = 100 #samples kept per live plot
 SETTLE_TIME = 1 #time to transmit before capturing burst
 
 OAM_PHASES = np.array([
@@ -45,3 +78,18 @@ OAM_PHASES = np.array([
 
 #calibration directory
 S2PDIR = 'S2P_JUNE_12'
+
+#array factor images on the transmit page
+#'fast': colormap LUT raster encoded with PIL (tens of ms), 'matplotlib': 3D surface + UV plot at 300 dpi
+AF_RENDER_MODE = 'fast'
+AF_RENDER_SIZE = 480 #pixels, side of the fast UV image
+#interactive (plotly) views: theta/phi map decimation and UV raster side
+AF_VIEW_STEP = 4 #600x300 grid -> 150x75
+AF_VIEW_SIZE = 160
+
+#simulated hardware (see simulation.py), no Pluto or MCU needed
+SIMULATE = os.environ.get('PHASED_ARRAY_SIM', '0') == '1'
+SIM_EMITTERS = [(20, 100, 100.0)] #(theta deg, phi deg, amplitude per element)
+SIM_NOISE = 10.0 #rms noise per IQ sample
+SIM_PHASE_ERRORS = np.zeros(NUM_ELEMENTS) #per element phase error (deg) of the simulated array
+SIM_REALTIME = False #sleep for buffer and wire time like the real hardware
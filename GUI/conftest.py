@@ -0,0 +1,28 @@
+'''
+Shared pytest fixtures, tests run against the simulated backends (no hardware).
+pytest runs from GUI/ and the modules are imported flat like main.py does.
+'''
+import numpy as np
+import pytest
+import mcu_protocol as mp
+from config import NUM_ELEMENTS
+from simulation import LoopbackMCU
+
+#test_pluto.py is a hardware smoke script (needs a PLUTO), not a test
+collect_ignore = ['test_pluto.py']
+
+
+@pytest.fixture
+def loopback():
+    '''(LoopbackMCU, McuLink) pair without wire delays'''
+    mcu = LoopbackMCU(realtime=False)
+    return mcu, mp.McuLink(mcu)
+
+
+@pytest.fixture
+def random_words():
+    '''random_words(seed, n=None): hardware phase words, one state or (n, NUM_ELEMENTS)'''
+    def make(seed: int, n: int = None) -> np.ndarray:
+        shape = (NUM_ELEMENTS,) if n is None else (n, NUM_ELEMENTS)
+        return np.random.default_rng(seed).integers(0, 256, shape, dtype=np.uint8)
+    return make
@@ -1,5 +1,25 @@
 from config import THETA_RANGE, PHI_RANGE, NSIDE, DX,DY
 import numpy as np
+def steering_phases(theta_deg: np.ndarray, phi_deg: np.ndarray, dx: float, dy: float) -> np.ndarray:
+    '''
+    phase shift rows that steer the array to arbitrary (theta, phi) directions
+    args:
+        theta_deg, phi_deg (np.ndarray): directions in degrees, same shape
+        dx,dy(float): element spacing
+    returns:
+    phases (np.ndarray): shape = (theta_deg.size, num_elements) in degrees 0-360
+    '''
+    theta = np.deg2rad(np.ravel(theta_deg))
+    phi = np.deg2rad(np.ravel(phi_deg))
+    beta_x = -2 * np.pi * dx * np.sin(theta) * np.cos(phi)
+    beta_y = -2 * np.pi * dy * np.sin(theta) * np.sin(phi)
+    nx_idx = np.arange(NSIDE)
+    ny_idx = np.arange(NSIDE)
+    # shape: (n_dirs, nside, nside), element index = nx*NSIDE + ny
+    total_phase = (nx_idx[None, :, None] * beta_x[:, None, None] +
+        ny_idx[None, None, :] * beta_y[:, None, None])
+    return (np.degrees(total_phase) % 360).reshape(len(theta), NSIDE * NSIDE)
+
 def create_default_rx_search_grid(dx: float, dy: float)->None:
     '''
     compute a list of phase shift lists for each search loaction for rx doa est.
@@ -10,26 +30,16 @@ def create_default_rx_search_grid(dx: float, dy: float)->None:
     phases (np.ndarray): vshape = (len(theta_range)*len(phi_range), num_elements)
     each row = num_elements phase values
     '''
-    theta = np.deg2rad(THETA_RANGE)
-    phi = np.deg2rad(PHI_RANGE)
-    theta,phi = np.meshgrid(theta, phi, indexing='ij')
-    #compute betas 
-    beta_x = -2 * np.pi * dx * np.sin(theta) * np.cos(phi) 
-    beta_y = -2 * np.pi * dy * np.sin(theta) * np.sin(phi)
-    #element indexing
-    nx_idx = np.arange(NSIDE)
-    ny_idx = np.arange(NSIDE)
-
-    # compute total phase shift (broadcasted)
-    # shape: (nside, nside, len(theta), len(phi))
-    total_phase = (nx_idx[:, None, None, None] * beta_x[None,None, :, :] +
-        ny_idx[None, :, None, None] * beta_y[None, None, None, :])
-
-    # convert to degrees and wrap to 0–360
-    phases_deg = np.degrees(total_phase) % 360
-    return phases_deg.reshape(NSIDE * NSIDE, -1).T
+    theta,phi = np.meshgrid(THETA_RANGE, PHI_RANGE, indexing='ij')
+    return steering_phases(theta, phi, dx, dy)
 
-DEFAULT_RX_GRID = create_default_rx_search_grid(DX,DY)
+def __getattr__(name: str):
+    #DEFAULT_RX_GRID is built on first access instead of at import
+    if name == 'DEFAULT_RX_GRID':
+        grid = create_default_rx_search_grid(DX,DY)
+        globals()['DEFAULT_RX_GRID'] = grid
+        return grid
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 #debug
 '''
 for i, phase_row in enumerate(default_rx_grid):
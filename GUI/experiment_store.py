@@ -0,0 +1,201 @@
+'''
+Persistent store for scan and experiment results (HDF5 through h5py).
+
+Every measurement is appended as one run so results survive server restarts
+and hundreds of scans can be analyzed later without measuring again.
+
+File layout (EXPERIMENT_FILE):
+    /index              one row per run: run_id, kind, label, started,
+                        finished, n_states (resizable, chunked)
+    /runs/<run_id>/     one group per run
+        <name>          one dataset per array (columnar: e.g. 'energy', 'theta',
+                        'phi'), read independently; chunked and compressed
+                        from CHUNK_MIN elements up
+        offsets         calibration offsets (degrees) used for the run
+        attrs           kind, label, started, finished, meta (json) and
+                        config (json snapshot of config.py)
+
+Queries only read /index; arrays are read on demand.
+
+Usage:
+    run_id = STORE.append('rx_scan', {'energy': energies, 'theta': THETA_RANGE,
+                          'phi': PHI_RANGE}, offsets=PHASE_OFFSETS, started=t0)
+    runs = STORE.list_runs(kind='rx_scan')
+    energies = STORE.stack(runs['run_id'], 'energy')   # (n_runs, n_states)
+    diff = STORE.compare(runs['run_id'][-2], runs['run_id'][-1])
+'''
+import json
+import os
+import threading
+import time
+import numpy as np
+import config
+from config import EXPERIMENT_FILE
+from lazy_imports import lazy_import
+
+#only needed once something is stored or loaded
+h5py = lazy_import('h5py')
+
+#arrays smaller than this are stored contiguous, chunk indexing would outweigh them
+CHUNK_MIN = 4096
+INDEX_DTYPE = np.dtype([
+    ('run_id', np.int64),
+    ('kind', 'S32'),
+    ('label', 'S64'),
+    ('started', np.float64),
+    ('finished', np.float64),
+    ('n_states', np.int64),
+])
+
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return repr(value)
+
+
+def config_snapshot() -> str:
+    '''json of every upper case setting in config.py'''
+    settings = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+    return json.dumps(settings, default=_json_default)
+
+
+class ExperimentStore:
+    '''
+    Append only store of measurement runs in one HDF5 file.
+    The file is opened per call, so nothing stays open between runs and the
+    store is safe to use from worker threads (asyncio.to_thread).
+    Args:
+        path (str): HDF5 file, created on the first append
+    '''
+    def __init__(self, path: str = EXPERIMENT_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, kind: str, arrays: dict, offsets=None, label: str = '',
+               started: float = None, meta: dict = None) -> int:
+        '''
+        Store one run.
+        Args:
+            kind (str): run type, e.g. 'rx_scan', 'burst', 'ts_noise'
+            arrays (dict): name -> array like, one dataset each
+            offsets: calibration offsets (degrees) in use, stored with the run
+            label (str): free text, e.g. the trial name
+            started (float): unix time the measurement began (default: now)
+            meta (dict): json serializable extras (e.g. dx, dy, sample interval)
+        Returns:
+            int: run_id
+        '''
+        finished = time.time()
+        started = finished if started is None else started
+        arrays = {name: np.asarray(value) for name, value in arrays.items()}
+        n_states = max((a.shape[0] for a in arrays.values() if a.ndim), default=1)
+        with self._lock, h5py.File(self.path, 'a', libver='latest') as f:
+            if 'index' not in f:
+                f.create_dataset('index', shape=(0,), maxshape=(None,), dtype=INDEX_DTYPE, chunks=(256,))
+            index = f['index']
+            #groups left behind by a crash are skipped, not overwritten
+            used = [int(name) for name in f['runs']] if 'runs' in f else []
+            run_id = max([int(index[-1]['run_id']) if len(index) else -1] + used) + 1
+            group = f.create_group(f'runs/{run_id}')
+            try:
+                for name, a in arrays.items():
+                    if a.size < CHUNK_MIN:
+                        group.create_dataset(name, data=a)
+                    else:
+                        group.create_dataset(name, data=a, chunks=True, compression='gzip', shuffle=True)
+                if offsets is not None:
+                    group.create_dataset('offsets', data=np.asarray(offsets, dtype=float))
+                group.attrs['kind'] = kind
+                group.attrs['label'] = label
+                group.attrs['started'] = started
+                group.attrs['finished'] = finished
+                group.attrs['meta'] = json.dumps(meta or {}, default=_json_default)
+                group.attrs['config'] = config_snapshot()
+            except BaseException:
+                #a failed write must not leave a partial run behind
+                del f[f'runs/{run_id}']
+                raise
+            row = np.array([(run_id, kind.encode(), label.encode()[:64], started, finished, n_states)],
+                           dtype=INDEX_DTYPE)
+            #the index row is written last, a run is only listed once complete
+            index.resize((len(index) + 1,))
+            index[-1] = row[0]
+        return run_id
+
+    def list_runs(self, kind: str = None, label: str = None, since: float = None,
+                  until: float = None) -> np.ndarray:
+        '''
+        Runs matching every given filter, oldest first.
+        Returns:
+            np.ndarray with INDEX_DTYPE fields (kind and label as bytes)
+        '''
+        if not os.path.exists(self.path):
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        with self._lock, h5py.File(self.path, 'r') as f:
+            runs = f['index'][:] if 'index' in f else np.zeros(0, dtype=INDEX_DTYPE)
+        keep = np.ones(len(runs), dtype=bool)
+        if kind is not None:
+            keep &= runs['kind'] == kind.encode()
+        if label is not None:
+            keep &= runs['label'] == label.encode()
+        if since is not None:
+            keep &= runs['started'] >= since
+        if until is not None:
+            keep &= runs['started'] <= until
+        return runs[keep]
+
+    def load(self, run_id: int, names=None) -> dict:
+        '''
+        Arrays of one run plus its attributes.
+        Args:
+            names: datasets to read (default: all)
+        Returns:
+            dict: name -> np.ndarray, 'offsets' if stored, and 'kind', 'label',
+            'started', 'finished', 'meta' (dict), 'config' (dict)
+        '''
+        with self._lock, h5py.File(self.path, 'r') as f:
+            group = f[f'runs/{int(run_id)}']
+            names = list(group.keys()) if names is None else names
+            run = {name: group[name][()] for name in names}
+            for key in ('kind', 'label', 'started', 'finished'):
+                run[key] = group.attrs[key]
+            run['meta'] = json.loads(group.attrs['meta'])
+            run['config'] = json.loads(group.attrs['config'])
+        return run
+
+    def stack(self, run_ids, name: str = 'energy') -> np.ndarray:
+        '''
+        One dataset from many runs in a single file open, e.g. for batch analysis
+        Returns:
+            np.ndarray (len(run_ids), ...), the runs must have the same shape
+        '''
+        with self._lock, h5py.File(self.path, 'r') as f:
+            return np.stack([f[f'runs/{int(r)}/{name}'][()] for r in run_ids])
+
+    def compare(self, run_a: int, run_b: int, name: str = 'energy') -> dict:
+        '''
+        Compare one dataset of two runs (b - a).
+        Returns:
+            dict: 'difference' array, 'rms' difference, 'correlation' of the two
+            arrays and 'peak_a' / 'peak_b' (flat index of each maximum)
+        '''
+        a, b = self.stack([run_a, run_b], name).astype(float)
+        difference = b - a
+        if a.size > 1 and a.std() > 0 and b.std() > 0:
+            correlation = float(np.corrcoef(a.ravel(), b.ravel())[0, 1])
+        else:
+            correlation = float('nan')
+        return {
+            'difference': difference,
+            'rms': float(np.sqrt(np.mean(difference**2))),
+            'correlation': correlation,
+            'peak_a': int(np.argmax(a)),
+            'peak_b': int(np.argmax(b)),
+        }
+
+
+#shared by every page
+STORE = ExperimentStore()
@@ -0,0 +1,75 @@
+'''
+Deferred imports for the heavy optional libraries (matplotlib, plotly, PIL, adi).
+
+    plt = lazy_import('matplotlib.pyplot')
+
+binds a placeholder that imports the module on first attribute access, so
+modules can keep their usual top level names while the GUI starts without
+paying for libraries a page may never use. warm_up() imports them ahead of
+time from a background thread once the server is up.
+'''
+import importlib, threading
+
+
+class LazyModule:
+    '''stands in for a module until one of its attributes is used'''
+    def __init__(self, name: str):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+        self.__dict__['_lock'] = threading.Lock()
+
+    def load(self):
+        '''import the module (once) and return it'''
+        module = self.__dict__['_module']
+        if module is None:
+            with self.__dict__['_lock']:
+                module = self.__dict__['_module']
+                if module is None:
+                    module = importlib.import_module(self.__dict__['_name'])
+                    self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.load(), attr, value)
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return f"<lazy module '{self.__dict__['_name']}' ({state})>"
+
+
+_LAZY = {}
+
+def lazy_import(name: str) -> LazyModule:
+    '''placeholder for module name, shared by every caller'''
+    module = _LAZY.get(name)
+    if module is None:
+        module = _LAZY.setdefault(name, LazyModule(name))
+    return module
+
+
+def warm_up(names, *tasks) -> threading.Thread:
+    '''
+    import the given modules in a daemon thread, then run tasks
+    Args:
+        names: module names, e.g. ['matplotlib.pyplot', 'plotly.graph_objects']
+        *tasks: callables run afterwards (e.g. precomputing grids)
+    Returns:
+        threading.Thread: the started thread
+    '''
+    def run():
+        for name in names:
+            try:
+                lazy_import(name).load()
+            except ImportError as e:
+                print(f'Warm up: {name} unavailable ({e})')
+        for task in tasks:
+            try:
+                task()
+            except Exception as e:
+                print(f'Warm up: {getattr(task, "__name__", task)} failed ({e})')
+    thread = threading.Thread(target=run, daemon=True, name='warm-up')
+    thread.start()
+    return thread
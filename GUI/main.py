@@ -25,23 +25,38 @@
 ===============================================================================
 """
 #import all necessary libraries
-import time, serial, struct, serial.tools.list_ports, json, os
+import time
+#startup timing, reported once the server is up and when the first page is built
+T_START = time.perf_counter()
+import serial, struct, serial.tools.list_ports, json, os, threading, functools
 from nicegui import ui,app
 import numpy as np 
-from config import OAM_PHASES,BAUDRATE, DX, DY, THETA_RANGE, PHI_RANGE, FREQ,SETTLE_TIME
-import matplotlib
-import matplotlib.pyplot as plt
+from config import OAM_PHASES,BAUDRATE,FAST_BAUDRATE, DX, DY, THETA_RANGE, PHI_RANGE, FREQ,SETTLE_TIME, SIMULATE, ENERGY_RATE
 import asyncio
-from AF_Calc import runAF_Calc
-from READ_S2P import get_phase_at_freq
-from create_default_rx_grid import DEFAULT_RX_GRID
-from PLUTO import get_energy,get_mean_dev, get_energy_fast,discard_buffer, tx, stop_tx, moving_average
+from lazy_imports import warm_up
+import matplotlib.pyplot as plt #nicegui imports matplotlib and plotly itself, deferring them saves nothing
 import plotly.graph_objects as go
+from AF_Calc import runAF_Calc, af_view_data, af_view_axes, af_plotly_colorscale, get_af_grid
+from READ_S2P import get_calibration_table
+import create_default_rx_grid as rx_grid #DEFAULT_RX_GRID is built on first access
+import PLUTO
+from PLUTO import get_energy,get_mean_dev, get_energy_fast,discard_buffer, tx, stop_tx, moving_average, capture, buffer_power, ENERGY, run_sdr, collect_energies, discard_buffers
+from scan_engine import PipelinedScan, adaptive_search
+from ota_calibration import ota_calibrate, apply_correction
+from beam_synthesis import synthesize_words
+from frame_cache import FRAME_CACHE, quantize_frames, steering_row
+from experiment_store import STORE
+from mcu_protocol import McuLink, DeltaLink, SerialTransport, PhaseTable, negotiate_baud, quantize_phases, encode_set_phases, frame_time
 MEDIA_DIR = os.path.join(os.path.dirname(__file__), 'media')
 #global serial handler
 ser = None
+LINK = None #framed link to the MCU, see mcu_protocol.py
+TRANSPORT = None #writer thread in front of LINK, all commands go through it
+PHASE_TABLE = None #phase table resident on the MCU
 #Phase offsets stored globally to be used across the program
 PHASE_OFFSETS =np.zeros(16,dtype=float)
+#FRAME_CACHE key of the default receive grid (THETA_RANGE x PHI_RANGE)
+RX_GRID_KEY = ('rx_grid', DX, DY)
 #flag to tell the user to calibrate if they haven't already
 PHASE_CORRECTED = False 
 #store reference to phase_input number boxes
@@ -96,23 +111,55 @@ def use_calibration_file(filename:str):
         ui.notify(f"no calibration file: {filename}.json found")
 
 
-def gen_Cal_from_S2P() -> None:
+async def gen_Cal_OTA() -> None:
+    """
+    Over the air calibration: with a reference antenna at boresight, coded phase
+    patterns are measured with the PLUTO and the per element phase errors fitted
+    (see ota_calibration.py). The correction is added to the current PHASE_OFFSETS.
+    """
+    global PHASE_OFFSETS, PHASE_CORRECTED
+    if TRANSPORT is None:
+        ui.notify('Select the MCU port first', type='warning')
+        return
+    ui.notify('Over the air calibration running …', type='info')
+    tx()
+    try:
+        await run_sdr(discard_buffers, 10)
+        #the fit models the tone power only, noise floor and DC would bias it
+        measure = functools.partial(measure_rows, reduce=functools.partial(buffer_power, estimator='tone'))
+        result = await run_sdr(ota_calibrate, measure)
+    except (IOError, RuntimeError) as e:
+        ui.notify(f'Calibration failed: {e}', color='red')
+        return
+    finally:
+        stop_tx()
+    PHASE_OFFSETS = apply_correction(PHASE_OFFSETS, result['phase_errors'])
+    PHASE_CORRECTED = True
+    update_phase_inputs()
+    #the calibration page shows the zero phase state, now with the new offsets
+    send_phases(np.zeros(16))
+    ui.notify(f"OTA calibration applied: {result['n_captures']} captures, "
+              f"max error {np.max(np.abs(result['phase_errors'])):.1f}°, "
+              f"amplitude spread {np.ptp(result['amplitudes']):.2f}, fit residual {result['residual']:.1%}",
+              type='positive', multi_line=True)
+
+def gen_Cal_from_S2P(freq: float = FREQ) -> None:
     """
     Computes PHASE_OFFSETS from a directory of S2P files.
-    Use helper function from READ_S2P module
+    Use the calibration table from READ_S2P module, interpolated at freq (Hz)
     Find the most negative phase and make that the reference
     """
     global PHASE_OFFSETS
-    #numpy array of phases at FREQ for each port 
-    phases = get_phase_at_freq()
-    #ref phase is the longest port (most negative phase):
-    ref_phase = np.min(phases)  
-    #if its the ref phase the offset should be 0:
-    #ref_phase - ref_phase = 0 
-    #the other phases are less negative than ref phase
-    #portx_phase - ref_phase = positive check  
-    PHASE_OFFSETS = (phases - ref_phase)
-    ui.notify("Phase offsets computed and applied")
+    #the table is parsed once, switching frequency is only an interpolation
+    try:
+        offsets = get_calibration_table().offsets(freq)
+    except (OSError, ValueError) as e:
+        ui.notify(f'Calibration failed: {e}', color='red')
+        return
+    #ref phase is the longest port (most negative phase), its offset is 0
+    #the other phases are less negative than ref phase -> positive offsets
+    PHASE_OFFSETS = offsets
+    ui.notify(f"Phase offsets at {freq/1e9:.4f} GHz computed and applied")
     # update UI or display fields
     update_phase_inputs()
 
@@ -120,44 +167,140 @@ def gen_Cal_from_S2P() -> None:
 
 SELECTED_COM_PORT = 'SELECT MCU PORT' #global variable to store com selection
 async def set_com_port(port:str):
-    global SELECTED_COM_PORT,ser
+    global SELECTED_COM_PORT,ser,LINK,TRANSPORT,PHASE_TABLE
     SELECTED_COM_PORT = port
     #debug
     #print(f'COM port set to {SELECTED_COM_PORT}')
+    if port == 'LOOPBACK':
+        #simulated MCU shared with the simulated Pluto
+        from simulation import LOOPBACK
+        ser = LOOPBACK
+        LINK = McuLink(ser)
+        #the simulated MCU outlives the link, like a board that is not reset
+        await asyncio.to_thread(LINK.sync)
+        open_transport()
+        return
     try:
         ser = serial.Serial(SELECTED_COM_PORT,BAUDRATE, bytesize=serial.EIGHTBITS,parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, timeout=1)
         ser.dtr = True
         ser.rts =True
         await asyncio.sleep(3)#allow arduino to reset
+        ser.reset_input_buffer()
+        LINK = McuLink(ser)
+        #boards that do not reset on DTR still hold the last host's sequence number
+        if not await asyncio.to_thread(LINK.sync):
+            print('MCU did not answer the sync ping')
+        #move to the fast rate, stays at BAUDRATE if the firmware does not answer
+        if not await asyncio.to_thread(negotiate_baud, LINK, FAST_BAUDRATE):
+            print(f'Baud negotiation failed, staying at {ser.baudrate}')
+        open_transport()
     except Exception as e:
         print(f'Failed to open serial port: {e}')
 
-def send_phases(phases: np.ndarray):
+def open_transport():
+    """start the writer thread for LINK, the MCU table is empty after a (re)connect"""
+    global TRANSPORT, PHASE_TABLE
+    if TRANSPORT is not None:
+        TRANSPORT.close()
+    #phase frames that change few elements go out as deltas
+    TRANSPORT = SerialTransport(DeltaLink(LINK))
+    PHASE_TABLE = PhaseTable(TRANSPORT)
+
+def table_scan_writer(rows, key=None):
+    """
+    Upload phase rows to the MCU table (skipped if that table is already resident)
+    and return write_state(i) for PipelinedScan, which latches row i with a 5-7 byte frame.
+    write_state returns only after the MCU acknowledged the latch (False if it never did),
+    so energy sample i is only trusted once step i is known to be latched.
+    Falls back to prebuilt full phase frames when no table is available.
+    Blocking (the upload is a series of acknowledged frames), call it from a worker
+    thread, and expect IOError if the MCU never acknowledged the upload.
+    Args:
+        rows: (n_states, 16) phases in degrees, or a callable returning them
+        key: hashable grid description, the quantized words are then taken from
+            FRAME_CACHE (built once per grid and calibration) instead of requantized
+    Returns:
+        (write_state, write_time): callable and the shortest wire time of one step (s)
+    """
+    if key is not None:
+        words, frames = FRAME_CACHE.get(key, rows, PHASE_OFFSETS)
+    else:
+        words, frames = quantize_frames(rows() if callable(rows) else rows, PHASE_OFFSETS)
+    if PHASE_TABLE is None or len(words) > PHASE_TABLE.capacity:
+        def send_frame(i):
+            return TRANSPORT.submit(frames[i].tobytes(), ack=True, key='phases').result()
+        return send_frame, frame_time(17, TRANSPORT.baudrate)
+    start = PHASE_TABLE.load(words)
+    def write_state(i):
+        return PHASE_TABLE.step(start + i, ack=True)
+    #the CMD_NEXT frame at the negotiated rate is the earliest a new state can latch
+    return write_state, frame_time(1, TRANSPORT.baudrate)
+
+def run_streamed(engine: PipelinedScan, n_states: int) -> np.ndarray:
+    '''
+    engine.run() with the rx stream held (blocking)
+    read directly, every state costs the driver's queued buffers on top of its
+    own; the stream keeps the queue empty and hands out blocks captured after
+    the call, so the engine is built with stale=0
+    '''
+    with PLUTO.streaming():
+        return engine.run(n_states)
+
+def measure_rows(rows: np.ndarray, reduce=buffer_power) -> np.ndarray:
+    '''
+    pipelined scan over an arbitrary set of phase rows, one energy per row (blocking)
+    Args:
+        rows (np.ndarray): (k, NUM_ELEMENTS) phases in degrees
+        reduce (callable): reduce(rx) -> float, energy of one buffer
+    '''
+    write_state, write_time = table_scan_writer(rows)
+    engine = PipelinedScan(
+        write_state,
+        capture,
+        reduce,
+        write_time=write_time,
+        stale=0
+    )
+    return run_streamed(engine, len(rows))
+
+def send_phases(phases: np.ndarray, flush: bool = False, ack: bool = False) -> bool:
     """
     Connects to Arduino over serial and sends a list of 16 phase values.
     Phases are wrapped to 0-360 to ensure unsigned 2-byte transmission
+    The frame is queued on the serial writer thread and the call returns
+    immediately unless flush or ack is set. Queued phase frames that were not
+    sent yet are replaced by newer ones, so fast updates never build a backlog,
+    and only the elements that changed since the last state are transmitted.
     Args:
         phases (numpy array): List of 16 floats (0-360) for each element
+        flush (bool): block until the frame has been written
+        ack (bool): block until the MCU confirms the latch (retransmits on loss)
+    Returns:
+        bool: False if an acknowledged send was never confirmed
     """
     #vectorized conversion to 8-bit 
-    #scales degrees 0-360 to phase_words 0-255
-    #snaps to nearest integer and modulo is implicit in type delcaration (handles negatives, and wrapping)
-    total_phase = (phases + PHASE_OFFSETS)
-    normalized_phase = total_phase % 360
-    
-    hardware_phases = np.uint8(np.round(normalized_phase* (256 / 360)))
-    #send the phases
-    ser.write(hardware_phases.tobytes()) 
-    # ser.flush()
+    #scales degrees 0-360 to phase_words 0-255 (handles negatives, and wrapping)
+    hardware_phases = quantize_phases(phases, PHASE_OFFSETS)
+    #send the phases in a checksummed frame
+    pending = TRANSPORT.submit(encode_set_phases(hardware_phases), ack=ack, key='phases')
     #print(f'hardwarephases: {hardware_phases}')
-    # #debug: echo
-    # echo = ser.read(32)  # 16 words × 2 bytes each
-    # control_words = np.frombuffer(echo, dtype=np.uint16)
-    # print(f"Control words: {[f'0x{w:04x}' for w in control_words]}")
-    # if echo != hardware_phases.tobytes():
-    #     print('WARNING: PHASE missmatch detected')
-    # else:
-    #     print(f'echo{echo.hex(' ')}')
+    if flush or ack:
+        return pending.result()
+    return True
+
+def send_words(words: np.ndarray, flush: bool = False, ack: bool = False) -> bool:
+    """
+    Sends 16 hardware phase words as they are (no offsets, no rounding),
+    e.g. the output of beam_synthesis.synthesize_words. Same queueing as send_phases.
+    Args:
+        words (numpy array): 16 uint8 phase words
+    Returns:
+        bool: False if an acknowledged send was never confirmed
+    """
+    pending = TRANSPORT.submit(encode_set_phases(np.asarray(words, dtype=np.uint8)), ack=ack, key='phases')
+    if flush or ack:
+        return pending.result()
+    return True
 
 
 def hermite_mode(mode:str):
@@ -228,6 +371,148 @@ def nav_back():
     selected = None
     ui.navigate.back()
 
+def on_disconnect(client, handler):
+    '''
+    Run handler when client disconnects.
+    Returns:
+        callable that unregisters handler again (call it once the work is done,
+        otherwise every call leaves one more handler on the client)
+    '''
+    client.on_disconnect(handler)
+    def remove():
+        if handler in client.disconnect_handlers:
+            client.disconnect_handlers.remove(handler)
+    return remove
+
+async def run_in_client(client, coro):
+    '''
+    Await coro inside client's context. Tasks started with asyncio.create_task
+    from a sync handler have no slot stack, so ui.notify / ui.context.client
+    would fail in them.
+    '''
+    with client:
+        return await coro
+
+def live_energy_plot(fig, live_plot, y_range):
+    '''
+    Feed the first trace of a plotly figure from the shared energy publisher.
+    Every open page gets its own ring of the latest samples, the SDR is only
+    sampled once however many plots are live.
+    Args:
+        fig: plotly figure with one line trace
+        live_plot: ui.plotly element showing fig
+        y_range (callable): returns [y_min, y_max] of the energy axis
+    Returns:
+        (start, stop): start() subscribes and refreshes at ENERGY_RATE, stop() ends it
+    '''
+    state = {'ring': None, 't0': 0.0, 'count': 0, 'unregister': None}
+    client = ui.context.client
+
+    def refresh():
+        ring = state['ring']
+        if ring is not None and ring.error is not None:
+            #the capture thread died, the plot would silently freeze
+            ui.notify(f'Live capture stopped: {ring.error}', color='red')
+            stop()
+            return
+        if ring is None or ring.count == state['count']:
+            return
+        state['count'] = ring.count
+        t, energy = ring.snapshot()
+        fig.data[0].x = t - state['t0']
+        fig.data[0].y = energy
+        try:
+            fig.update_yaxes(range=y_range())
+        except Exception:
+            pass #temporary invalid values
+        live_plot.update()
+
+    timer = ui.timer(1 / ENERGY_RATE, refresh, active=False)
+
+    def start():
+        if state['ring'] is None:
+            state['ring'] = ENERGY.subscribe()
+            state['t0'] = time.perf_counter()
+            state['count'] = 0
+            #a closed tab must not keep the stream alive
+            state['unregister'] = on_disconnect(client, stop)
+        timer.activate()
+
+    def stop():
+        timer.deactivate()
+        if state['ring'] is not None:
+            ENERGY.unsubscribe(state['ring'])
+            state['ring'] = None
+        if state['unregister'] is not None:
+            state['unregister']()
+            state['unregister'] = None
+
+    return start, stop
+
+async def acquire_energies(n: int, **kwargs) -> np.ndarray:
+    '''
+    Collect n energy samples on the SDR worker thread, the event loop (and every
+    other connected client) keeps running meanwhile.
+    The acquisition stops at the next buffer when the handler task is cancelled
+    or the page's client disconnects.
+    Args:
+        n (int): number of samples
+        **kwargs: discard, interval, averaged, see PLUTO.collect_energies
+    Returns:
+        np.ndarray: the n samples
+    '''
+    cancel = threading.Event()
+    unregister = on_disconnect(ui.context.client, cancel.set)
+    try:
+        energies = await run_sdr(collect_energies, n, cancel=cancel, on_cancel=cancel.set, **kwargs)
+    finally:
+        unregister()
+    if cancel.is_set():
+        raise asyncio.CancelledError()
+    return energies
+
+async def store_run(kind: str, arrays: dict, **kwargs):
+    '''
+    Append a run with the current calibration to the experiment store
+    (experiment_store.py) from a worker thread. A failed write only warns,
+    the measurement on screen is not lost.
+    Args:
+        kind (str): run type, e.g. 'rx_scan'
+        arrays (dict): raw arrays of the run
+        **kwargs: label, started, meta, see ExperimentStore.append
+    Returns:
+        int: run_id, None if the run could not be stored
+    '''
+    try:
+        return await asyncio.to_thread(STORE.append, kind, arrays, offsets=PHASE_OFFSETS.copy(), **kwargs)
+    except Exception as e:
+        ui.notify(f'Run not saved to {STORE.path}: {e}', type='warning')
+        return None
+
+async def reconnect_sdr():
+    '''drop and reopen the PLUTO session (short timeout), e.g. after plugging it in'''
+    ui.notify('Connecting to PLUTO …', type='info')
+    if await run_sdr(PLUTO.reconnect):
+        ui.notify('PLUTO connected', type='positive')
+    else:
+        ui.notify('No PLUTO found, check the USB/network connection', type='warning')
+
+def warm_up_after_startup():
+    '''
+    Runs once the server is serving: report the startup time, then precompute
+    the scan and AF grids and connect the SDR in the background so the first
+    measurement page does not pay for them.
+    '''
+    print(f'GUI serving {time.perf_counter() - T_START:.2f} s after launch')
+    warm_up([],
+            lambda: FRAME_CACHE.get(RX_GRID_KEY, lambda: rx_grid.DEFAULT_RX_GRID, PHASE_OFFSETS),
+            lambda: get_af_grid(DX, DY))
+    #connecting uses the SDR worker so it never races an acquisition
+    PLUTO.SDR_EXECUTOR.submit(PLUTO.connect)
+
+app.on_startup(warm_up_after_startup)
+FIRST_PAGE_SHOWN = False
+
 #----END HELPER FUNCTIONS----
    
 
@@ -240,16 +525,23 @@ def main_page():
     User can enter the arduino port at the very start
     The calibrate button will be blinking until the user performs calibration.
     ''' 
+    global FIRST_PAGE_SHOWN
+    if not FIRST_PAGE_SHOWN:
+        FIRST_PAGE_SHOWN = True
+        print(f'First page built {time.perf_counter() - T_START:.2f} s after launch')
     #connect to arduino part one time at the main screen:
 
     ports = serial.tools.list_ports.comports()
     portsList = {p.device:f'{p.device} - {p.description}'for p in ports} 
+    if SIMULATE:
+        portsList['LOOPBACK'] = 'LOOPBACK - simulated MCU'
     # COM port
     com_input = ui.select(
         options = portsList, 
         label =SELECTED_COM_PORT,
         on_change=lambda e: asyncio.create_task(set_com_port(e.value))
     ).style('width: 300px')
+    ui.button('Reconnect SDR', on_click=reconnect_sdr)
 
     images = [
     ('/calibrate', 'Calibration.png'),
@@ -348,7 +640,13 @@ def manual_page():
                                 sliders.append(slider)
 
             # Submit button
-            ui.button('Submit', on_click=lambda: submit(sliders)).classes('mt-6')
+            with ui.row().classes('items-center gap-6 mt-6'):
+                ui.button('Submit', on_click=lambda: submit(sliders))
+                #send while dragging, stale frames are coalesced by the serial transport
+                live = ui.switch('Live update')
+            for slider in sliders:
+                slider.on_value_change(lambda _: send_phases(np.array([float(s.value) for s in sliders]))
+                                       if live.value else None)
 
     def submit(sliders):
         #ensure integer values
@@ -480,44 +778,19 @@ def oam_page():
         image_container = ui.row()\
             .classes('justify-center items-center')\
         .style('order:2; width:90%;')
-        stop_event = asyncio.Event()
-        
+        start_energy, stop_energy = live_energy_plot(fig, live_plot, lambda: [y_min.value, y_max.value])
+
         def start_live_plot():
             # Start continuous TX
             tx()
-            # Reset stop_event
-            stop_event.clear()
-            # Launch async update
-            asyncio.create_task(live_update())
+            #samples come from the shared energy publisher
+            start_energy()
             stop_button.visible = True
 
-        async def live_update():
-            t_values = []
-            energy_values = []
-            start_time = time.time()
-
-            while not stop_event.is_set():
-                t = time.time()-start_time
-                energy = get_energy()  # sample SDR
-                t_values.append(t)
-                energy_values.append(energy)
-                t_values = t_values[-100:]
-                energy_values = energy_values[-100:]
-                # Update the figure's data
-                fig.data[0].x = t_values
-                fig.data[0].y = energy_values
-                try:
-                    fig.update_yaxes(range=[y_min.value,y_max.value])
-                except Exception:
-                    pass #temporary invalid values
-                live_plot.update()  # NiceGUI triggers plot update
-
-                await asyncio.sleep(0.05)  # ~20 Hz refresh
-                
         def stop_live():
             #stop transmitting 
             stop_tx()
-            stop_event.set()
+            stop_energy()
             ui.notify("Live plot stopped", type='positive')
 
         # Buttons
@@ -543,12 +816,14 @@ def oam_page():
         async def record_noise_floor():
             ui.notify('Recording noise floor (TX off) …', type='info')
             num_samples = 100
-            for _ in range(10):
-                discard_buffer()
-            power_samples = [get_energy_fast() for _ in range(num_samples)]
+            started = time.time()
+            power_samples = await acquire_energies(num_samples, discard=10)
             noise_mean = np.mean(power_samples)
             noise_std = np.std(power_samples)
             _ts_data['noise'] = {'mean': noise_mean, 'std': noise_std}
+            await store_run(
+                'ts_noise', {'energy': power_samples, 'mean': noise_mean, 'std': noise_std},
+                started=started)
 
             fig, ax = plt.subplots(figsize=(5, 4))
             ax.errorbar(
@@ -604,17 +879,16 @@ def oam_page():
                 return
 
             ui.notify('Starting TX — warming up for 2s …', type='info')
+            started = time.time()
             tx()
-            await asyncio.sleep(2)
-
-            for _ in range(10):
-                discard_buffer()
-
-            ui.notify('Recording …', type='positive')
-            power_samples = [get_energy_fast() for _ in range(num_samples)]
+            try:
+                await asyncio.sleep(2)
+                ui.notify('Recording …', type='positive')
+                power_samples = await acquire_energies(num_samples, discard=10)
+            finally:
+                stop_tx()
             raw_mean = np.mean(power_samples)
             raw_std = np.std(power_samples)
-            stop_tx()
 
             # Power above noise floor; uncertainties add in quadrature
             average_power      = raw_mean - noise['mean']
@@ -623,6 +897,11 @@ def oam_page():
 
 
             _ts_data[store_key] = {'mean': average_power, 'std': standard_deviation}
+            await store_run(
+                f'ts_{store_key}',
+                {'energy': power_samples, 'mean': average_power, 'std': standard_deviation},
+                label=channel_label, started=started,
+                meta={'noise_mean': noise['mean'], 'noise_std': noise['std']})
 
             fig, ax = plt.subplots(figsize=(5, 4))
             ax.errorbar(
@@ -891,47 +1170,19 @@ def hermite_page():
         image_container = ui.row()\
             .classes('justify-center items-center')\
         .style('order:2; width:90%;')
-        stop_event = asyncio.Event()
-        
-        
+        start_energy, stop_energy = live_energy_plot(fig, live_plot, lambda: [y_min.value, y_max.value])
+
         def start_live_plot():
             # Start continuous TX
             tx()
-            # Reset stop_event
-            stop_event.clear()
-
-            # Launch async update
-            asyncio.create_task(live_update())
+            #samples come from the shared energy publisher
+            start_energy()
             stop_button.visible = True
 
-        async def live_update():
-            t_values = []
-            energy_values = []
-            start_time = time.time()
-
-            while not stop_event.is_set():
-                t = time.time()-start_time
-                energy = get_energy()  # sample SDR
-                t_values.append(t)
-                energy_values.append(energy)
-                t_values = t_values[-100:]
-                energy_values = energy_values[-100:]
-                # Update the figure's data
-                fig.data[0].x = t_values
-                fig.data[0].y = energy_values
-                try:
-                    fig.update_yaxes(range=[y_min.value,y_max.value])
-                except Exception:
-                    pass #temporary invalid values
-                live_plot.update()  # NiceGUI triggers plot update
-
-                await asyncio.sleep(0.05)  # ~20 Hz refresh
-                
-
         def stop_live():
             #stop transmitting 
             stop_tx()
-            stop_event.set()
+            stop_energy()
             ui.notify("Live plot stopped", type='positive')
 
         # Buttons
@@ -943,28 +1194,29 @@ def hermite_page():
         stop_button.visible = False            
 
 
-        def record_burst(trial_name, duration=1.0, sample_interval=0.01):
+        async def record_burst(trial_name, duration=1.0, sample_interval=0.01):
             '''
             transmit a burst of continuous wave and record recieved "power"
+            the capture runs on the SDR worker, other clients stay responsive
             '''
             global burst_data_hermite
+            started = time.time()
             #start trasmission
             tx()
-            time.sleep(SETTLE_TIME)
-
-            energy_values = []
-
-            num_samples = int(duration/sample_interval)
-            for _ in range(num_samples):
-                energy = get_energy()
-                energy_values.append(energy)
-                time.sleep(sample_interval)
-            #end transmission
-            stop_tx()
+            try:
+                await asyncio.sleep(SETTLE_TIME)
+                num_samples = int(duration/sample_interval)
+                energy_values = await acquire_energies(num_samples, interval=sample_interval, averaged=True)
+            finally:
+                #end transmission
+                stop_tx()
             #store the data
             burst_data_hermite[trial_name] ={
-                'energy': np.array(energy_values)
+                'energy': energy_values
             }
+            await store_run(
+                'hermite_burst', {'energy': energy_values}, label=trial_name, started=started,
+                meta={'duration': duration, 'sample_interval': sample_interval})
             ui.notify("successfully recorded burst")
     
         #Set up containers for images to be placed in later
@@ -988,12 +1240,12 @@ def hermite_page():
             .classes('justify-center items-center')\
             .style('order:25; width: 90%')
         
-        def plot_no_scatterer():
+        async def plot_no_scatterer():
             '''
             Record burst data then plot it
             '''
             global burst_data_hermite
-            record_burst('baseline')
+            await record_burst('baseline')
             e_b = burst_data_hermite['baseline']['energy']
             #number of samples
             x = np.arange(len(e_b))
@@ -1011,16 +1263,16 @@ def hermite_page():
             with baseline_container:
                 ui.image('media/baseline.png').style('width:60%;').force_reload()
 
-        def plot_scatterer(plane=False):
+        async def plot_scatterer(plane=False):
             '''
             Record burst data then plot it 
             '''
             global burst_data_hermite
             if not plane:
-                record_burst('scatterer')
+                await record_burst('scatterer')
                 e_s = burst_data_hermite['scatterer']['energy']
             else:
-                record_burst('scatterer_plane')
+                await record_burst('scatterer_plane')
                 e_s = burst_data_hermite['scatterer_plane']['energy']
             #number of samples
             x = np.arange(len(e_s))
@@ -1246,83 +1498,85 @@ def beam_page():
                 yaxis_title='Avg Power Received'
             )
             live_plot = ui.plotly(fig).classes('w-3/4 h-64')
-            image_container = ui.row()\
-                .classes('justify-center items-center')\
-            .style('order:2; width:90%;')
-            stop_event = asyncio.Event()
-            
+            #persistent AF views, re-steering only replaces their z data (uint8)
+            th_axis, ph_axis, uv_axis = af_view_axes(DX, DY)
+            colorbar = dict(title='|AF|', tickvals=[1, 128, 255], ticktext=['0', '0.5', '1'])
+            af_fig = go.Figure(go.Heatmap(
+                x=ph_axis, y=th_axis, z=np.zeros((len(th_axis), len(ph_axis)), dtype=np.uint8),
+                colorscale=af_plotly_colorscale(), zmin=0, zmax=255, colorbar=colorbar))
+            af_fig.update_layout(
+                title='Normalized Array Factor (theta vs phi)',
+                xaxis_title='phi (deg)', yaxis_title='theta (deg)',
+                yaxis_autorange='reversed', margin=dict(l=40, r=0, t=40, b=40))
+            uv_fig = go.Figure(go.Heatmap(
+                x=uv_axis, y=uv_axis, z=np.zeros((len(uv_axis), len(uv_axis)), dtype=np.uint8),
+                colorscale=af_plotly_colorscale(), zmin=0, zmax=255, colorbar=colorbar))
+            uv_fig.update_layout(
+                title='Normalized Array Factor (UV Plot)',
+                xaxis_title='u = sin(θ)cos(φ)', yaxis_title='v = sin(θ)sin(φ)',
+                yaxis_scaleanchor='x', margin=dict(l=40, r=0, t=40, b=40))
+            with ui.row().classes('w-full justify-center items-center').style('order:2;'):
+                af_plot = ui.plotly(af_fig).classes('w-1/2 h-96')
+                uv_plot = ui.plotly(uv_fig).classes('w-96 h-96')
+            af_plot.visible = False
+            uv_plot.visible = False
+            start_energy, stop_energy = live_energy_plot(
+                fig, live_plot, lambda: [int(y_min.value), int(y_max.value)])
+
+            def show_af():
+                #the AF is evaluated in memory, nothing goes through media/
+                theta_phi, uv = af_view_data(dx.value, dy.value, theta.value, phi.value)
+                af_fig.data[0].z = theta_phi
+                uv_fig.data[0].z = uv
+                af_plot.visible = True
+                uv_plot.visible = True
+                af_plot.update()
+                uv_plot.update()
             
-            def start_live_plot():
+            async def steer():
+                #betas are cached per direction, re-steering to a known angle is a lookup
+                phases = steering_row(float(dx.value), float(dy.value), float(theta.value), float(phi.value))
+                if not synth_switch.value:
+                    send_phases(phases)
+                    return
+                #search the quantized words instead of rounding every element on its own,
+                #a few ms of numpy per steer so it runs in a worker thread
+                words, report = await asyncio.to_thread(
+                    synthesize_words, phases, theta.value, phi.value, dx.value, dy.value,
+                    np.array(PHASE_OFFSETS, dtype=float))
+                send_words(words)
+                ui.notify(
+                    f"Quantization error {report['error_db']:.1f} dB "
+                    f"(rounded {report['rounded_error_db']:.1f} dB), "
+                    f"gain {report['gain_db'] - report['rounded_gain_db']:+.2f} dB")
+
+            async def start_live_plot():
                 # Send initial phases
-                phases = runAF_Calc(dx.value, dy.value, theta.value, phi.value)
-                send_phases(phases)
-
-                # Show AF image
-                image_container.clear()
-                with image_container:
+                await steer()
 
-                    ui.image('media/AF.png').style('width:40%;').force_reload()
-                    ui.image('media/uv.png').style('width:40%;').force_reload()
+                # Show AF
+                show_af()
                 # Start continuous TX
                 tx()
 
-                # Reset stop_event
-                stop_event.clear()
-
-                # Launch async update
-                asyncio.create_task(live_update())
+                #samples come from the shared energy publisher
+                start_energy()
                 new_angle_button.visible = True
                 stop_button.visible = True
 
-            async def live_update():
-                t_values = []
-                energy_values = []
-                start_time = time.time()
-                last_theta = theta.value 
-                last_phi = phi.value
-
-                while not stop_event.is_set():
-                    t = time.time()-start_time
-                    energy = get_energy()  # sample SDR
-                    t_values.append(t)
-                    energy_values.append(energy)
-                    t_values = t_values[-100:]
-                    energy_values = energy_values[-100:]
-                    # Update the figure's data
-                    fig.data[0].x = t_values
-                    fig.data[0].y = energy_values
-                    try:
-                        fig.update_yaxes(range=[int(y_min.value),int(y_max.value)])
-                    except Exception:
-                        pass #temporary invalid values
-                    live_plot.update()  # NiceGUI triggers plot update
-
-                    await asyncio.sleep(0.05)  # ~20 Hz refresh
-            def send_current_phase():
-                phases = runAF_Calc(
-                    dx.value, 
-                    dy.value, 
-                    theta.value,
-                    phi.value
-                )
-                send_phases(phases)
-                # Show AF image
-                image_container.clear()
-                with image_container:
-                    ui.image('media/AF.png')\
-                    .style('width:40%;')\
-                    .force_reload()
-                    ui.image('media/uv.png')\
-                    .style('width:40%;')\
-                    .force_reload()
+            async def send_current_phase():
+                await steer()
+                # Show AF
+                show_af()
 
             def stop_live():
                 #stop transmitting 
                 stop_tx()
-                stop_event.set()
+                stop_energy()
                 ui.notify("Live plot stopped", type='positive')
 
             # Buttons
+            synth_switch = ui.switch('Quantization-aware synthesis')
             ui.button('Transmit & Live Plot', on_click=start_live_plot)
             new_angle_button = ui.button(
                 'New Angle', 
@@ -1365,10 +1619,15 @@ def beam_page():
         image_container = ui.row()\
             .classes('w-full justify-center items-center')\
             .style('order:2;')
-            
+        with ui.row().classes('w-full justify-center items-center'):
+            adaptive_switch = ui.switch('Adaptive search (single emitter)')
+            track_switch = ui.switch('Start from last fix').bind_visibility_from(adaptive_switch, 'value')
+        last_fix = {}
 
         def Scan_Beam():
             """Launches beam scan in background with progress bar"""
+            #the tasks below run outside this handler, they enter the client explicitly
+            client = ui.context.client
             with ui.dialog() as dialog, ui.card():
                 label = ui.label('Starting beam scan...')
                 progress_bar = ui.linear_progress(show_value = False)\
@@ -1379,26 +1638,63 @@ def beam_page():
             async def scan_task():
                 # Launch the scan as an async background task
                 tx()
-                # clear receive buffer 
-                n_steps = len(DEFAULT_RX_GRID)
-                energies = np.zeros(n_steps)
-
-                for i, phases in enumerate(DEFAULT_RX_GRID):
-                    send_phases(phases)
-                    if i == 0:
-                        for _ in range(10):
-                            discard_buffer()
-                    energies[i] = get_energy() #time to sample ~410us
-                    await asyncio.sleep(10e-6)
-                    label.set_text(f"Scanning {i+1}/{n_steps}")
-
-                stop_tx()
-
+                n_steps = len(THETA_RANGE) * len(PHI_RANGE)
+                started = time.time()
+                unregister = None
+                try:
+                    # clear receive buffer 
+                    await run_sdr(discard_buffers, 10)
+                    #the grid lives in the MCU table, each step is a 1-3 byte command
+                    #words come quantized from FRAME_CACHE unless the calibration changed,
+                    #the upload is a series of acknowledged frames so it runs in a worker thread
+                    write_state, write_time = await asyncio.to_thread(
+                        table_scan_writer, lambda: rx_grid.DEFAULT_RX_GRID, RX_GRID_KEY)
+                    #serial writes for step i+1 overlap the capture of step i,
+                    #the engine runs in a worker thread so the GUI stays responsive
+                    engine = PipelinedScan(
+                        write_state,
+                        capture,
+                        buffer_power,
+                        write_time=write_time,
+                        stale=0
+                    )
+                    #closing the page stops the scan at the next state
+                    unregister = on_disconnect(client, engine.cancel)
+                    scan = asyncio.create_task(run_sdr(run_streamed, engine, n_steps, on_cancel=engine.cancel))
+                    while not scan.done():
+                        label.set_text(f"Scanning {engine.done}/{n_steps}")
+                        await asyncio.sleep(0.1)
+                    energies = scan.result()
+                except Exception as e:
+                    #unacknowledged upload, serial errors or SDR timeouts from the engine
+                    ui.notify(f'Scan failed: {e}', color='red')
+                    dialog.close()
+                    return
+                finally:
+                    if unregister is not None:
+                        unregister()
+                    stop_tx()
+                #raw energies, before normalizing in place
+                await store_run(
+                    'rx_scan',
+                    {'energy': energies.copy(), 'theta': THETA_RANGE, 'phi': PHI_RANGE},
+                    started=started,
+                    meta={'dx': DX, 'dy': DY, 'discarded': engine.discarded})
+
+                #states the engine could not capture (cancelled, or spoiled on every pass) are NaN
+                missing = int(np.isnan(energies).sum())
+                if missing == len(energies):
+                    ui.notify('Scan stopped before any state was captured', type='warning')
+                    dialog.close()
+                    return
+                if missing:
+                    ui.notify(f'{missing} of {len(energies)} directions were not captured (blank in the plot)',
+                              type='warning')
                 # Reshape and plot
                 energies_2D = energies.reshape(len(THETA_RANGE), len(PHI_RANGE))
-                energies_2D /= np.max(energies_2D) #normalize
+                energies_2D /= np.nanmax(energies_2D) #normalize
                 # Find peak location
-                peak_idx = np.unravel_index(np.argmax(energies_2D), energies_2D.shape)
+                peak_idx = np.unravel_index(np.nanargmax(energies_2D), energies_2D.shape)
                 theta_peak = THETA_RANGE[peak_idx[0]]
                 phi_peak = PHI_RANGE[peak_idx[1]]
 
@@ -1442,7 +1738,65 @@ def beam_page():
                 # Hide progress bar after completion
                 dialog.close()
 
-            asyncio.create_task(scan_task()) 
+            async def adaptive_task():
+                tx()
+                start = last_fix.get('fix') if track_switch.value else None
+                status = {'text': 'Coarse scan...'}
+                try:
+                    await run_sdr(discard_buffers, 10)
+                    #progress arrives on the worker thread, the label is updated from here
+                    search = asyncio.create_task(run_sdr(
+                        adaptive_search, measure_rows, DX, DY, start=start,
+                        progress=lambda n, step: status.update(text=f"Refining ({step:.2f}° step) - {n} dwells")
+                    ))
+                    while not search.done():
+                        label.set_text(status['text'])
+                        await asyncio.sleep(0.1)
+                    result = search.result()
+                except Exception as e:
+                    #serial or SDR errors, or nothing measured at all
+                    ui.notify(f'Adaptive search failed: {e}', color='red')
+                    dialog.close()
+                    return
+                finally:
+                    stop_tx()
+                last_fix['fix'] = (result['theta'], result['phi'])
+                theta_peak, phi_peak = result['theta'], result['phi']
+                samples = result['samples']
+
+                fig, ax = plt.subplots(figsize=(8, 6))
+                sc = ax.scatter(samples[:, 1] % 360, samples[:, 0],
+                    c=samples[:, 2] / np.max(samples[:, 2]), cmap='plasma', s=30)
+                ax.plot(phi_peak, theta_peak, 'ro', markersize=10)
+                ax.annotate(
+                    fr"$\phi$: {phi_peak:.1f}°,$\theta$: {theta_peak:.1f}°",
+                    xy=(phi_peak, theta_peak),
+                    xytext=(0, 10),
+                    ha='center',
+                    va='center',
+                    textcoords='offset points',
+                    color='white',
+                    fontsize=10,
+                    bbox=dict(boxstyle="round,pad=0.2", fc="black", alpha=0.5),
+                    zorder=100
+                )
+                plt.colorbar(sc, ax=ax, label='Received energy')
+                ax.set_xlim(0, 360)
+                ax.set_ylim(THETA_RANGE[0], THETA_RANGE[-1])
+                ax.set_xlabel('Phi [deg]')
+                ax.set_ylabel('Theta [deg]')
+                ax.set_title(f'Adaptive Beam Search ({result["n_dwells"]} dwells)')
+                plt.savefig('media/rx_heat.png', dpi=300)
+                plt.close()
+                image_container.clear()
+                with image_container:
+                    ui.image('media/rx_heat.png').style('width:65%;').force_reload()
+                dialog.close()
+
+            if adaptive_switch.value:
+                asyncio.create_task(run_in_client(client, adaptive_task()))
+            else:
+                asyncio.create_task(run_in_client(client, scan_task()))
 
         ui.button('Start', on_click=Scan_Beam)
 
@@ -1477,6 +1831,7 @@ def calibrate():
             ui.label('The phase of each shifter is set to 0°.').classes('text-base text-gray-600 text-center')
             ui.label('Please Load Defualt Calibration File by clicking load calibration and typing Default').classes('text-base text-gray-600 text-center')
             ui.label('If recalibration is needed please manually enter phases and save or redo s2p measurements for each port and create the new calibration').classes('text-base text-gray-600 text-center')
+            ui.label('Or place the reference antenna at boresight and run the over the air calibration (refines the current offsets, can be repeated)').classes('text-base text-gray-600 text-center')
             
             ui.label('Note that when you load the calibration it will be rounded to the accuracy of the phase shifter 1.40625 degrees/LSB').classes('text-base text-gray-600 text-center')
     def prompt_save_calibration():
@@ -1506,7 +1861,11 @@ def calibrate():
     with ui.row().classes('justify-center gap-4 my-2'):
         ui.button('Save Calibration', on_click=prompt_save_calibration)
         ui.button('Load Calibration', on_click=prompt_use_calibration)
-        ui.button('Generate Calibration from S2P Folder', on_click=gen_Cal_from_S2P)
+        cal_freq = ui.number(label='Calibration Frequency (GHz)', value=FREQ/1e9,
+                             format='%.4f').props('outlined dense step=0.0005').style('width:200px;')
+        ui.button('Generate Calibration from S2P Folder',
+                  on_click=lambda: gen_Cal_from_S2P(float(cal_freq.value or FREQ/1e9) * 1e9))
+        ui.button('Over the Air Calibration', on_click=gen_Cal_OTA)
     #clear so we don't get more than 16 in phase_inputs
     phase_inputs.clear()
     # Display inputs in a 4x4 grid
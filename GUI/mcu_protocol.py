@@ -0,0 +1,670 @@
+'''
+Host side of the serial protocol spoken by
+Arduino/main_optimized_spi/main_optimized_spi.ino.
+
+Messages are sent in frames:
+    START (0xA5) | LEN | SEQ | CMD | payload | CRC-8
+LEN counts CMD + payload (1..255), the CRC (poly 0x07, init 0) covers
+LEN, SEQ, CMD and payload. Setting FLAG_ACK in CMD asks the MCU to answer,
+after the command has been executed (i.e. after the latch), with
+    ACK_START (0x5A) | SEQ | STATUS | CRC-8(SEQ, STATUS)
+A frame with a bad CRC is answered with ACK_CRC and the MCU rescans the
+bytes after its start byte, so a dropped or corrupted byte costs at most
+the frames it touched, never the sync of the following ones. A repeated
+SEQ (retransmission after a lost ACK) is acknowledged but not executed
+again, which keeps CMD_NEXT idempotent. The MCU keeps the last SEQ until
+the board resets, not when the host reconnects, so every new McuLink calls
+sync() first (an acknowledged ping brings both sides to the same SEQ).
+
+Commands (first byte of the frame payload):
+    CMD_SET_PHASES + 16 phase words                    latch one phase state
+    CMD_UPLOAD + start (u16) + count (u16) + count*16  store states in the MCU table
+    CMD_SELECT + k (u16)                               latch table state k
+    CMD_NEXT                                           latch the state after the current one,
+                                                       wrapping inside the active range
+    CMD_TRIGGER + enable (u8)                          advance to the next state on every
+                                                       rising edge of the trigger pin
+    CMD_SET_BAUD + baudrate (u32)                      switch the serial rate after the ACK
+    CMD_PING                                           no-op, ACKed
+    CMD_SET_DELTA + base CRC-8 + (addr, word) pairs    latch only the listed elements
+    CMD_RANGE + start (u16) + count (u16)              active range CMD_NEXT and the trigger
+                                                       step through, count 0: the whole table
+CMD_SET_DELTA is only applied when the CRC-8 of the MCU's latched words
+matches base CRC, otherwise it is rejected with ACK_BAD. Negative statuses
+are sent even without FLAG_ACK, so the host notices a lost update and falls
+back to a full CMD_SET_PHASES frame (see DeltaLink).
+After CMD_SET_BAUD the MCU falls back to the boot rate (config.BAUDRATE)
+unless a valid frame arrives within BAUD_PROBATION seconds, so a failed
+negotiation never leaves the link dead. Rates the 16 MHz clock cannot
+produce within MAX_BAUD_ERROR (e.g. 921600, 8.5% off) are rejected with
+ACK_BAD, 500000 and 1000000 are exact. Rate changes are a feature of the
+Mega (ATmega2560) sketch only: MCU_CLOCK and baud_error() model its AVR
+USART, a build for any other core rejects every CMD_SET_BAUD.
+Multi-byte fields are little endian, phase words are 0-255 (360/256 deg LSB).
+
+With a table uploaded, stepping through a scan costs a 5 (CMD_NEXT) or 7
+(CMD_SELECT) byte frame on the wire instead of 21.
+
+Usage:
+    link = McuLink(ser)
+    link.sync()
+    link.send(encode_set_phases(words), ack=True)
+    table = PhaseTable(link)
+    start = table.load(quantize_phases(DEFAULT_RX_GRID, PHASE_OFFSETS))
+    for i in range(len(DEFAULT_RX_GRID)):
+        table.step(start + i)
+'''
+import collections, hashlib, struct, threading, time
+from concurrent.futures import Future
+import numpy as np
+from config import NUM_ELEMENTS
+
+CMD_SET_PHASES = 0x01
+CMD_UPLOAD = 0x02
+CMD_SELECT = 0x03
+CMD_NEXT = 0x04
+CMD_TRIGGER = 0x05
+CMD_SET_BAUD = 0x06
+CMD_PING = 0x07
+CMD_SET_DELTA = 0x08
+CMD_RANGE = 0x09
+
+#rows the MCU table can hold (256 x 16 bytes of the Mega's 8 kB SRAM)
+TABLE_CAPACITY = 256
+
+#framing
+START = 0xA5
+ACK_START = 0x5A
+FLAG_ACK = 0x80 #or'ed into CMD
+MAX_PAYLOAD = 255 #CMD + arguments
+FRAME_OVERHEAD = 4 #START, LEN, SEQ, CRC
+ACK_SIZE = 4
+#ACK status
+ACK_OK = 0
+ACK_CRC = 1 #frame dropped, bad checksum
+ACK_BAD = 2 #unknown command, wrong length or row out of range
+#table rows per upload frame (CMD + start + count + rows*16 <= MAX_PAYLOAD)
+UPLOAD_ROWS = (MAX_PAYLOAD - 5) // NUM_ELEMENTS
+#seconds the MCU waits for a valid frame at a new baud rate before reverting
+BAUD_PROBATION = 1.0
+#clock the Mega's UART divides down (F_CPU of the ATmega2560 sketch), and the
+#largest rate error accepted for CMD_SET_BAUD
+MCU_CLOCK = 16000000
+MAX_BAUD_ERROR = 0.01
+#most changed elements sent as a delta (CMD + CRC + 2 bytes each stays below 17)
+DELTA_MAX = (NUM_ELEMENTS - 1) // 2
+
+
+def _crc8_table() -> list:
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return table
+
+_CRC8 = _crc8_table()
+
+def crc8(data, crc: int = 0) -> int:
+    '''CRC-8 (poly 0x07, init 0), same as crc8() in the sketch'''
+    for b in data:
+        crc = _CRC8[crc ^ b]
+    return crc
+
+
+def encode_frame(seq: int, payload: bytes, ack: bool = False) -> bytes:
+    '''wrap a command (CMD + arguments) into a frame'''
+    if not 1 <= len(payload) <= MAX_PAYLOAD:
+        raise ValueError(f'payload of {len(payload)} bytes does not fit a frame')
+    body = bytes([len(payload), seq & 0xFF, payload[0] | (FLAG_ACK if ack else 0)]) + payload[1:]
+    return bytes([START]) + body + bytes([crc8(body)])
+
+
+def encode_ack(seq: int, status: int) -> bytes:
+    '''MCU answer to a frame, see the module docstring'''
+    return bytes([ACK_START, seq, status, crc8((seq, status))])
+
+
+def frame_time(payload_len: int, baudrate: float) -> float:
+    '''wire time (s) of a frame carrying payload_len bytes, 10 bits per byte'''
+    return (payload_len + FRAME_OVERHEAD) * 10 / baudrate
+
+
+class FrameDecoder:
+    '''
+    Incremental frame parser with resync, the algorithm of the sketch.
+    feed(data) returns a list of events:
+        ('frame', seq, ack, payload) for a valid frame (payload starts with the plain CMD)
+        ('crc', seq, None, None) for a frame that failed its checksum
+    '''
+    def __init__(self):
+        self._buf = bytearray()
+
+    def feed(self, data: bytes) -> list:
+        buf = self._buf
+        buf += data
+        events = []
+        while buf:
+            if buf[0] != START:
+                #skip to the next candidate start byte
+                i = buf.find(START)
+                del buf[:len(buf) if i < 0 else i]
+                continue
+            if len(buf) < 2:
+                break
+            n = buf[1]
+            if n == 0:
+                del buf[:1]
+                continue
+            total = n + FRAME_OVERHEAD
+            if len(buf) < total:
+                break
+            if crc8(buf[1:total - 1]) != buf[total - 1]:
+                events.append(('crc', buf[2], None, None))
+                #the start byte was not a frame, rescan right after it
+                del buf[:1]
+                continue
+            cmd = buf[3]
+            payload = bytes([cmd & ~FLAG_ACK]) + bytes(buf[4:total - 1])
+            events.append(('frame', buf[2], bool(cmd & FLAG_ACK), payload))
+            del buf[:total]
+        return events
+
+
+def quantize_phases(phases: np.ndarray, offsets=0) -> np.ndarray:
+    '''
+    Convert phases in degrees (plus calibration offsets) to 8-bit hardware words.
+    Scales degrees 0-360 to 0-255, wrapping negatives and 360 back into range.
+    Args:
+        phases (np.ndarray): (..., NUM_ELEMENTS) degrees
+        offsets: per element calibration offsets (degrees)
+    Returns:
+        np.ndarray of uint8 with the same shape
+    '''
+    total_phase = (np.asarray(phases, dtype=float) + offsets) % 360
+    return (np.round(total_phase * (256 / 360)).astype(np.int64) % 256).astype(np.uint8)
+
+
+def encode_set_phases(words: np.ndarray) -> bytes:
+    '''latch one state given as NUM_ELEMENTS hardware words'''
+    return bytes([CMD_SET_PHASES]) + np.asarray(words, dtype=np.uint8).tobytes()
+
+
+def encode_upload(start: int, rows: np.ndarray) -> bytes:
+    '''store rows (n <= UPLOAD_ROWS, NUM_ELEMENTS) of hardware words at table index start'''
+    rows = np.ascontiguousarray(rows, dtype=np.uint8).reshape(-1, NUM_ELEMENTS)
+    if len(rows) > UPLOAD_ROWS:
+        raise ValueError(f'at most {UPLOAD_ROWS} rows fit one upload frame')
+    if start < 0 or start + len(rows) > TABLE_CAPACITY:
+        raise ValueError(f'rows {start}..{start + len(rows) - 1} do not fit the {TABLE_CAPACITY} row table')
+    return struct.pack('<BHH', CMD_UPLOAD, start, len(rows)) + rows.tobytes()
+
+
+def encode_select(k: int) -> bytes:
+    '''latch table state k'''
+    return struct.pack('<BH', CMD_SELECT, k)
+
+
+def encode_next() -> bytes:
+    '''latch the table state after the current one (wraps at the end of the active range)'''
+    return bytes([CMD_NEXT])
+
+
+def encode_range(start: int, count: int) -> bytes:
+    '''rows start..start+count-1 are the ones CMD_NEXT and the trigger step through'''
+    return struct.pack('<BHH', CMD_RANGE, start, count)
+
+
+def encode_trigger(enable: bool) -> bytes:
+    '''advance through the table on the hardware trigger pin'''
+    return bytes([CMD_TRIGGER, int(bool(enable))])
+
+
+def encode_delta(base: np.ndarray, words: np.ndarray, changed: np.ndarray) -> bytes:
+    '''
+    latch only the elements in changed, valid only if the MCU currently holds base
+    Args:
+        base (np.ndarray): NUM_ELEMENTS words the MCU is expected to hold
+        words (np.ndarray): NUM_ELEMENTS target words
+        changed (np.ndarray): element indices to update
+    '''
+    changed = np.asarray(changed, dtype=np.uint8)
+    pairs = np.stack([changed, np.asarray(words, dtype=np.uint8)[changed]], axis=1)
+    return bytes([CMD_SET_DELTA, crc8(np.asarray(base, dtype=np.uint8).tobytes())]) + pairs.tobytes()
+
+
+def encode_set_baud(baudrate: int) -> bytes:
+    '''switch the MCU serial rate (takes effect after the ACK)'''
+    return struct.pack('<BI', CMD_SET_BAUD, int(baudrate))
+
+
+def encode_ping() -> bytes:
+    return bytes([CMD_PING])
+
+
+class McuLink:
+    '''
+    Framed, acknowledged link to the MCU over a serial.Serial-like handle.
+    send(payload, ack=True) returns only once the MCU reported the command as
+    executed; a missing or negative ACK is retried with the same sequence number.
+    Args:
+        ser: serial port (needs write, read, in_waiting)
+        ack_timeout (float): seconds to wait for each ACK
+        retries (int): retransmissions before send() gives up
+    '''
+    def __init__(self, ser, ack_timeout: float = 0.05, retries: int = 3):
+        self.ser = ser
+        self.ack_timeout = ack_timeout
+        self.retries = retries
+        self.seq = 0
+        #diagnostics
+        self.retransmits = 0
+        self.failures = 0
+        self.naks = 0 #negative statuses received, including unsolicited ones
+        self._rx = bytearray()
+        self._lock = threading.Lock()
+
+    @property
+    def baudrate(self) -> float:
+        return self.ser.baudrate
+
+    def _poll_ack(self, seq: int, deadline: float):
+        '''status of the ACK for seq, or None on timeout. ACKs for other frames are dropped'''
+        while True:
+            waiting = self.ser.in_waiting
+            if waiting:
+                self._rx += self.ser.read(waiting)
+            rx = self._rx
+            while len(rx) >= ACK_SIZE:
+                if rx[0] != ACK_START or crc8(rx[1:3]) != rx[3]:
+                    del rx[:1] #resync on the next candidate
+                    continue
+                ack_seq, status = rx[1], rx[2]
+                del rx[:ACK_SIZE]
+                if status != ACK_OK:
+                    self.naks += 1
+                if ack_seq == seq:
+                    return status
+            if time.perf_counter() >= deadline:
+                return None
+            if not waiting:
+                time.sleep(1e-4)
+
+    def send(self, payload: bytes, ack: bool = False) -> bool:
+        '''
+        Send one command.
+        Returns:
+            bool: True when sent (ack=False) or acknowledged as executed (ack=True)
+        '''
+        with self._lock:
+            self.seq = (self.seq + 1) & 0xFF
+            frame = encode_frame(self.seq, payload, ack)
+            if not ack:
+                self.ser.write(frame)
+                return True
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    self.retransmits += 1
+                self.ser.write(frame)
+                status = self._poll_ack(self.seq, time.perf_counter() + self.ack_timeout)
+                if status == ACK_OK:
+                    return True
+                if status == ACK_BAD:
+                    break #retrying cannot help
+            self.failures += 1
+            return False
+
+    def sync(self) -> bool:
+        '''
+        Align the MCU's last executed SEQ with this link, call it once after
+        opening the link. A new link starts counting at 1 while the MCU still
+        remembers the SEQ of the previous host, a first frame that happened to
+        reuse it would be ACKed but not executed. A ping is a no-op either way
+        and leaves both sides at the same SEQ.
+        Returns:
+            bool: True if the MCU answered the ping
+        '''
+        with self._lock:
+            self.seq = (self.seq + 1) & 0xFF
+            frame = encode_frame(self.seq, encode_ping(), ack=True)
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    self.retransmits += 1
+                self.ser.write(frame)
+                #a reused SEQ is answered with the status of the old frame, any
+                #answer that is not a checksum error means the MCU took this SEQ
+                status = self._poll_ack(self.seq, time.perf_counter() + self.ack_timeout)
+                if status is not None and status != ACK_CRC:
+                    return True
+            self.failures += 1
+            return False
+
+    def flush(self):
+        self.ser.flush()
+
+    def poll(self):
+        '''read pending answers without waiting, updates naks'''
+        with self._lock:
+            self._poll_ack(None, 0)
+
+    def reset_input(self):
+        '''drop anything received so far (e.g. after a baud change)'''
+        self._rx.clear()
+        self.ser.reset_input_buffer()
+
+
+def baud_error(baudrate: int, clock: int = MCU_CLOCK) -> float:
+    '''
+    relative error of the rate the MCU UART really runs at, same divisor as
+    the AVR HardwareSerial::begin (double speed mode, UBRR = (clock/4/baud - 1)/2),
+    i.e. only meaningful for the Mega sketch
+    '''
+    ubrr = (clock // 4 // int(baudrate) - 1) // 2
+    if ubrr < 0:
+        return float('inf') #faster than the UART can go
+    return abs(clock / (8 * (ubrr + 1)) - baudrate) / baudrate
+
+
+def negotiate_baud(link: McuLink, baudrate: int) -> bool:
+    '''
+    Move the link to a faster baud rate.
+    Rates the MCU clock cannot produce within MAX_BAUD_ERROR are refused up
+    front, and a ping at the old rate checks the firmware answers before
+    anything changes. The MCU acknowledges CMD_SET_BAUD at the old rate, then
+    both sides switch and a ping confirms the new rate. On failure the host
+    returns to the old rate and waits out the MCU probation so both sides
+    agree again.
+    Only the Mega sketch changes its rate: a build for another core answers
+    ACK_BAD, firmware without this protocol never answers the ping, either
+    way the link stays where it is.
+    Returns:
+        bool: True if the link now runs at baudrate
+    '''
+    old = link.ser.baudrate
+    if baudrate == old:
+        return True
+    if baud_error(baudrate) > MAX_BAUD_ERROR:
+        return False
+    if not link.sync():
+        return False
+    if not link.send(encode_set_baud(baudrate), ack=True):
+        return False
+    link.ser.baudrate = baudrate
+    time.sleep(0.005) #MCU restarts its UART after sending the ACK
+    link.reset_input()
+    if link.send(encode_ping(), ack=True):
+        return True
+    link.ser.baudrate = old
+    time.sleep(BAUD_PROBATION + 0.1)
+    link.reset_input()
+    return False
+
+
+class DeltaLink:
+    '''
+    McuLink wrapper that turns CMD_SET_PHASES frames into CMD_SET_DELTA frames
+    when at most DELTA_MAX words differ from the state latched last, so slider
+    drags and tracking loops only send (and the MCU only shifts) the changed
+    elements. Unchanged states are not sent at all.
+    The words are tracked as they are sent; any NAK from the MCU, a failed
+    send or a table command makes the state unknown and the next update goes
+    out as a full frame. Other commands are passed through.
+    Must see every command in order, i.e. sit below SerialTransport.
+    Args:
+        link (McuLink): framed link to the MCU
+    '''
+    def __init__(self, link: McuLink):
+        self.link = link
+        self.words = None #words the MCU holds, None if unknown
+        self.confirmed = False #words were acknowledged, not only sent
+        #diagnostics
+        self.full_frames = 0
+        self.delta_frames = 0
+        self.skipped = 0
+        self._naks = link.naks
+
+    @property
+    def baudrate(self) -> float:
+        return self.link.baudrate
+
+    def flush(self):
+        self.link.flush()
+
+    def invalidate(self):
+        self.words = None
+        self.confirmed = False
+
+    def send(self, payload: bytes, ack: bool = False) -> bool:
+        if payload[0] != CMD_SET_PHASES or len(payload) != NUM_ELEMENTS + 1:
+            ok = self.link.send(payload, ack)
+            if payload[0] in (CMD_SELECT, CMD_NEXT, CMD_TRIGGER, CMD_RANGE) or not ok:
+                self.invalidate()
+            return ok
+        words = np.frombuffer(payload, dtype=np.uint8, offset=1)
+        self.link.poll()
+        if self.link.naks != self._naks:
+            #an earlier update was dropped or rejected
+            self._naks = self.link.naks
+            self.invalidate()
+        if self.words is not None:
+            changed = np.flatnonzero(words != self.words)
+            if not len(changed) and (self.confirmed or not ack):
+                self.skipped += 1
+                return True
+            if len(changed) <= DELTA_MAX:
+                ok = self.link.send(encode_delta(self.words, words, changed), ack)
+                self._naks = self.link.naks
+                if ok:
+                    self.delta_frames += 1
+                    return self._latched(words, ack)
+                #rejected or lost, send the whole state instead
+        ok = self.link.send(payload, ack)
+        self._naks = self.link.naks
+        self.full_frames += 1
+        if not ok:
+            self.invalidate()
+            return False
+        return self._latched(words, ack)
+
+    def _latched(self, words: np.ndarray, ack: bool) -> bool:
+        self.words = words.copy()
+        self.confirmed = ack
+        return True
+
+
+class SerialTransport:
+    '''
+    Non-blocking front end for McuLink: commands are queued and written by a
+    dedicated thread, so GUI handlers never wait on the serial port.
+    Commands submitted with the same key replace a queued, not yet sent command
+    with that key when it is the last one in the queue (order is preserved).
+    E.g. slider drags submit phase frames with key='phases': while one frame
+    drains, only the newest of the following updates is sent.
+    Exposes send()/flush()/baudrate like McuLink, so PhaseTable can use it.
+    Args:
+        link (McuLink or DeltaLink): framed link doing the actual I/O
+    '''
+    def __init__(self, link: McuLink):
+        self.link = link
+        self.coalesced = 0 #frames that were replaced before being sent
+        self._queue = collections.deque() #[payload, ack, key, futures]
+        self._cond = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def baudrate(self) -> float:
+        return self.link.baudrate
+
+    def submit(self, payload: bytes, ack: bool = False, key=None) -> Future:
+        '''
+        Queue a command.
+        Returns:
+            Future: resolves to the McuLink.send result once the frame (or the
+            frame that replaced it) has been written / acknowledged
+        '''
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise IOError('serial transport is closed')
+            tail = self._queue[-1] if self._queue else None
+            if key is not None and tail is not None and tail[2] == key:
+                tail[0] = payload
+                tail[1] = tail[1] or ack
+                tail[3].append(future)
+                self.coalesced += 1
+            else:
+                self._queue.append([payload, ack, key, [future]])
+            self._cond.notify_all()
+        return future
+
+    def send(self, payload: bytes, ack: bool = False) -> bool:
+        '''blocking send, in order with everything submitted before'''
+        return self.submit(payload, ack).result()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                payload, ack, _, futures = self._queue.popleft()
+                self._busy = True
+            try:
+                ok = self.link.send(payload, ack)
+                if not ack:
+                    #wait for the frame to drain so newer updates can coalesce meanwhile
+                    self.link.flush()
+            except Exception as e:
+                print(f'Serial write failed: {e}')
+                for f in futures:
+                    f.set_exception(e)
+            else:
+                for f in futures:
+                    f.set_result(ok)
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+    def flush(self):
+        '''block until everything queued has been written'''
+        with self._cond:
+            while self._queue or self._busy:
+                self._cond.wait()
+        self.link.flush()
+
+    def close(self):
+        '''send what is queued, then stop the writer thread'''
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+
+class PhaseTable:
+    '''
+    Host view of the phase table stored on the MCU.
+    Several tables can be resident at once; each is identified by the hash of
+    its words, so loading the same table again (e.g. repeated scans of
+    DEFAULT_RX_GRID) does not re-upload it. When the table is full everything
+    is evicted and the new table starts at row 0.
+    Loading a table also makes its rows the MCU's active range, so CMD_NEXT
+    and the trigger wrap at the end of that table and never run into rows of
+    another one.
+    Uploads and range changes are always acknowledged.
+    Args:
+        link (McuLink or SerialTransport): framed link to the MCU
+        capacity (int): rows available on the MCU
+    '''
+    def __init__(self, link, capacity: int = TABLE_CAPACITY):
+        self.link = link
+        self.capacity = capacity
+        self.uploads = 0 #number of tables actually sent, for diagnostics
+        self.current = None #table row latched last
+        self.range = None #(start, n_rows) CMD_NEXT wraps in, None if unknown
+        self._resident = collections.OrderedDict() #digest -> (start, n_rows)
+        self._next_free = 0
+
+    def invalidate(self):
+        '''forget what is on the MCU (after a reset or reconnect)'''
+        self._resident.clear()
+        self._next_free = 0
+        self.current = None
+        self.range = None
+
+    def load(self, words: np.ndarray) -> int:
+        '''
+        Make sure a table of hardware words is resident and is the active range.
+        Args:
+            words (np.ndarray): (n_states, NUM_ELEMENTS) uint8, see quantize_phases
+        Returns:
+            int: table index of the first row
+        '''
+        words = np.ascontiguousarray(words, dtype=np.uint8).reshape(-1, NUM_ELEMENTS)
+        if len(words) > self.capacity:
+            raise ValueError(f'{len(words)} states do not fit the {self.capacity} row table')
+        digest = hashlib.blake2b(words.tobytes(), digest_size=16).digest()
+        if digest in self._resident:
+            self._resident.move_to_end(digest)
+            start = self._resident[digest][0]
+        else:
+            if self._next_free + len(words) > self.capacity:
+                self.invalidate()
+            start = self._next_free
+            for k in range(0, len(words), UPLOAD_ROWS):
+                if not self.link.send(encode_upload(start + k, words[k:k + UPLOAD_ROWS]), ack=True):
+                    self.invalidate()
+                    raise IOError('phase table upload was not acknowledged by the MCU')
+            self._resident[digest] = (start, len(words))
+            self._next_free += len(words)
+            self.uploads += 1
+        self.activate(start, len(words))
+        return start
+
+    def activate(self, start: int, n_rows: int):
+        '''make rows start..start+n_rows-1 the range CMD_NEXT and the trigger wrap in'''
+        if self.range == (start, n_rows):
+            return
+        if not self.link.send(encode_range(start, n_rows), ack=True):
+            self.range = None
+            raise IOError('phase table range was not acknowledged by the MCU')
+        self.range = (start, n_rows)
+
+    def _following(self, k: int):
+        '''row CMD_NEXT latches after row k, None if unknown'''
+        if k is None or self.range is None:
+            return None
+        start, n_rows = self.range
+        return start if not start <= k < start + n_rows - 1 else k + 1
+
+    def _sent(self, ok: bool, k: int) -> bool:
+        #after a failed command the MCU position is unknown, the next step selects
+        self.current = k if ok else None
+        return ok
+
+    def select(self, k: int, ack: bool = False) -> bool:
+        '''latch row k'''
+        return self._sent(self.link.send(encode_select(k), ack), k)
+
+    def advance(self, ack: bool = False) -> bool:
+        '''latch the row after the current one, wrapping inside the active range'''
+        return self._sent(self.link.send(encode_next(), ack), self._following(self.current))
+
+    def step(self, k: int, ack: bool = False) -> bool:
+        '''
+        Latch row k with the shortest command (CMD_NEXT when scanning in order).
+        With ack=True the return value tells whether row k is confirmed latched.
+        '''
+        if self.current is not None and k == self._following(self.current):
+            return self.advance(ack)
+        return self.select(k, ack)
+
+    def set_trigger(self, enable: bool) -> bool:
+        '''let the trigger pin advance through the table'''
+        ok = self.link.send(encode_trigger(enable), ack=True)
+        self.current = None #position now depends on the hardware edges
+        return ok
@@ -0,0 +1,212 @@
+'''
+Over-the-air phase calibration with the PLUTO and a reference antenna at boresight.
+
+At boresight every element contributes w_n = a_n exp(j phi_n), the unknown
+amplitude and phase error of its path, and the received tone power for
+commanded phases c is
+    P(c) = |sum_n w_n exp(j c_n)|^2
+The routine rotates groups of elements by 90, 180 and 270 degrees relative to
+the rest of the array and fits w to the measured powers.
+
+Patterns:
+    'rev'       one element per group (rotating element electric vector method),
+                16 groups x 3 steps + the all zero state = 49 patterns
+    'hadamard'  group k holds the elements where row k of a 16x16 Hadamard
+                matrix is -1, so every pattern moves half the array and the
+                power changes are ~8x larger than for a single element
+                (15 groups x 3 steps + 1), plus OTA_CODED_PATTERNS patterns with
+                pseudo random 0/90/180/270 phases on every element = 86 patterns
+A half array split alone cannot be inverted: the real part of each group sum
+has two roots (the group and its complement swapped) that predict identical
+powers, the coded patterns break that tie.
+Either way the whole calibration is a few hundred 4 ms captures, compared
+to 16 x 256 for sweeping every element through all phase words.
+
+The fit is a Levenberg-Marquardt (damped Gauss-Newton) least squares fit of
+w to the powers, started from the spectral estimate (leading eigenvector of
+sum_k P_k e_k^H e_k) and a few random phasors, the lowest cost wins.
+Powers are only known up to a common phase, so w is returned with sum(w)
+real and positive. The sign convention of the shifters does not matter:
+conj(w) explains the powers of the mirrored patterns, and the offsets from
+apply_correction are correct either way.
+
+The model has no additive term: measure has to return the power of the tone
+alone (PLUTO.buffer_power with estimator='tone'). The mean square of the
+buffer adds the noise floor and DC to every pattern, which the fit can only
+explain by shrinking the deep patterns and distorting the phases.
+
+Usage:
+    result = ota_calibrate(measure)  #measure(rows) -> tone power of each row
+    PHASE_OFFSETS = apply_correction(PHASE_OFFSETS, result['phase_errors'])
+'''
+import numpy as np
+from config import NUM_ELEMENTS, OTA_METHOD, OTA_REPEATS, OTA_CODED_PATTERNS
+
+#phase steps applied to each group, 0 is the shared reference pattern
+STEPS = (90, 180, 270)
+#fit starts besides the spectral estimate
+RANDOM_STARTS = 7
+
+
+def hadamard(n: int) -> np.ndarray:
+    '''Sylvester Hadamard matrix of order n (power of 2), entries +-1'''
+    if n < 1 or n & (n - 1):
+        raise ValueError(f'Hadamard order must be a power of 2, got {n}')
+    h = np.ones((1, 1), dtype=int)
+    while len(h) < n:
+        h = np.block([[h, h], [h, -h]])
+    return h
+
+
+def calibration_groups(method: str = OTA_METHOD, n_elements: int = NUM_ELEMENTS) -> np.ndarray:
+    '''
+    element groups that are rotated together
+    Returns:
+        np.ndarray: (n_groups, n_elements) bool, True for the rotated elements
+    '''
+    if method == 'rev':
+        return np.eye(n_elements, dtype=bool)
+    if method == 'hadamard':
+        #row 0 is all +1 (nothing rotated), it is the reference pattern
+        return hadamard(n_elements)[1:] < 0
+    raise ValueError(f"unknown calibration method '{method}', use 'hadamard' or 'rev'")
+
+
+def calibration_patterns(method: str = OTA_METHOD, n_elements: int = NUM_ELEMENTS) -> np.ndarray:
+    '''
+    commanded phases (degrees) of every pattern
+    row 0 is all zeros, then STEPS for group 0, STEPS for group 1, ...
+    and for 'hadamard' the coded patterns (same every run)
+    Returns:
+        np.ndarray: (n_patterns, n_elements)
+    '''
+    groups = calibration_groups(method, n_elements)
+    steps = np.asarray(STEPS, dtype=float)
+    rows = (groups[:, None, :] * steps[None, :, None]).reshape(-1, n_elements)
+    patterns = [np.zeros((1, n_elements)), rows]
+    if method == 'hadamard':
+        coded = np.random.default_rng(0).integers(0, 4, (OTA_CODED_PATTERNS, n_elements))
+        patterns.append(90.0 * coded)
+    return np.concatenate(patterns)
+
+
+def model_powers(w: np.ndarray, patterns: np.ndarray) -> np.ndarray:
+    '''P = |sum_n w_n exp(j c_n)|^2 for each pattern row'''
+    return np.abs(np.exp(1j * np.deg2rad(patterns)) @ w)**2
+
+
+def _spectral_start(e: np.ndarray, powers: np.ndarray) -> np.ndarray:
+    '''leading eigenvector of the power weighted pattern covariance, scaled to the powers'''
+    v = np.linalg.eigh((e.conj().T * powers) @ e)[1][:, -1]
+    return v * np.sqrt(powers.mean() / np.mean(np.abs(e @ v)**2))
+
+
+def _levenberg_marquardt(e: np.ndarray, powers: np.ndarray, w: np.ndarray,
+                         iterations: int, tol: float = 1e-12) -> tuple:
+    '''minimize sum (|e w|^2 - powers)^2 over w, returns (w, cost)'''
+    n = e.shape[1]
+    x = np.concatenate([w.real, w.imag])
+    lam = 1e-3
+
+    def residual(x):
+        return np.abs(e @ (x[:n] + 1j * x[n:]))**2 - powers
+
+    r = residual(x)
+    cost = r @ r
+    for _ in range(iterations):
+        z = e @ (x[:n] + 1j * x[n:])
+        #dP/dRe(w) = 2 Re(conj(z) e), dP/dIm(w) = -2 Im(conj(z) e)
+        ze = np.conj(z)[:, None] * e
+        jac = np.hstack([2 * ze.real, -2 * ze.imag])
+        jtj = jac.T @ jac
+        grad = jac.T @ r
+        while True:
+            step = np.linalg.solve(jtj + lam * np.diag(np.diag(jtj) + 1e-12), -grad)
+            r_new = residual(x + step)
+            cost_new = r_new @ r_new
+            if cost_new < cost or lam > 1e9:
+                break
+            lam *= 4
+        if cost_new >= cost:
+            break
+        improvement = (cost - cost_new) / cost
+        x, r, cost = x + step, r_new, cost_new
+        lam = max(lam / 3, 1e-9)
+        if improvement < tol:
+            break
+    return x[:n] + 1j * x[n:], cost
+
+
+def fit_element_errors(patterns: np.ndarray, powers: np.ndarray, iterations: int = 100,
+                       starts: int = RANDOM_STARTS, seed: int = 0) -> tuple:
+    '''
+    least squares fit of the element phasors to measured powers
+    Args:
+        patterns (np.ndarray): (K, n_elements) commanded phases in degrees
+        powers (np.ndarray): (K,) measured powers
+        iterations (int): maximum Levenberg-Marquardt steps per start
+        starts (int): random starts tried after the spectral one
+    Returns:
+        (w, residual): complex phasors with sum(w) real positive, rms power residual
+            relative to the mean power
+    '''
+    powers = np.asarray(powers, dtype=float)
+    e = np.exp(1j * np.deg2rad(patterns))
+    n = e.shape[1]
+    rng = np.random.default_rng(seed)
+    scale = np.sqrt(powers.mean()) / n
+    candidates = [_spectral_start(e, powers)]
+    candidates += [scale * np.exp(2j * np.pi * rng.random(n)) for _ in range(starts)]
+    w, cost = min((_levenberg_marquardt(e, powers, w0, iterations) for w0 in candidates),
+                  key=lambda fit: fit[1])
+    #powers fix w only up to a common phase
+    total = np.sum(w)
+    if abs(total) > 0:
+        w = w * np.conj(total) / abs(total)
+    return w, np.sqrt(cost / len(powers)) / max(powers.mean(), 1e-300)
+
+
+def apply_correction(offsets: np.ndarray, phase_errors: np.ndarray) -> np.ndarray:
+    '''
+    new phase offsets (degrees, 0-360, smallest is 0) that cancel the measured
+    errors on top of the offsets that were applied during the measurement
+    '''
+    new = (np.asarray(offsets, dtype=float) - phase_errors) % 360
+    return (new - new.min()) % 360
+
+
+def ota_calibrate(measure, method: str = OTA_METHOD, repeats: int = OTA_REPEATS) -> dict:
+    '''
+    run the calibration patterns through measure and fit the element errors
+    Args:
+        measure (callable): measure(rows) -> np.ndarray of the received tone power
+            for each row of commanded phases (degrees), calibration offsets applied
+        method (str): 'hadamard' or 'rev'
+        repeats (int): times the pattern set is measured, powers are averaged
+    Returns:
+        dict with
+            phase_errors: per element phase error (degrees, -180..180, mean removed)
+            amplitudes: per element amplitude relative to the mean
+            phasors: fitted complex w
+            residual: rms fit residual relative to the mean power
+            n_captures: number of powers measured
+    '''
+    patterns = calibration_patterns(method)
+    #the same pattern set every repeat, so a phase table upload is reused
+    measured = np.array([np.asarray(measure(patterns), dtype=float) for _ in range(repeats)])
+    #patterns the scan never captured (NaN) are averaged over the other repeats or left out
+    captured = np.isfinite(measured)
+    powers = np.where(captured, measured, 0).sum(axis=0) / np.maximum(captured.sum(axis=0), 1)
+    keep = captured.any(axis=0)
+    w, residual = fit_element_errors(patterns[keep], powers[keep])
+    phase = np.angle(w)
+    #relative to the average element, wrapped to +-180
+    phase_errors = np.rad2deg(np.angle(np.exp(1j * (phase - np.angle(np.sum(np.exp(1j * phase)))))))
+    amplitudes = np.abs(w) / np.mean(np.abs(w))
+    return {
+        'phase_errors': phase_errors,
+        'amplitudes': amplitudes,
+        'phasors': w,
+        'residual': residual,
+        'n_captures': int(captured.sum()),
+    }
@@ -0,0 +1,325 @@
+'''
+Pipelined receive-mode scan engine.
+
+The original scan wrote a phase state, blocked on sdr.rx(), then moved on,
+so serial wire time and SDR dwell time added up for every grid row.
+Here a capture worker thread pulls a Pluto buffer as soon as a state is
+confirmed latched (write_state returns after the MCU's ACK) and has settled,
+and tags it with that state. The driver queues up to RX_KERNEL_BUFFERS
+buffers ahead of sdr.rx(), so that many buffers are dropped after every
+latch before one is tagged; the tagged buffer can only hold samples taken
+after the latch. On the Pluto (2 queued buffers) a state read directly
+therefore costs 3 buffers (~4.9 ms) plus the ACK round trip, no faster
+than the serial scan. Run the engine with the rx stream held
+(PLUTO.streaming(), stale=0) instead: the stream reads back to back so the
+queue stays empty and capture() returns the first block that started after
+the call, ~1.5 buffers per state on average.
+The control thread starts writing state i+1 while the buffer for state i is
+still being captured: the MCU only latches once the last byte of the frame
+has arrived, so the write is timed to finish right as the capture ends.
+
+Any buffer whose window (from the latch it was tagged with to the end of the
+capture) contains the earliest possible next latch is thrown away and that
+state is revisited in a retry pass. States still missing after max_passes
+(or after cancel) are NaN, callers mask them.
+
+adaptive_search() replaces the fixed THETA_RANGE x PHI_RANGE grid with a
+coarse-to-fine search when only the strongest emitter is of interest.
+
+Usage:
+    engine = PipelinedScan(write_state, capture, buffer_power)
+    energies = engine.run(len(DEFAULT_RX_GRID))
+'''
+import threading, time
+import numpy as np
+from config import (BAUDRATE, BUFFER_SIZE, SAMP_RATE, NUM_ELEMENTS, THETA_RANGE,
+    RX_KERNEL_BUFFERS, SCAN_SETTLE, ADAPTIVE_COARSE_THETA, ADAPTIVE_COARSE_PHI, ADAPTIVE_RESOLUTION)
+from create_default_rx_grid import steering_phases
+
+
+class PipelinedScan:
+    '''
+    Overlap serial phase writes with SDR captures.
+
+    Args:
+        write_state (callable): write_state(i) sends phase state i to the MCU
+            and returns once the MCU acknowledged the latch (ack=True), so the
+            state is known to be latched when it returns. Returning False means
+            the state was not confirmed; it is left for a retry pass
+        capture (callable): returns one raw rx buffer
+        reduce (callable): reduce(rx) -> float, energy of one buffer
+        write_time (float): minimum time (s) the frame spends on the wire,
+            the latch can never happen earlier than this after a write starts
+        margin (float): guard (s) for capture jitter, the next frame is timed
+            to land this long after the expected end of the current capture
+        settle (float): time (s) after the acknowledged latch before the
+            phase shifters are considered settled
+        stale (int): buffers dropped after each latch before one is tagged,
+            the depth of the driver's rx buffer queue (PLUTO.stale_buffers(),
+            0 while the rx stream is held)
+        max_passes (int): how many times to revisit states whose buffers were
+            discarded
+    '''
+
+    def __init__(self, write_state, capture, reduce,
+                 write_time: float = NUM_ELEMENTS * 10 / BAUDRATE,
+                 margin: float = 200e-6, settle: float = SCAN_SETTLE,
+                 stale: int = RX_KERNEL_BUFFERS, max_passes: int = 3):
+        self.write_state = write_state
+        self.capture = capture
+        self.reduce = reduce
+        self.write_time = write_time
+        self.margin = margin
+        self.settle = settle
+        self.stale = stale
+        self.max_passes = max_passes
+        #estimated duration of one capture, refined with an EMA while scanning
+        self.dwell = BUFFER_SIZE / SAMP_RATE
+        #progress counters, read by the GUI while run() is busy
+        self.done = 0
+        self.total = 0
+        self.discarded = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        '''abort a running scan, run() returns with NaN for unvisited states'''
+        self._cancel.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    # ---- capture worker ----
+    def _ready(self) -> bool:
+        '''true when the latched state still needs a buffer'''
+        return (not self._writing and self._state >= 0
+                and not self._filled[self._state]
+                and time.perf_counter() >= self._settled)
+
+    def _capture_loop(self):
+        try:
+            while not self._stop.is_set():
+                with self._cond:
+                    while not self._stop.is_set() and not self._ready():
+                        self._cond.wait(max(self._settled - time.perf_counter(), 1e-4)
+                                        if np.isfinite(self._settled) else 0.05)
+                    if self._stop.is_set():
+                        return
+                    state = self._state
+                    t_latched = self._settled
+                #buffers queued by the driver may predate the latch
+                for _ in range(self.stale):
+                    self.capture()
+                with self._cond:
+                    if self._state != state:
+                        continue
+                    #tag the buffer with the state latched when it started
+                    t_start = time.perf_counter()
+                    self._candidate = (state, t_start)
+                    self._cond.notify_all()
+                rx = self.capture()
+                t_end = time.perf_counter()
+                #follows longer captures at once, shorter ones slowly: timing the next
+                #write to the typical capture spoils every longer one
+                self.dwell = max(t_end - t_start, 0.95 * self.dwell + 0.05 * (t_end - t_start))
+                with self._cond:
+                    #a later latch that may have happened before the buffer was
+                    #complete spoils it (the buffer may be older than its rx() call)
+                    clean = not (t_latched < self._next_latch <= t_end)
+                    if not clean:
+                        self.discarded += 1
+                        self._missing.add(state)
+                        self._cond.notify_all()
+                if clean:
+                    #reduction overlaps with the next serial write
+                    self._energies[state] = self.reduce(rx)
+                    with self._cond:
+                        self._filled[state] = True
+                        self.done += 1
+                        self._cond.notify_all()
+        except Exception as e:
+            self._error = e
+            self.cancel()
+
+    # ---- control ----
+    def _latch(self, i: int) -> bool:
+        '''write state i and publish when it becomes valid, False if it was not confirmed'''
+        with self._cond:
+            #earliest moment the MCU can latch the new frame
+            self._next_latch = time.perf_counter() + self.write_time
+            self._writing = True
+        ok = False
+        try:
+            ok = self.write_state(i) is not False
+        finally:
+            with self._cond:
+                self._writing = False
+                #an unconfirmed state is never tagged onto buffers
+                self._state = i if ok else -1
+                self._settled = time.perf_counter() + self.settle
+                self._candidate = None
+                self._cond.notify_all()
+        return ok
+
+    def _wait(self, predicate):
+        with self._cond:
+            while not predicate() and not self._cancel.is_set():
+                self._cond.wait(0.5)
+
+    def _run_pass(self, order: list):
+        for pos, i in enumerate(order):
+            if self._cancel.is_set():
+                return
+            #a capture still in flight from the last pass may have filled it
+            if self._filled[i] or not self._latch(i):
+                continue
+            if pos + 1 == len(order):
+                self._wait(lambda: self._filled[i] or i in self._missing)
+                return
+            #wait until a clean buffer for state i is in flight
+            self._wait(lambda: (self._candidate is not None and self._candidate[0] == i)
+                       or self._filled[i])
+            if self._cancel.is_set() or self._candidate is None:
+                continue
+            _, t_start = self._candidate
+            #start the next write so that it lands just as this capture ends
+            lead = t_start + self.dwell + self.margin - self.write_time
+            delay = lead - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def run(self, n_states: int) -> np.ndarray:
+        '''
+        Scan states 0..n_states-1.
+        Returns:
+            energies (np.ndarray): one energy per state, NaN if never captured
+        '''
+        self.total = n_states
+        self.done = 0
+        self.discarded = 0
+        self._energies = np.full(n_states, np.nan)
+        self._filled = np.zeros(n_states, dtype=bool)
+        self._missing = set()
+        self._state = -1
+        self._settled = np.inf
+        self._next_latch = -np.inf
+        self._candidate = None
+        self._writing = False
+        self._error = None
+        self._stop.clear()
+        self._cancel.clear()
+        worker = threading.Thread(target=self._capture_loop, daemon=True)
+        worker.start()
+        try:
+            order = list(range(n_states))
+            for _ in range(self.max_passes + 1):
+                self._missing.clear()
+                self._run_pass(order)
+                order = [int(i) for i in np.flatnonzero(~self._filled)]
+                if not order or self._cancel.is_set():
+                    break
+        finally:
+            self._stop.set()
+            worker.join()
+        if self._error is not None:
+            raise self._error
+        return self._energies
+
+
+def serial_scan(write_state, measure, n_states: int) -> np.ndarray:
+    '''reference (non pipelined) scan: write, measure, repeat'''
+    energies = np.zeros(n_states)
+    for i in range(n_states):
+        write_state(i)
+        energies[i] = measure()
+    return energies
+
+
+def _parabolic_peak(e_minus: float, e_0: float, e_plus: float) -> float:
+    '''sub-step offset (-0.5..0.5 steps) of the vertex through three samples'''
+    denom = e_minus - 2 * e_0 + e_plus
+    if not np.isfinite(denom) or denom >= 0:
+        return 0.0
+    return float(np.clip(0.5 * (e_minus - e_plus) / denom, -0.5, 0.5))
+
+
+def adaptive_search(measure, dx: float, dy: float, theta_max: float = THETA_RANGE[-1],
+                    coarse_theta: int = ADAPTIVE_COARSE_THETA, coarse_phi: int = ADAPTIVE_COARSE_PHI,
+                    resolution: float = ADAPTIVE_RESOLUTION, start: tuple = None, progress=None) -> dict:
+    '''
+    Coarse-to-fine DOA search.
+    A sparse coarse grid is scanned first, then the 8 neighbours of the strongest
+    direction are probed with the step halved each level until the angular step
+    reaches resolution. A parabolic fit through the final neighbours gives a
+    peak estimate finer than the last step.
+    Args:
+        measure (callable): measure(phase_rows) -> energies, one row per direction
+        dx,dy (float): element spacing in wavelengths
+        theta_max (float): largest elevation to search (deg)
+        coarse_theta, coarse_phi (int): size of the coarse grid
+        resolution (float): target angular step (deg)
+        start (tuple): (theta, phi) of a previous fix, skips the coarse grid
+            and starts refining at a quarter of the coarse step (tracking)
+        progress (callable): progress(n_dwells, step_deg) after each level
+    Returns:
+        dict with theta, phi (deg), energy, n_dwells and samples (N x 3 array of
+        theta, phi, energy for every measured direction)
+    '''
+    d_theta = theta_max / (coarse_theta - 1)
+    d_phi = 360 / coarse_phi
+    seen = {}
+
+    def key(t, p):
+        #every phi is the same direction at broadside
+        return (round(t, 6), 0.0) if t < 1e-9 else (round(t, 6), round(p % 360, 6))
+
+    def probe(dirs):
+        new = []
+        for t, p in dirs:
+            k = key(t, p)
+            if k not in seen and k not in new:
+                new.append(k)
+        if new:
+            t, p = np.array(new).T
+            energies = measure(steering_phases(t, p, dx, dy))
+            #directions the scan could not capture (NaN) are left out
+            seen.update((k, e) for k, e in zip(new, energies) if np.isfinite(e))
+        if not seen:
+            raise RuntimeError('no direction could be measured')
+        return [seen.get(key(t, p), np.nan) for t, p in dirs]
+
+    if start is None:
+        thetas = np.linspace(0, theta_max, coarse_theta)
+        phis = np.arange(coarse_phi) * d_phi
+        probe([(t, p) for t in thetas for p in phis])
+    else:
+        d_theta, d_phi = d_theta / 4, d_phi / 4
+        probe([tuple(start)])
+    best = max(seen, key=lambda k: seen[k])
+    if progress is not None:
+        progress(len(seen), d_theta)
+
+    while True:
+        d_theta, d_phi = d_theta / 2, d_phi / 2
+        t0, p0 = best
+        neighbours = [(np.clip(t0 + i * d_theta, 0, theta_max), p0 + j * d_phi)
+                      for i in (-1, 0, 1) for j in (-1, 0, 1) if i or j]
+        probe(neighbours)
+        best = max(seen, key=lambda k: seen[k])
+        if progress is not None:
+            progress(len(seen), d_theta)
+        if max(d_theta, d_phi * np.sin(np.deg2rad(max(best[0], d_theta)))) <= resolution:
+            break
+
+    #sub-step peak estimate from the axis neighbours of the best direction
+    t0, p0 = best
+    e0 = seen[best]
+    if 0 < t0 < theta_max:
+        e_lo, e_hi = probe([(t0 - d_theta, p0), (t0 + d_theta, p0)])
+        t0 += _parabolic_peak(e_lo, e0, e_hi) * d_theta
+    if best[0] > 0:
+        e_lo, e_hi = probe([(best[0], p0 - d_phi), (best[0], p0 + d_phi)])
+        p0 += _parabolic_peak(e_lo, e0, e_hi) * d_phi
+    samples = np.array([(t, p, e) for (t, p), e in seen.items()])
+    return {'theta': float(t0), 'phi': float(p0 % 360), 'energy': float(e0),
+            'n_dwells': len(seen), 'samples': samples}
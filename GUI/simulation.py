@@ -0,0 +1,387 @@
+'''
+Hardware free backends for running and benchmarking the GUI pipelines.
+
+LoopbackMCU stands in for the serial port of the MCU and decodes the byte
+stream exactly like Arduino/main_optimized_spi/main_optimized_spi.ino
+(commands from mcu_protocol.py, including the phase table), down to the
+PE44280 control words it would clock out.
+
+SimulatedPluto stands in for adi.Pluto. When the tone is transmitted it
+synthesizes the received IQ from the phase state latched in the loopback MCU,
+using the array factor from AF_Calc towards each configured emitter, plus
+complex gaussian noise.
+
+Enable with SIMULATE = True in config.py (or PHASED_ARRAY_SIM=1) and select
+the LOOPBACK port on the landing page.
+
+Usage (benchmark):
+    python simulation.py
+'''
+import time, collections, functools
+import numpy as np
+from config import (NUM_ELEMENTS, DX, DY, BASE_BAND, SAMP_RATE, BUFFER_SIZE,
+    BAUDRATE, SIM_EMITTERS, SIM_NOISE, SIM_PHASE_ERRORS, SIM_REALTIME, RX_KERNEL_BUFFERS)
+from AF_Calc import element_array_factor
+import mcu_protocol as mp
+
+
+class LoopbackMCU:
+    '''
+    Drop-in replacement for the serial.Serial handle in main.py.
+    Parses the framed command stream and latches phase states like the sketch,
+    ACKs are returned through read()/in_waiting.
+    '''
+    def __init__(self, realtime: bool = SIM_REALTIME, byte_error_rate: float = 0.0, seed: int = None):
+        self.realtime = realtime
+        #probability that a byte written by the host arrives corrupted (tests resync)
+        self.byte_error_rate = byte_error_rate
+        self.is_open = True
+        self.dtr = True
+        self.rts = True
+        self.baudrate = BAUDRATE
+        self.frames = 0
+        self.crc_errors = 0
+        self.words_shifted = 0 #SPI control words clocked out
+        self.control_words = np.zeros(NUM_ELEMENTS, dtype=np.uint16)
+        self.table = np.zeros((mp.TABLE_CAPACITY, NUM_ELEMENTS), dtype=np.uint8)
+        self.table_len = 0
+        self.current = 0
+        self.range_start = 0
+        self.range_len = 0 #0: CMD_NEXT wraps at table_len
+        self.trigger_enabled = False
+        self._decoder = mp.FrameDecoder()
+        self._last_seq = None
+        self._last_status = mp.ACK_OK
+        self._pending_baud = 0
+        self._tx = bytearray() #bytes going back to the host
+        self._rng = np.random.default_rng(seed)
+        #(latch time, hardware phases in degrees), newest last
+        self.history = collections.deque([(-np.inf, np.zeros(NUM_ELEMENTS))], maxlen=16)
+
+    def write(self, data: bytes) -> int:
+        if self.realtime:
+            #10 bits per byte on the wire
+            time.sleep(len(data) * 10 / self.baudrate)
+        if self.byte_error_rate:
+            data = bytearray(data)
+            hit = np.flatnonzero(self._rng.random(len(data)) < self.byte_error_rate)
+            for i in hit:
+                data[i] ^= 1 << int(self._rng.integers(8))
+        for kind, seq, ack, payload in self._decoder.feed(bytes(data)):
+            if kind == 'crc':
+                self.crc_errors += 1
+                self._tx += mp.encode_ack(seq, mp.ACK_CRC)
+                continue
+            if seq != self._last_seq:
+                self._last_status = self._execute(payload)
+                self._last_seq = seq
+            #a retransmission of the last frame is only acknowledged again,
+            #failures are always reported
+            if ack or self._last_status != mp.ACK_OK:
+                self._tx += mp.encode_ack(seq, self._last_status)
+            if self._pending_baud:
+                self.baudrate, self._pending_baud = self._pending_baud, 0
+        return len(data)
+
+    def _execute(self, payload: bytes) -> int:
+        '''run one command like execute() in the sketch, returns the ACK status'''
+        cmd, p = payload[0], payload[1:]
+        if cmd == mp.CMD_SET_PHASES:
+            if len(p) != NUM_ELEMENTS:
+                return mp.ACK_BAD
+            self._latch(p)
+        elif cmd == mp.CMD_UPLOAD:
+            if len(p) < 4:
+                return mp.ACK_BAD
+            start, count = int.from_bytes(p[0:2], 'little'), int.from_bytes(p[2:4], 'little')
+            if len(p) != 4 + count * NUM_ELEMENTS or start + count > mp.TABLE_CAPACITY:
+                return mp.ACK_BAD
+            self.table[start:start + count] = np.frombuffer(p[4:], dtype=np.uint8).reshape(count, NUM_ELEMENTS)
+            self.table_len = max(self.table_len, start + count)
+        elif cmd == mp.CMD_SELECT:
+            k = int.from_bytes(p, 'little')
+            if len(p) != 2 or k >= self.table_len:
+                return mp.ACK_BAD
+            self.current = k
+            self._latch(self.table[k].tobytes())
+        elif cmd == mp.CMD_NEXT:
+            if not self.table_len:
+                return mp.ACK_BAD
+            self._latch_next()
+        elif cmd == mp.CMD_TRIGGER:
+            if len(p) != 1:
+                return mp.ACK_BAD
+            self.trigger_enabled = bool(p[0])
+        elif cmd == mp.CMD_SET_BAUD:
+            if len(p) != 4:
+                return mp.ACK_BAD
+            baudrate = int.from_bytes(p, 'little')
+            if mp.baud_error(baudrate) > mp.MAX_BAUD_ERROR:
+                return mp.ACK_BAD
+            self._pending_baud = baudrate
+        elif cmd == mp.CMD_PING:
+            pass
+        elif cmd == mp.CMD_RANGE:
+            if len(p) != 4:
+                return mp.ACK_BAD
+            start, count = int.from_bytes(p[0:2], 'little'), int.from_bytes(p[2:4], 'little')
+            if start + count > self.table_len:
+                return mp.ACK_BAD
+            self.range_start, self.range_len = start, count
+        elif cmd == mp.CMD_SET_DELTA:
+            if len(p) < 1 or (len(p) - 1) % 2:
+                return mp.ACK_BAD
+            words = self.latched_words()
+            addr, values = np.frombuffer(p[1:], dtype=np.uint8).reshape(-1, 2).T
+            if p[0] != mp.crc8(words.tobytes()) or np.any(addr >= NUM_ELEMENTS):
+                return mp.ACK_BAD
+            words[addr] = values
+            self._latch(words.tobytes(), addr)
+        else:
+            return mp.ACK_BAD
+        return mp.ACK_OK
+
+    def _latch_next(self):
+        first, n = (self.range_start, self.range_len) if self.range_len else (0, self.table_len)
+        if n:
+            inside = first <= self.current < first + n - 1
+            self.current = self.current + 1 if inside else first
+            self._latch(self.table[self.current].tobytes())
+
+    def trigger(self):
+        '''rising edge on the trigger pin'''
+        if self.trigger_enabled:
+            self._latch_next()
+
+    def _latch(self, frame: bytes, shifted=None):
+        phases = np.frombuffer(frame, dtype=np.uint8).astype(np.uint16)
+        addr = np.arange(NUM_ELEMENTS, dtype=np.uint16)
+        #same bit layout as the sketch: address, 90 degree bit copy, phase word
+        self.control_words = (((addr << 9) | ((phases & 0x40) << 2) | phases) << 3) & 0xFFFF
+        self.words_shifted += NUM_ELEMENTS if shifted is None else len(shifted)
+        self.frames += 1
+        self.history.append((time.perf_counter(), self.applied_phases()))
+
+    def latched_words(self) -> np.ndarray:
+        '''8-bit phase words held by the shifters'''
+        return ((self.control_words >> 3) & 0xFF).astype(np.uint8)
+
+    def applied_phases(self) -> np.ndarray:
+        '''phase (degrees) each shifter was latched to, decoded from its control word'''
+        return ((self.control_words >> 3) & 0xFF) * (360 / 256)
+
+    def state_at(self, t: float) -> np.ndarray:
+        '''phases that were latched at time t'''
+        for t_latch, phases in reversed(self.history):
+            if t_latch <= t:
+                return phases
+        return self.history[0][1]
+
+    # serial.Serial API used by main.py
+    def flush(self):
+        pass
+
+    def read(self, size: int = 1) -> bytes:
+        data = bytes(self._tx[:size])
+        del self._tx[:size]
+        return data
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._tx)
+
+    def reset_input_buffer(self):
+        self._tx.clear()
+
+    def close(self):
+        self.is_open = False
+
+
+class SimulatedPluto:
+    '''
+    Minimal adi.Pluto look-alike: rx(), tx(), tx_destroy_buffer().
+    Configuration attributes (sample_rate, rx_lo, ...) are plain attributes.
+    Like the driver, rx() hands out buffers from a queue of kernel_buffers
+    blocks that the DMA fills back to back (and stops filling while the queue
+    is full), so a buffer can be older than the rx() call that returns it.
+    Without realtime there is no wall clock to fill a queue: kernel_buffers is
+    0 and every buffer is synthesized during its rx() call.
+    '''
+    def __init__(self, mcu: LoopbackMCU, emitters=SIM_EMITTERS, noise: float = SIM_NOISE,
+                 phase_errors=SIM_PHASE_ERRORS, realtime: bool = SIM_REALTIME, seed: int = None,
+                 kernel_buffers: int = RX_KERNEL_BUFFERS):
+        self.mcu = mcu
+        self.emitters = list(emitters)
+        self.noise = noise
+        self.phase_errors = np.asarray(phase_errors, dtype=float)
+        self.realtime = realtime
+        self.sample_rate = int(SAMP_RATE)
+        self.rx_buffer_size = BUFFER_SIZE
+        self.tx_active = False
+        self.kernel_buffers = kernel_buffers if realtime else 0
+        self._queue = collections.deque() #start times of filled, unread blocks
+        self._dma = None #start of the block being filled, None before the first rx()
+        self._rng = np.random.default_rng(seed)
+        self._noise = None
+        self._carrier = None
+        self._amp_cache = {}
+
+    def tx(self, data):
+        self.tx_active = True
+
+    def tx_destroy_buffer(self):
+        self.tx_active = False
+
+    def rx_destroy_buffer(self):
+        self._queue.clear()
+        self._dma = None
+
+    def _window(self, d: float) -> tuple:
+        '''(t0, t1) capture window of the block the next rx() returns'''
+        now = time.perf_counter()
+        if not self.kernel_buffers:
+            return now, now + d
+        if self._dma is None:
+            self._dma = now
+        #the DMA fills free blocks back to back and stalls once the queue is full
+        while len(self._queue) < self.kernel_buffers and self._dma + d <= now:
+            self._queue.append(self._dma)
+            self._dma += d
+        if not self._queue:
+            #wait for the block being filled
+            t0 = self._dma
+            self._dma += d
+            return t0, t0 + d
+        was_full = len(self._queue) == self.kernel_buffers
+        t0 = self._queue.popleft()
+        if was_full:
+            #a block was freed, a stalled DMA starts again now
+            self._dma = max(self._dma, now)
+        return t0, t0 + d
+
+    def _amplitude(self, phases: np.ndarray) -> complex:
+        '''complex tone amplitude received through the array for one phase state'''
+        key = phases.tobytes()
+        total = self._amp_cache.get(key)
+        if total is None:
+            total = 0j
+            for theta, phi, amp in self.emitters:
+                total += amp * element_array_factor(phases + self.phase_errors, DX, DY, theta, phi)[0]
+            self._amp_cache[key] = total
+        return total
+
+    def rx(self) -> np.ndarray:
+        n = self.rx_buffer_size
+        t0, t1 = self._window(n / self.sample_rate)
+        if self._noise is None or len(self._noise) < 4*n:
+            #noise bank and carrier are generated once, each buffer reads a random window
+            self._noise = self.noise / np.sqrt(2) * (self._rng.standard_normal(4*n) + 1j*self._rng.standard_normal(4*n))
+            self._carrier = np.exp(1j*2*np.pi*BASE_BAND*np.arange(n)/self.sample_rate)
+        elif len(self._carrier) != n:
+            self._carrier = np.exp(1j*2*np.pi*BASE_BAND*np.arange(n)/self.sample_rate)
+        start = self._rng.integers(0, len(self._noise) - n + 1)
+        rx = self._noise[start:start + n].copy()
+        if self.realtime:
+            time.sleep(max(t1 - time.perf_counter(), 0))
+        if self.tx_active:
+            #piecewise constant amplitude, split where the MCU latched during the buffer
+            amp = np.full(n, self._amplitude(self.mcu.state_at(t0)))
+            for t_latch, phases in self.mcu.history:
+                if t0 < t_latch <= t1:
+                    k = int((t_latch - t0) / (t1 - t0) * n)
+                    amp[k:] = self._amplitude(phases)
+            rx += amp * self._carrier * np.exp(1j*self._rng.uniform(0, 2*np.pi))
+        return rx
+
+
+LOOPBACK = LoopbackMCU()
+
+
+def main():
+    '''benchmark the receive scan against the simulated hardware'''
+    from create_default_rx_grid import DEFAULT_RX_GRID
+    from config import THETA_RANGE, PHI_RANGE
+    from scan_engine import PipelinedScan, adaptive_search, serial_scan
+    import PLUTO
+
+    mcu = LoopbackMCU(realtime=True)
+    sdr = SimulatedPluto(mcu, realtime=True, seed=0)
+    PLUTO.sdr = sdr
+    sdr.tx(None)
+
+    link = mp.McuLink(mcu)
+    table = mp.PhaseTable(link)
+
+    def write_rows(rows):
+        def write(i):
+            link.send(mp.encode_set_phases(mp.quantize_phases(rows[i])))
+        return write
+
+    def table_rows(rows):
+        #upload once (cached by hash), then a 5-7 byte frame per state, latch confirmed by ACK
+        start = table.load(mp.quantize_phases(rows))
+        return lambda i: table.step(start + i, ack=True)
+
+    def fresh_energy():
+        #the queued buffers predate the write
+        PLUTO.discard_buffers(PLUTO.stale_buffers())
+        return PLUTO.get_energy_fast()
+
+    n = len(DEFAULT_RX_GRID)
+    t = time.perf_counter()
+    energies = serial_scan(write_rows(DEFAULT_RX_GRID), fresh_energy, n)
+    t_serial = time.perf_counter() - t
+
+    table_rows(DEFAULT_RX_GRID) #upload before timing, like a repeated scan
+    #the CMD_NEXT frame is the earliest a table state can latch
+    step_time = mp.frame_time(1, mcu.baudrate)
+    engine = PipelinedScan(table_rows(DEFAULT_RX_GRID), PLUTO.capture, PLUTO.buffer_power,
+                           write_time=step_time, stale=PLUTO.stale_buffers())
+    t = time.perf_counter()
+    energies_p = engine.run(n)
+    t_pipe = time.perf_counter() - t
+
+    #the same scan off the rx stream, no queued buffers to drop
+    streamed = PipelinedScan(table_rows(DEFAULT_RX_GRID), PLUTO.capture, PLUTO.buffer_power,
+                             write_time=step_time, stale=0)
+    t = time.perf_counter()
+    with PLUTO.streaming():
+        energies_s = streamed.run(n)
+    t_stream = time.perf_counter() - t
+
+    def measure(rows, reduce=PLUTO.buffer_power):
+        with PLUTO.streaming():
+            return PipelinedScan(table_rows(rows), PLUTO.capture, reduce,
+                                 write_time=step_time, stale=0).run(len(rows))
+    t = time.perf_counter()
+    fix = adaptive_search(measure, DX, DY)
+    t_adapt = time.perf_counter() - t
+
+    dwell = n * BUFFER_SIZE / SAMP_RATE
+    for name, e in (('serial', energies), ('pipelined', energies_p), ('streamed', energies_s)):
+        i_t, i_p = np.unravel_index(np.argmax(e), (len(THETA_RANGE), len(PHI_RANGE)))
+        print(f'{name:>10}: peak theta={THETA_RANGE[i_t]:.1f} phi={PHI_RANGE[i_p]:.1f}')
+    print(f'  adaptive: peak theta={fix["theta"]:.1f} phi={fix["phi"]:.1f} ({fix["n_dwells"]} dwells)')
+    print(f'emitters: {sdr.emitters}')
+    print(f'{sdr.kernel_buffers} kernel buffers, pure RF dwell {dwell*1e3:.0f} ms | serial {t_serial*1e3:.0f} ms | '
+          f'pipelined {t_pipe*1e3:.0f} ms ({engine.discarded} discarded) | '
+          f'streamed {t_stream*1e3:.0f} ms ({streamed.discarded} discarded) | adaptive {t_adapt*1e3:.0f} ms')
+
+    #over the air calibration against a boresight reference with known phase errors
+    from ota_calibration import ota_calibrate, apply_correction
+    errors = np.random.default_rng(1).uniform(-60, 60, NUM_ELEMENTS)
+    PLUTO.sdr = SimulatedPluto(mcu, emitters=[(0, 0, 100.0)], phase_errors=errors, realtime=True, seed=1)
+    PLUTO.sdr.tx(None)
+    t = time.perf_counter()
+    #tone power only, the fit has no noise floor term
+    cal = ota_calibrate(functools.partial(measure, reduce=functools.partial(PLUTO.buffer_power, estimator='tone')))
+    t_cal = time.perf_counter() - t
+    #residual error of the calibrated array, up to a common phase
+    left = errors + apply_correction(np.zeros(NUM_ELEMENTS), cal['phase_errors'])
+    left = np.rad2deg(np.angle(np.exp(1j*np.deg2rad(left - left[0]))))
+    print(f'ota calibration: {cal["n_captures"]} captures in {t_cal*1e3:.0f} ms, '
+          f'max phase error {np.max(np.abs(errors - errors.mean())):.1f} -> {np.max(np.abs(left)):.1f} deg')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+'''
+Animation frames are written as they arrive, the GIF reads back like PIL's own.
+'''
+import io
+import numpy as np
+from PIL import Image, ImageSequence
+from AF_Calc import _AnimationWriter
+
+
+def png(color, size=(40, 30)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, color).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def test_gif_is_streamed(tmp_path):
+    path = str(tmp_path / 'sweep.gif')
+    writer = _AnimationWriter(path, duration_ms=80)
+    colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (20, 40, 60)]
+    sizes = []
+    for color in colors:
+        writer.append(png(color))
+        sizes.append((tmp_path / 'sweep.gif').stat().st_size)
+    writer.close()
+    #every frame reached the file before the next one was rendered
+    assert all(b > a for a, b in zip(sizes, sizes[1:]))
+    with Image.open(path) as gif:
+        assert gif.n_frames == len(colors) and gif.info['loop'] == 0
+        for frame, color in zip(ImageSequence.Iterator(gif), colors):
+            assert frame.info['duration'] == 80
+            np.testing.assert_allclose(np.asarray(frame.convert('RGB'))[0, 0], color, atol=8)
+
+
+def test_frames_take_the_first_size(tmp_path):
+    path = str(tmp_path / 'sweep.gif')
+    writer = _AnimationWriter(path)
+    writer.append(png('red'))
+    writer.append(png('blue', size=(50, 20)))
+    writer.close()
+    with Image.open(path) as gif:
+        for frame in ImageSequence.Iterator(gif):
+            assert frame.size == (40, 30)
+
+
+def test_no_frames_no_file(tmp_path):
+    _AnimationWriter(str(tmp_path / 'empty.gif')).close()
+    assert not (tmp_path / 'empty.gif').exists()
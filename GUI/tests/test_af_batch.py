@@ -0,0 +1,31 @@
+'''
+Batched array factor over many steering states against the single state kernel.
+'''
+import numpy as np
+import pytest
+from AF_Calc import array_factor, array_factor_batch, array_factor_steered, find_betas
+
+N_THETA, N_PHI = 31, 61
+THETA = np.array([0, 20, 40, 55])
+PHI = np.array([0, 100, 270, 45])
+
+
+@pytest.mark.parametrize('chunk', [1, 3, None])
+def test_matches_single_state(chunk):
+    batch = array_factor_steered(0.5, 0.5, THETA, PHI, n_theta=N_THETA, n_phi=N_PHI,
+                                 dtype=np.float64, chunk=chunk)
+    assert batch.shape == (len(THETA), N_PHI, N_THETA)
+    for k in range(len(THETA)):
+        single = array_factor(0.5, 0.5, *find_betas(THETA[k], PHI[k], 0.5, 0.5),
+                              n_theta=N_THETA, n_phi=N_PHI)
+        np.testing.assert_allclose(batch[k], single, atol=1e-12)
+
+
+def test_raw_magnitude_peaks_at_element_count():
+    raw = array_factor_batch(0.5, 0.5, [0.0], [0.0], n_theta=N_THETA, n_phi=N_PHI, normalize=False)
+    assert raw.max() == pytest.approx(16)
+
+
+def test_float32_default_and_empty_batch():
+    assert array_factor_steered(0.5, 0.5, THETA, PHI, n_theta=N_THETA, n_phi=N_PHI).dtype == np.float32
+    assert array_factor_batch(0.5, 0.5, [], [], n_theta=N_THETA, n_phi=N_PHI).shape == (0, N_PHI, N_THETA)
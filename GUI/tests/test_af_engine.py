@@ -0,0 +1,45 @@
+'''
+Closed form (separable Dirichlet kernel) array factor against a brute force
+sum over the elements.
+'''
+import numpy as np
+import pytest
+from AF_Calc import (array_factor, element_array_factor, find_betas, get_af_grid,
+    get_phase_shifts)
+
+N_THETA, N_PHI = 31, 61
+
+
+def brute_force_af(dx, dy, beta_x, beta_y):
+    '''sum over every element on the AFGrid directions, normalized to peak 1'''
+    grid = get_af_grid(dx, dy, N_THETA, N_PHI)
+    af = np.abs(element_array_factor(get_phase_shifts(beta_x, beta_y), dx, dy,
+                                     np.rad2deg(grid.THETA), np.rad2deg(grid.PHI)))
+    af = af.reshape(grid.shape)
+    return af / af.max()
+
+
+@pytest.mark.parametrize('dx, dy, theta, phi', [(0.5, 0.5, 0, 0), (0.5, 0.5, 30, 45), (0.7, 0.6, 50, 200)])
+def test_matches_brute_force(dx, dy, theta, phi):
+    beta_x, beta_y = find_betas(theta, phi, dx, dy)
+    af = array_factor(dx, dy, beta_x, beta_y, n_theta=N_THETA, n_phi=N_PHI)
+    np.testing.assert_allclose(af, brute_force_af(dx, dy, beta_x, beta_y), atol=1e-9)
+
+
+def test_grid_is_cached_per_spacing():
+    assert get_af_grid(0.5, 0.5, N_THETA, N_PHI) is get_af_grid(0.5, 0.5, N_THETA, N_PHI)
+    assert get_af_grid(0.5, 0.6, N_THETA, N_PHI) is not get_af_grid(0.5, 0.5, N_THETA, N_PHI)
+
+
+def test_out_buffer_is_used():
+    out = np.empty((N_PHI, N_THETA))
+    af = array_factor(0.5, 0.5, *find_betas(20, 100, 0.5, 0.5), n_theta=N_THETA, n_phi=N_PHI, out=out)
+    assert af is out and af.max() == 1
+
+
+def test_peak_at_steering_direction():
+    grid = get_af_grid(0.5, 0.5)
+    af = array_factor(0.5, 0.5, *find_betas(30, 90, 0.5, 0.5))
+    i_phi, i_theta = np.unravel_index(np.argmax(af), af.shape)
+    assert np.degrees(grid.theta[i_theta]) == pytest.approx(30, abs=0.5)
+    assert np.degrees(grid.phi[i_phi]) == pytest.approx(90, abs=1)
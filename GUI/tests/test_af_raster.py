@@ -0,0 +1,35 @@
+'''
+LUT raster render path and the compact interactive view data.
+'''
+import numpy as np
+from PIL import Image
+from AF_Calc import af_to_uint8, af_colormap_lut, af_view_data, array_factor, find_betas, render_af_fast
+
+
+def test_af_to_uint8_rounds():
+    x = np.array([0, 0.5 / 255, 0.499, 254.5 / 255, 1.0])
+    np.testing.assert_array_equal(af_to_uint8(x), np.floor(x * 255 + 0.5).astype(np.uint8))
+
+
+def test_colormap_lut():
+    lut = af_colormap_lut()
+    assert lut.shape == (256, 3) and lut.dtype == np.uint8
+
+
+def test_render_writes_both_images(tmp_path):
+    af = array_factor(0.5, 0.5, *find_betas(20, 100, 0.5, 0.5))
+    af_path, uv_path = tmp_path / 'AF.png', tmp_path / 'uv.png'
+    render_af_fast(0.5, 0.5, af, size=64, af_path=str(af_path), uv_path=str(uv_path))
+    with Image.open(af_path) as img:
+        #theta rows by phi columns plus the chrome
+        assert img.size[0] > af.shape[0] and img.size[1] > af.shape[1]
+    with Image.open(uv_path) as img:
+        assert img.mode == 'RGB' and img.size[0] > 64
+
+
+def test_view_data_marks_invisible_region():
+    theta_phi, uv = af_view_data(0.5, 0.5, 20, 100, step=4, size=32)
+    assert theta_phi.dtype == np.uint8 and uv.dtype == np.uint8
+    assert theta_phi.min() >= 1 and theta_phi.max() == 255
+    #corners of the u/v square lie outside the unit circle
+    assert uv[0, 0] == uv[-1, -1] == 0 and uv[16, 16] >= 1
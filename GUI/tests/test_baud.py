@@ -0,0 +1,25 @@
+'''
+Baud rate negotiation against the loopback MCU.
+'''
+import pytest
+import mcu_protocol as mp
+from config import BAUDRATE
+
+
+def test_baud_error():
+    assert mp.baud_error(1000000) == 0 and mp.baud_error(500000) == 0
+    assert mp.baud_error(921600) == pytest.approx(0.085, abs=1e-3)
+
+
+@pytest.mark.parametrize('baudrate, exact', [(500000, True), (1000000, True), (921600, False)])
+def test_negotiation(loopback, baudrate, exact):
+    mcu, link = loopback
+    assert mp.negotiate_baud(link, baudrate) is exact
+    assert mcu.baudrate == link.ser.baudrate == (baudrate if exact else BAUDRATE)
+    assert link.send(mp.encode_ping(), ack=True)
+
+
+def test_inexact_rate_is_rejected_by_the_mcu(loopback):
+    mcu, link = loopback
+    assert not link.send(mp.encode_set_baud(921600), ack=True)
+    assert mcu.baudrate == BAUDRATE
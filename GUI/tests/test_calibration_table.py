@@ -0,0 +1,68 @@
+'''
+Frequency indexed S41 calibration table, interpolated between measured points.
+'''
+import os
+from pathlib import Path
+import numpy as np
+import pytest
+from READ_S2P import CalibrationTable, get_calibration_table
+
+
+def write_s2p(path: Path, freqs, s41_deg):
+    '''2-port file with S11 = S22 = 0.1 and S21 = S12 = 0.5 at s41_deg'''
+    rows = ['# Hz S RI R 50']
+    for f, deg in zip(freqs, s41_deg):
+        s41 = 0.5 * np.exp(1j * np.deg2rad(deg))
+        rows.append(f'{f:.6e} 0.1 0 {s41.real:.12e} {s41.imag:.12e} {s41.real:.12e} {s41.imag:.12e} 0.1 0')
+    path.write_text('\n'.join(rows) + '\n')
+
+
+@pytest.fixture
+def delays(tmp_path):
+    '''four ports with their own delay, phase falls linearly with frequency'''
+    freqs = np.linspace(2.0e9, 2.2e9, 21)
+    delays = np.linspace(0, 1.5e-9, 4)
+    for i, tau in enumerate(delays, start=1):
+        write_s2p(tmp_path / f'Port{i}.s2p', freqs, -360 * freqs * tau)
+    return delays
+
+
+def test_interpolates_between_points(tmp_path, delays):
+    table = CalibrationTable(tmp_path, n_ports=4)
+    f = 2.105e9 #between two measured points
+    expected = (-360 * f * delays + 180) % 360 - 180
+    np.testing.assert_allclose(table.phases(f), expected, atol=1e-6)
+    np.testing.assert_allclose(table.amplitudes(f), 0.5)
+
+
+def test_offsets_reference_the_longest_port(tmp_path, delays):
+    offsets = CalibrationTable(tmp_path, n_ports=4).offsets(2.1e9)
+    phases = CalibrationTable(tmp_path, n_ports=4).phases(2.1e9)
+    assert offsets.min() == 0 and np.argmin(offsets) == np.argmin(phases)
+
+
+def test_outside_band_raises(tmp_path, delays):
+    with pytest.raises(ValueError):
+        CalibrationTable(tmp_path, n_ports=4).phases(3e9)
+
+
+def test_different_frequency_axes_are_resampled(tmp_path, delays):
+    #port 4 measured on a finer axis still lines up with port 1
+    write_s2p(tmp_path / 'Port4.s2p', np.linspace(2.0e9, 2.2e9, 41), np.full(41, 10.0))
+    table = CalibrationTable(tmp_path, n_ports=4)
+    assert table.phase.shape == (4, 21)
+    assert table.phases(2.1e9)[3] == pytest.approx(10.0)
+
+
+def test_table_cache_reloads_on_change(tmp_path):
+    freqs = np.linspace(2.0e9, 2.2e9, 5)
+    for i in range(1, 17):
+        write_s2p(tmp_path / f'Port{i}.s2p', freqs, np.zeros(5))
+    first = get_calibration_table(tmp_path)
+    assert get_calibration_table(tmp_path) is first
+    path = tmp_path / 'Port1.s2p'
+    write_s2p(path, freqs, np.full(5, 5.0))
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    second = get_calibration_table(tmp_path)
+    assert second is not first and second.phases(2.1e9)[0] == pytest.approx(5.0)
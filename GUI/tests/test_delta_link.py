@@ -0,0 +1,58 @@
+'''
+Delta phase updates: only changed elements go out, full frames after any doubt.
+'''
+import numpy as np
+import mcu_protocol as mp
+
+
+def test_sends_changed_elements(loopback, random_words):
+    mcu, link = loopback
+    delta = mp.DeltaLink(link)
+    words = random_words(6)
+    assert delta.send(mp.encode_set_phases(words), ack=True)
+    words[[2, 9]] += 1
+    assert delta.send(mp.encode_set_phases(words), ack=True)
+    assert (delta.full_frames, delta.delta_frames) == (1, 1)
+    np.testing.assert_array_equal(mcu.latched_words(), words)
+    #only the two changed elements were shifted
+    assert mcu.words_shifted == mp.NUM_ELEMENTS + 2
+
+
+def test_unchanged_confirmed_state_is_skipped(loopback, random_words):
+    _, link = loopback
+    delta = mp.DeltaLink(link)
+    words = random_words(7)
+    delta.send(mp.encode_set_phases(words), ack=True)
+    assert delta.send(mp.encode_set_phases(words), ack=True)
+    assert delta.skipped == 1
+
+
+def test_many_changes_go_out_as_full_frame(loopback, random_words):
+    mcu, link = loopback
+    delta = mp.DeltaLink(link)
+    delta.send(mp.encode_set_phases(random_words(8)), ack=True)
+    words = random_words(9)
+    delta.send(mp.encode_set_phases(words), ack=True)
+    assert delta.full_frames == 2
+    np.testing.assert_array_equal(mcu.latched_words(), words)
+
+
+def test_falls_back_to_full_frame_on_base_mismatch(loopback, random_words):
+    mcu, link = loopback
+    delta = mp.DeltaLink(link)
+    words = random_words(10)
+    delta.send(mp.encode_set_phases(words), ack=True)
+    #the MCU lost track (e.g. reset), its base crc no longer matches
+    mcu.control_words[:] = 0
+    words[0] += 1
+    assert delta.send(mp.encode_set_phases(words), ack=True)
+    assert delta.full_frames == 2
+    np.testing.assert_array_equal(mcu.latched_words(), words)
+
+
+def test_table_command_forgets_the_state(loopback, random_words):
+    _, link = loopback
+    delta = mp.DeltaLink(link)
+    delta.send(mp.encode_set_phases(random_words(11)), ack=True)
+    mp.PhaseTable(delta).load(random_words(12, 4))
+    assert delta.words is None
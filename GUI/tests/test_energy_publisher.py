@@ -0,0 +1,69 @@
+'''
+Shared rx stream ownership and the live energy publisher.
+'''
+import time
+import numpy as np
+import pytest
+import PLUTO
+from config import BUFFER_SIZE
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.perf_counter() + timeout
+    while not predicate() and time.perf_counter() < deadline:
+        time.sleep(0.005)
+    return predicate()
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    '''install a stream on a fake source, the source raises whatever fail holds'''
+    state = {'fail': None}
+
+    def source():
+        time.sleep(0.002)
+        if state['fail'] is not None:
+            raise state['fail']
+        return np.ones(BUFFER_SIZE, dtype=np.complex64)
+    monkeypatch.setattr(PLUTO, 'STREAM', PLUTO.RxStream(source=source))
+    monkeypatch.setattr(PLUTO, '_STREAM_USERS', set())
+    yield state
+    PLUTO.STREAM.stop()
+
+
+def test_stream_stops_with_the_last_owner(stream):
+    PLUTO.acquire_stream('a')
+    PLUTO.acquire_stream('b')
+    PLUTO.release_stream('a')
+    assert PLUTO.STREAM.running
+    PLUTO.release_stream('b')
+    assert not PLUTO.STREAM.running
+    #a new owner restarts it
+    PLUTO.acquire_stream('c')
+    assert PLUTO.STREAM.running
+    PLUTO.release_stream('c')
+
+
+def test_publisher_feeds_subscribers(stream):
+    publisher = PLUTO.EnergyPublisher(rate=200)
+    ring = publisher.subscribe()
+    assert wait_until(lambda: ring.count >= 3)
+    assert ring.error is None
+    np.testing.assert_allclose(ring.snapshot()[1], 1.0)
+    publisher.unsubscribe(ring)
+    assert wait_until(lambda: not PLUTO.STREAM.running)
+
+
+def test_stream_error_reaches_subscribers(stream):
+    publisher = PLUTO.EnergyPublisher(rate=200)
+    rings = [publisher.subscribe(), publisher.subscribe()]
+    assert wait_until(lambda: rings[0].count > 0)
+    stream['fail'] = IOError('usb disconnected')
+    assert wait_until(lambda: all(r.error is not None for r in rings))
+    assert all(isinstance(r.error, IOError) for r in rings)
+    assert wait_until(lambda: not PLUTO._STREAM_USERS)
+    #subscribing again restarts the stream
+    stream['fail'] = None
+    ring = publisher.subscribe()
+    assert wait_until(lambda: ring.count > 0) and ring.error is None
+    publisher.unsubscribe(ring)
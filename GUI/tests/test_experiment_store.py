@@ -0,0 +1,64 @@
+'''
+HDF5 experiment store, skipped when h5py is not installed.
+'''
+import numpy as np
+import pytest
+
+h5py = pytest.importorskip('h5py')
+from experiment_store import ExperimentStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ExperimentStore(str(tmp_path / 'runs.h5'))
+
+
+def test_append_and_load(store):
+    energy = np.arange(10, dtype=float)
+    run_id = store.append('rx_scan', {'energy': energy, 'theta': np.ones(10)}, offsets=np.zeros(16),
+                          label='bench', started=100.0, meta={'dx': 0.5})
+    run = store.load(run_id)
+    np.testing.assert_array_equal(run['energy'], energy)
+    np.testing.assert_array_equal(run['offsets'], np.zeros(16))
+    assert (run['kind'], run['label'], run['started']) == ('rx_scan', 'bench', 100.0)
+    assert run['meta'] == {'dx': 0.5} and 'NUM_ELEMENTS' in run['config']
+    assert store.load(run_id, names=['theta']).keys() >= {'theta', 'kind'}
+
+
+def test_list_stack_compare(store):
+    assert len(store.list_runs()) == 0
+    ids = [store.append('rx_scan', {'energy': np.full(5, k, dtype=float)}, started=float(k)) for k in range(3)]
+    store.append('burst', {'energy': np.zeros(7)})
+    runs = store.list_runs(kind='rx_scan')
+    assert list(runs['run_id']) == ids
+    assert list(store.list_runs(kind='rx_scan', since=1.0)['run_id']) == ids[1:]
+    stacked = store.stack(runs['run_id'])
+    assert stacked.shape == (3, 5)
+    diff = store.compare(ids[0], ids[2])
+    np.testing.assert_array_equal(diff['difference'], np.full(5, 2.0))
+    assert diff['rms'] == 2.0
+
+
+def test_large_arrays_are_chunked(store):
+    run_id = store.append('ts_noise', {'energy': np.random.default_rng(0).random(10000)})
+    with h5py.File(store.path, 'r') as f:
+        assert f[f'runs/{run_id}/energy'].compression == 'gzip'
+
+
+def test_failed_write_leaves_no_partial_run(store):
+    store.append('rx_scan', {'energy': np.zeros(3)})
+    with pytest.raises(TypeError):
+        store.append('rx_scan', {'energy': np.zeros(3), 'bad': np.array([object()])})
+    assert len(store.list_runs()) == 1
+    #the next run still gets a fresh id
+    run_id = store.append('rx_scan', {'energy': np.ones(3)})
+    np.testing.assert_array_equal(store.load(run_id)['energy'], np.ones(3))
+    with h5py.File(store.path, 'r') as f:
+        assert sorted(f['runs']) == ['0', str(run_id)]
+
+
+def test_groups_left_by_a_crash_are_not_overwritten(store):
+    store.append('rx_scan', {'energy': np.zeros(3)})
+    with h5py.File(store.path, 'a') as f:
+        f.create_group('runs/5') #written before a crash, never indexed
+    assert store.append('rx_scan', {'energy': np.ones(3)}) == 6
@@ -0,0 +1,56 @@
+'''
+Cache of quantized phase words and SET_PHASES frames per grid and calibration.
+'''
+import numpy as np
+import pytest
+from config import NUM_ELEMENTS
+from AF_Calc import find_betas, get_phase_shifts
+from frame_cache import FrameCache, steering_row, calibration_digest
+from mcu_protocol import CMD_SET_PHASES, quantize_phases
+
+ROWS = np.random.default_rng(1).uniform(0, 360, (8, NUM_ELEMENTS))
+
+
+def test_entry_matches_quantize_phases():
+    offsets = np.linspace(0, 30, NUM_ELEMENTS)
+    entry = FrameCache().get('grid', ROWS, offsets)
+    np.testing.assert_array_equal(entry.words, quantize_phases(ROWS, offsets))
+    assert (entry.frames[:, 0] == CMD_SET_PHASES).all()
+    np.testing.assert_array_equal(entry.frames[:, 1:], entry.words)
+    assert not entry.words.flags.writeable and not entry.frames.flags.writeable
+
+
+def test_hits_and_invalidation():
+    cache = FrameCache()
+    offsets = np.zeros(NUM_ELEMENTS)
+    entry = cache.get('grid', ROWS, offsets)
+    #rows are only built on a miss
+    assert cache.get('grid', lambda: pytest.fail('rebuilt on a hit'), offsets) is entry
+    #changing the calibration in place misses
+    offsets[3] += 1
+    assert cache.get('grid', ROWS, offsets) is not entry and cache.builds == 2
+    cache.invalidate()
+    cache.get('grid', ROWS, offsets)
+    assert cache.builds == 3
+
+
+def test_evicts_least_recent():
+    cache = FrameCache(maxsize=2)
+    for key in ('a', 'b', 'a', 'c'):
+        cache.get(key, ROWS)
+    builds = cache.builds
+    cache.get('a', ROWS)
+    assert cache.builds == builds #still cached
+    cache.get('b', ROWS)
+    assert cache.builds == builds + 1 #evicted by 'c'
+
+
+def test_calibration_digest_broadcasts_scalar():
+    assert calibration_digest(0) == calibration_digest(np.zeros(NUM_ELEMENTS))
+    assert calibration_digest(0) != calibration_digest(1)
+
+
+def test_steering_row_matches_phase_shifts():
+    row = steering_row(0.5, 0.5, 30.0, 45.0)
+    np.testing.assert_allclose(row, get_phase_shifts(*find_betas(30, 45, 0.5, 0.5)), atol=1e-9)
+    assert not row.flags.writeable
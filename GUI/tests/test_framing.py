@@ -0,0 +1,109 @@
+'''
+Framed serial protocol: CRC-8, frame decoding with resync and acknowledged
+round trips through the loopback MCU, including corrupted bytes.
+'''
+import numpy as np
+import mcu_protocol as mp
+from simulation import LoopbackMCU
+
+
+def test_crc8_check_value():
+    #CRC-8 poly 0x07 init 0 (CRC-8/SMBUS) check value
+    assert mp.crc8(b'123456789') == 0xF4
+
+
+def test_frame_round_trip():
+    payload = mp.encode_set_phases(np.arange(16, dtype=np.uint8))
+    frame = mp.encode_frame(7, payload, ack=True)
+    assert frame[0] == mp.START and len(frame) == len(payload) + mp.FRAME_OVERHEAD
+    assert mp.FrameDecoder().feed(frame) == [('frame', 7, True, payload)]
+
+
+def test_decoder_split_input():
+    frame = mp.encode_frame(3, mp.encode_select(42))
+    decoder = mp.FrameDecoder()
+    events = [e for b in frame for e in decoder.feed(bytes([b]))]
+    assert events == [('frame', 3, False, mp.encode_select(42))]
+
+
+def test_decoder_resyncs_after_garbage_and_bad_crc():
+    good = mp.encode_frame(1, mp.encode_ping())
+    bad = bytearray(mp.encode_frame(2, mp.encode_select(5)))
+    bad[-2] ^= 0xFF #corrupt the payload, the crc no longer matches
+    events = mp.FrameDecoder().feed(b'\x00\x13' + bytes(bad) + good)
+    assert events[0][0] == 'crc'
+    assert events[-1] == ('frame', 1, False, mp.encode_ping())
+
+
+def test_decoder_resyncs_after_stray_start_byte():
+    #a stray start byte reads the next one as a long LEN, the frame behind it survives
+    good = mp.encode_frame(1, mp.encode_ping())
+    decoder = mp.FrameDecoder()
+    assert decoder.feed(bytes([mp.START]) + good) == []
+    events = decoder.feed(bytes(mp.START + mp.FRAME_OVERHEAD))
+    assert ('frame', 1, False, mp.encode_ping()) in events
+
+
+def test_set_phases_latches_words(loopback, random_words):
+    mcu, link = loopback
+    words = random_words(0)
+    assert link.send(mp.encode_set_phases(words), ack=True)
+    np.testing.assert_array_equal(mcu.latched_words(), words)
+
+
+def test_bad_command_is_nakked(loopback):
+    _, link = loopback
+    assert not link.send(bytes([0x7F]), ack=True)
+    assert link.naks > 0
+
+
+def test_corrupted_bytes_are_retransmitted(random_words):
+    mcu = LoopbackMCU(realtime=False, byte_error_rate=0.01, seed=1)
+    link = mp.McuLink(mcu, ack_timeout=0.005)
+    sent = 0
+    for k in range(200):
+        words = random_words(k)
+        if link.send(mp.encode_set_phases(words), ack=True):
+            #an acknowledged state is the one latched
+            np.testing.assert_array_equal(mcu.latched_words(), words)
+            sent += 1
+    assert mcu.crc_errors > 0 and link.retransmits > 0
+    assert sent >= 190
+
+
+def test_retransmission_is_not_executed_twice(loopback, random_words):
+    mcu, link = loopback
+    table = mp.PhaseTable(link)
+    start = table.load(random_words(3, 4))
+    table.select(start, ack=True)
+    seq = (link.seq + 1) & 0xFF
+    frame = mp.encode_frame(seq, mp.encode_next(), ack=True)
+    mcu.write(frame)
+    mcu.write(frame) #lost ACK, same sequence number again
+    assert mcu.current == start + 1
+    assert mcu.read(mcu.in_waiting) == 2 * mp.encode_ack(seq, mp.ACK_OK)
+
+
+def test_new_link_syncs_with_the_mcu_sequence(random_words):
+    #the MCU is not reset between hosts, it still holds the old link's SEQ
+    mcu = LoopbackMCU(realtime=False)
+    old = mp.McuLink(mcu)
+    assert old.send(mp.encode_set_phases(random_words(20)), ack=True)
+    stale = mp.McuLink(mcu)
+    assert stale.send(mp.encode_set_phases(random_words(21)), ack=True)
+    #same SEQ as the old link's last frame: acknowledged, never executed
+    np.testing.assert_array_equal(mcu.latched_words(), random_words(20))
+    link = mp.McuLink(mcu)
+    assert link.sync()
+    words = random_words(22)
+    assert link.send(mp.encode_set_phases(words), ack=True)
+    np.testing.assert_array_equal(mcu.latched_words(), words)
+
+
+def test_sync_after_a_rejected_frame():
+    mcu = LoopbackMCU(realtime=False)
+    assert not mp.McuLink(mcu).send(bytes([0x7F]), ack=True)
+    #the reused SEQ is answered with the old ACK_BAD, the link is in sync anyway
+    link = mp.McuLink(mcu)
+    assert link.sync()
+    assert link.send(mp.encode_ping(), ack=True)
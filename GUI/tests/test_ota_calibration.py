@@ -0,0 +1,47 @@
+'''
+Over-the-air calibration through the loopback MCU and a noisy simulated radio.
+'''
+import functools
+import numpy as np
+import pytest
+import mcu_protocol as mp
+import PLUTO
+from config import NUM_ELEMENTS
+from ota_calibration import ota_calibrate, apply_correction
+from scan_engine import PipelinedScan
+from simulation import LoopbackMCU, SimulatedPluto
+
+ERRORS = np.random.default_rng(1).uniform(-60, 60, NUM_ELEMENTS)
+
+
+def calibration_error(estimator: str, noise: float) -> float:
+    '''largest phase error (degrees) left after calibrating with the given power estimator'''
+    mcu = LoopbackMCU(realtime=False)
+    sdr = SimulatedPluto(mcu, emitters=[(0, 0, 100.0)], phase_errors=ERRORS, noise=noise, seed=1)
+    sdr.tx(None)
+    PLUTO.sdr = sdr
+    table = mp.PhaseTable(mp.McuLink(mcu))
+    reduce = functools.partial(PLUTO.buffer_power, estimator=estimator)
+
+    def measure(rows):
+        start = table.load(mp.quantize_phases(rows))
+        #nothing is on the wire in the loopback, a frame latches as soon as it is written
+        return PipelinedScan(lambda i: table.step(start + i, ack=True), PLUTO.capture, reduce,
+                             write_time=0, stale=0).run(len(rows))
+    cal = ota_calibrate(measure)
+    left = ERRORS + apply_correction(np.zeros(NUM_ELEMENTS), cal['phase_errors'])
+    return np.max(np.abs(np.rad2deg(np.angle(np.exp(1j * np.deg2rad(left - left[0]))))))
+
+
+@pytest.fixture(autouse=True)
+def restore_sdr(monkeypatch):
+    monkeypatch.setattr(PLUTO, 'sdr', None)
+
+
+def test_tone_power_calibrates_under_noise():
+    assert calibration_error('tone', noise=300) < 2
+
+
+def test_noise_floor_biases_mean_square():
+    #the noise floor is an additive term the power model does not have
+    assert calibration_error('mean_square', noise=300) > 5 * calibration_error('tone', noise=300)
@@ -0,0 +1,91 @@
+'''
+On-MCU phase table: upload, stepping and the CMD_RANGE wrap of CMD_NEXT.
+'''
+import numpy as np
+import pytest
+import mcu_protocol as mp
+
+
+def test_upload_and_step(loopback, random_words):
+    mcu, link = loopback
+    words = random_words(4, 40) #more rows than one upload frame holds
+    table = mp.PhaseTable(link)
+    start = table.load(words)
+    assert table.uploads == 1
+    np.testing.assert_array_equal(mcu.table[start:start + 40], words)
+    for i in range(40):
+        assert table.step(start + i, ack=True)
+        np.testing.assert_array_equal(mcu.latched_words(), words[i])
+
+
+def test_resident_table_is_not_resent(loopback, random_words):
+    mcu, link = loopback
+    table = mp.PhaseTable(link)
+    a, b = random_words(5, 10), random_words(6, 6)
+    start_a = table.load(a)
+    table.load(b)
+    frames = mcu.frames
+    assert table.load(a) == start_a and table.uploads == 2
+    assert table.range == (start_a, 10)
+    #only the range changed, nothing was latched or uploaded
+    assert mcu.frames == frames
+
+
+def test_select_out_of_range_is_rejected(loopback, random_words):
+    mcu, link = loopback
+    mp.PhaseTable(link).load(random_words(6, 3))
+    assert not link.send(mp.encode_select(3), ack=True)
+
+
+def test_table_too_large(loopback):
+    _, link = loopback
+    with pytest.raises(ValueError):
+        mp.PhaseTable(link).load(np.zeros((mp.TABLE_CAPACITY + 1, mp.NUM_ELEMENTS), dtype=np.uint8))
+
+
+def test_full_table_evicts_and_restarts_at_row_zero(loopback, random_words):
+    _, link = loopback
+    table = mp.PhaseTable(link)
+    table.load(random_words(7, 200))
+    assert table.load(random_words(8, 100)) == 0
+
+
+def test_next_wraps_inside_the_loaded_table(loopback, random_words):
+    mcu, link = loopback
+    table = mp.PhaseTable(link)
+    table.load(random_words(8, 20))
+    short = random_words(9, 5)
+    start = table.load(short)
+    for i in range(5):
+        table.step(start + i, ack=True)
+    assert table.advance(ack=True)
+    assert mcu.current == table.current == start
+    np.testing.assert_array_equal(mcu.latched_words(), short[0])
+
+
+def test_trigger_wraps_inside_the_range(loopback, random_words):
+    mcu, link = loopback
+    table = mp.PhaseTable(link)
+    table.load(random_words(9, 20))
+    start = table.load(random_words(10, 4))
+    table.select(start, ack=True)
+    table.set_trigger(True)
+    for _ in range(6):
+        mcu.trigger()
+    assert mcu.current == start + 2
+
+
+def test_range_zero_wraps_at_the_whole_table(loopback, random_words):
+    mcu, link = loopback
+    table = mp.PhaseTable(link)
+    table.load(random_words(10, 8))
+    assert link.send(mp.encode_range(0, 0), ack=True)
+    table.select(7, ack=True)
+    link.send(mp.encode_next(), ack=True)
+    assert mcu.current == 0
+
+
+def test_range_past_the_table_is_rejected(loopback, random_words):
+    _, link = loopback
+    mp.PhaseTable(link).load(random_words(11, 8))
+    assert not link.send(mp.encode_range(4, 5), ack=True)
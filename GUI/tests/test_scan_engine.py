@@ -0,0 +1,49 @@
+'''
+Pipelined scan against a simulated radio whose driver queues rx buffers.
+'''
+import numpy as np
+import pytest
+import mcu_protocol as mp
+import PLUTO
+from scan_engine import PipelinedScan
+from frame_cache import steering_row
+from simulation import LoopbackMCU, SimulatedPluto
+
+#the emitter sits in the direction of row 5
+DIRECTIONS = [(0, 0), (40, 300), (10, 200), (30, 20), (45, 250), (20, 100), (35, 160), (15, 330)]
+PEAK = 5
+
+
+@pytest.fixture
+def radio(monkeypatch):
+    mcu = LoopbackMCU(realtime=True)
+    sdr = SimulatedPluto(mcu, emitters=[(20, 100, 100.0)], realtime=True, seed=0)
+    sdr.tx(None)
+    monkeypatch.setattr(PLUTO, 'sdr', sdr)
+    table = mp.PhaseTable(mp.McuLink(mcu))
+    start = table.load(mp.quantize_phases(np.array([steering_row(0.5, 0.5, t, p) for t, p in DIRECTIONS])))
+    write_time = mp.frame_time(1, mcu.baudrate)
+
+    def scan(stale):
+        return PipelinedScan(lambda i: table.step(start + i, ack=True), PLUTO.capture, PLUTO.buffer_power,
+                             write_time=write_time, stale=stale).run(len(DIRECTIONS))
+    return sdr, scan
+
+
+def test_queued_buffers_are_dropped(radio):
+    sdr, scan = radio
+    assert PLUTO.stale_buffers() == sdr.kernel_buffers == 2
+    energies = scan(PLUTO.stale_buffers())
+    assert np.argmax(energies) == PEAK
+    #every other direction is well below the emitter's
+    assert np.delete(energies, PEAK).max() < 0.5 * energies[PEAK]
+
+
+def test_streamed_scan_needs_no_flush(radio):
+    _, scan = radio
+    direct = scan(PLUTO.stale_buffers())
+    with PLUTO.streaming():
+        assert PLUTO.stale_buffers() == 0
+        streamed = scan(0)
+    assert not PLUTO.STREAM.running
+    np.testing.assert_allclose(streamed, direct, rtol=0.05)
@@ -0,0 +1,58 @@
+'''
+Touchstone v1 option line, units, MA/DB/RI formats and port counts.
+'''
+import numpy as np
+import pytest
+from READ_S2P import read_touchstone, parse_option_line
+
+S = 0.5 * np.exp(1j * np.deg2rad(30))
+
+
+@pytest.mark.parametrize('fmt, a, b', [('MA', 0.5, 30.0), ('DB', 20 * np.log10(0.5), 30.0),
+                                       ('RI', S.real, S.imag)])
+def test_formats(tmp_path, fmt, a, b):
+    path = tmp_path / 'x.s1p'
+    path.write_text(f'! comment\n# MHZ S {fmt} R 75\n2100 {a} {b} ! trailing comment\n2200 {a} {b}\n')
+    freqs, s, z0, parameter = read_touchstone(path)
+    np.testing.assert_allclose(freqs, [2.1e9, 2.2e9])
+    np.testing.assert_allclose(s[:, 0, 0], S)
+    assert (z0, parameter) == (75.0, 'S')
+
+
+def test_two_port_column_order(tmp_path):
+    path = tmp_path / 'x.s2p'
+    #N11 N21 N12 N22
+    path.write_text('# GHZ S RI\n2.1 1 0 2 0 3 0 4 0\n')
+    _, s, _, _ = read_touchstone(path)
+    np.testing.assert_array_equal(s[0].real, [[1, 3], [2, 4]])
+
+
+def test_three_ports_row_by_row(tmp_path):
+    path = tmp_path / 'x.s3p'
+    #3+ ports are stored row by row and may wrap over several lines
+    path.write_text('# GHZ Y RI\n2.1 1 0 2 0 3 0\n 4 0 5 0 6 0\n 7 0 8 0 9 0\n')
+    _, y, _, parameter = read_touchstone(path)
+    np.testing.assert_array_equal(y[0].real, np.arange(1, 10).reshape(3, 3))
+    assert parameter == 'Y'
+
+
+def test_noise_block_is_ignored(tmp_path):
+    path = tmp_path / 'noise.s2p'
+    path.write_text('# GHZ S MA\n1 0 0 0 0 0 0 0 0\n2 0 0 0 0 0 0 0 0\n1 1.5 0.3 20 0.4\n')
+    freqs, _, _, _ = read_touchstone(path)
+    assert len(freqs) == 2
+
+
+def test_port_count_from_extension(tmp_path):
+    path = tmp_path / 'x.txt'
+    path.write_text('# GHZ S MA\n2.1 0.5 30\n')
+    with pytest.raises(ValueError):
+        read_touchstone(path)
+    assert read_touchstone(path, n_ports=1)[1].shape == (1, 1, 1)
+
+
+def test_option_defaults():
+    assert parse_option_line('#') == (1e9, 'S', 'MA', 50.0)
+    assert parse_option_line('# khz z db r 25')[0:4] == (1e3, 'Z', 'DB', 25.0)
+    with pytest.raises(ValueError):
+        parse_option_line('# GHZ S XX')
@@ -0,0 +1,73 @@
+'''
+Vectorized touchstone parse and its .npz cache against a line by line parser.
+Files are copied to tmp_path, the cache lands next to them.
+'''
+import shutil
+from pathlib import Path
+import numpy as np
+import pytest
+import READ_S2P
+from READ_S2P import read_touchstone, load_touchstone_data
+
+MEASURED = Path(__file__).resolve().parent.parent / 'S2P_JUNE_12' / 'Port1.s2p'
+
+
+def naive_read(path: Path) -> np.ndarray:
+    '''reference: split every data line in python'''
+    data = []
+    for line in path.read_text().splitlines():
+        line = line.split('!')[0].strip()
+        if line and not line.startswith('#'):
+            data.append([float(x) for x in line.split()])
+    return np.array(data)
+
+
+@pytest.fixture
+def measured(tmp_path):
+    path = tmp_path / MEASURED.name
+    shutil.copy(MEASURED, path)
+    return path
+
+
+def test_measured_file_matches_reference(measured):
+    freqs, s, z0, parameter = read_touchstone(measured)
+    ref = naive_read(measured)
+    np.testing.assert_allclose(freqs, ref[:, 0])
+    #2-port column order is N11 N21 N12 N22
+    np.testing.assert_allclose(s[:, 0, 0], ref[:, 1] + 1j * ref[:, 2])
+    np.testing.assert_allclose(s[:, 1, 0], ref[:, 3] + 1j * ref[:, 4])
+    np.testing.assert_allclose(s[:, 0, 1], ref[:, 5] + 1j * ref[:, 6])
+    assert (z0, parameter) == (50.0, 'S')
+
+
+def test_line_counts(measured):
+    option, values, counts = load_touchstone_data(measured)
+    ref = naive_read(measured)
+    assert option.startswith('#')
+    assert len(counts) == len(ref) and (counts == ref.shape[1]).all()
+    np.testing.assert_array_equal(values, ref.ravel())
+
+
+def test_npz_cache_is_reused(measured, monkeypatch):
+    first = load_touchstone_data(measured)
+    assert measured.with_name(measured.name + '.npz').exists()
+    READ_S2P._PARSED.clear()
+    #a second load must come from the cache, not the parser
+    monkeypatch.setattr(READ_S2P, '_parse_touchstone', lambda raw: pytest.fail('parsed again'))
+    second = load_touchstone_data(measured)
+    np.testing.assert_array_equal(second[1], first[1])
+
+
+def test_changed_file_is_parsed_again(measured):
+    load_touchstone_data(measured)
+    with open(measured, 'a') as f:
+        f.write('2.2e9 0 0 0 0 0 0 0 0\n')
+    _, values, counts = load_touchstone_data(measured)
+    assert len(counts) == len(naive_read(measured))
+
+
+def test_non_numeric_value_raises(tmp_path):
+    path = tmp_path / 'bad.s1p'
+    path.write_text('# GHZ S MA\n2.1 0.5 abc\n')
+    with pytest.raises(ValueError):
+        read_touchstone(path)